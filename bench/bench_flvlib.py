@@ -0,0 +1,282 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from flvlib import tags, astypes, generate
+from flvlib.helpers import OrderedAttrDict
+
+"""
+Benchmarks for the most common operations, run on synthetic files of
+several sizes.
+
+Every benchmark runs in a separate process, so that its peak memory usage
+can be measured. Throughput is given in megabytes and items per second,
+where items are tags, or AMF values for the AMF benchmarks.
+"""
+
+# File sizes in megabytes
+DEFAULT_SIZES = (1, 8, 32)
+
+# Keyframes in the onMetaData used for the AMF benchmarks, per megabyte of
+# the file size
+KEYFRAMES_PER_MB = 5000
+
+# The bitrates of the synthetic files, in bits per second
+VIDEO_BITRATE = 1000000
+AUDIO_BITRATE = 128000
+
+
+def write_synthetic_flv(path, size):
+    """
+    Write an FLV file of about size bytes.
+    """
+    # The duration that gives the requested size, in milliseconds
+    duration = size * 8 * 1000 // (VIDEO_BITRATE + AUDIO_BITRATE)
+    generate.generate_file(path, duration=duration,
+                           video_bitrate=VIDEO_BITRATE,
+                           audio_bitrate=AUDIO_BITRATE)
+
+
+def make_metadata(keyframes):
+    metadata = astypes.ECMAArray()
+    metadata['duration'] = keyframes * 2.0
+    metadata['metadatacreator'] = 'flvlib benchmarks'
+    metadata['keyframes'] = astypes.FLVObject()
+    metadata['keyframes']['times'] = [i * 2.0 for i in xrange(keyframes)]
+    metadata['keyframes']['filepositions'] = [i * 65536.0
+                                              for i in xrange(keyframes)]
+    return metadata
+
+
+def count_values(value):
+    if isinstance(value, list):
+        return 1 + sum([count_values(v) for v in value])
+    if isinstance(value, (dict, OrderedAttrDict)):
+        return 1 + sum([count_values(v) for v in value.itervalues()])
+    return 1
+
+
+# Each benchmark gets the path of a synthetic file and a directory for its
+# output, and returns a function running it, which returns the number of
+# items processed, and the number of bytes processed.
+
+def bench_iter_tags(path, workdir):
+    f = open(path, 'rb')
+
+    def run():
+        f.seek(0)
+        count = 0
+        for tag in tags.FLV(f).iter_tags():
+            count += 1
+        return count
+
+    return run, os.path.getsize(path)
+
+
+def bench_read_tags(path, workdir):
+    # Keeps all the tags, the memory used shows the per tag footprint
+    f = open(path, 'rb')
+
+    def run():
+        f.seek(0)
+        flv = tags.FLV(f)
+        flv.read_tags()
+        return len(flv.tags)
+
+    return run, os.path.getsize(path)
+
+
+def bench_amf_decode(path, workdir):
+    keyframes = os.path.getsize(path) // (1024 * 1024) * KEYFRAMES_PER_MB
+    metadata = make_metadata(max(keyframes, KEYFRAMES_PER_MB))
+    blob = astypes.make_script_data_value(metadata)
+    count = count_values(metadata)
+
+    def run():
+        astypes.unpack_script_data_value(blob)
+        return count
+
+    return run, len(blob)
+
+
+def bench_amf_encode(path, workdir):
+    keyframes = os.path.getsize(path) // (1024 * 1024) * KEYFRAMES_PER_MB
+    metadata = make_metadata(max(keyframes, KEYFRAMES_PER_MB))
+    size = len(astypes.make_script_data_value(metadata))
+    count = count_values(metadata)
+
+    def run():
+        astypes.make_script_data_value(metadata)
+        return count
+
+    return run, size
+
+
+def count_tags(path):
+    f = open(path, 'rb')
+    try:
+        return len(tags.FLV(f).read_table())
+    finally:
+        f.close()
+
+
+def bench_index(path, workdir):
+    from flvlib.scripts.index_flv import index_file
+    outpath = os.path.join(workdir, 'indexed.flv')
+    count = count_tags(path)
+
+    def run():
+        if not index_file(path, outpath):
+            raise RuntimeError("Indexing `%s' failed" % path)
+        return count
+
+    return run, os.path.getsize(path)
+
+
+def bench_cut(path, workdir):
+    from flvlib.scripts.cut_flv import cut_file
+    outpath = os.path.join(workdir, 'cut.flv')
+    f = open(path, 'rb')
+    try:
+        duration = tags.FLV(f).get_last_timestamp()
+    finally:
+        f.close()
+    count = count_tags(path)
+
+    def run():
+        # Cut out the middle half, reading the file up to its end time
+        if not cut_file(path, outpath, duration // 4, duration * 3 // 4):
+            raise RuntimeError("Cutting `%s' failed" % path)
+        return count * 3 // 4
+
+    return run, os.path.getsize(path) * 3 // 4
+
+
+def bench_retimestamp(path, workdir):
+    from flvlib.scripts.retimestamp_flv import retimestamp_file
+    outpath = os.path.join(workdir, 'retimestamped.flv')
+    count = count_tags(path)
+
+    def run():
+        if not retimestamp_file(path, outpath):
+            raise RuntimeError("Retimestamping `%s' failed" % path)
+        return count
+
+    return run, os.path.getsize(path)
+
+
+benchmarks = [
+    ('iter_tags', bench_iter_tags),
+    ('read_tags', bench_read_tags),
+    ('amf_decode', bench_amf_decode),
+    ('amf_encode', bench_amf_encode),
+    ('index', bench_index),
+    ('cut', bench_cut),
+    ('retimestamp', bench_retimestamp),
+]
+
+
+def get_max_rss():
+    # Peak memory usage of the process, in kilobytes, or None if it can't
+    # be measured
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes instead of kilobytes
+        max_rss //= 1024
+    return max_rss
+
+
+def run_benchmark(name, path, workdir):
+    """
+    Run a benchmark in this process, returning the time it took, the number
+    of bytes and items processed and the peak memory usage in kilobytes,
+    before and after running it.
+    """
+    setup = dict(benchmarks)[name]
+    run, size = setup(path, workdir)
+    base_rss = get_max_rss()
+    start = time.time()
+    count = run()
+    elapsed = time.time() - start
+    return elapsed, size, count, base_rss, get_max_rss()
+
+
+def run_benchmark_process(name, path, workdir):
+    """
+    Run a benchmark in a new process.
+    """
+    lib = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'lib')
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([lib] +
+                                        filter(None, [env.get('PYTHONPATH')]))
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                name, path, workdir],
+                               stdout=subprocess.PIPE, env=env)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise RuntimeError("Benchmark %s failed on `%s'" % (name, path))
+    elapsed, size, count, base_rss, max_rss = output.split()
+    if max_rss == 'None':
+        base_rss = max_rss = None
+    else:
+        base_rss, max_rss = int(base_rss), int(max_rss)
+    return float(elapsed), int(size), int(count), base_rss, max_rss
+
+
+def format_memory(kilobytes):
+    if kilobytes is None:
+        return '-'
+    return "%.1f" % (kilobytes / 1024.0)
+
+
+def main(sizes=DEFAULT_SIZES, repeat=3, names=None, out=sys.stdout):
+    """
+    Run the benchmarks on files of the given sizes, in megabytes, taking
+    the best time out of repeat runs. The names of the benchmarks to run
+    can be given in names, by default all of them are run.
+    """
+    if names is None:
+        names = [name for name, setup in benchmarks]
+
+    workdir = tempfile.mkdtemp(prefix='flvlib-bench')
+    try:
+        out.write("%-12s %6s %9s %10s %12s %9s %9s\n" %
+                  ('benchmark', 'MB', 'seconds', 'MB/s', 'items/s',
+                   'peak MB', 'used MB'))
+        for size in sizes:
+            path = os.path.join(workdir, 'synthetic-%d.flv' % size)
+            write_synthetic_flv(path, size * 1024 * 1024)
+            for name in names:
+                results = [run_benchmark_process(name, path, workdir)
+                           for _ in range(repeat)]
+                elapsed, nbytes, count, base_rss, max_rss = min(results)
+                elapsed = max(elapsed, 1e-6)
+                if max_rss is None:
+                    used = None
+                else:
+                    used = max_rss - base_rss
+                out.write("%-12s %6d %9.3f %10.2f %12.0f %9s %9s\n" %
+                          (name, size, elapsed,
+                           nbytes / elapsed / (1024 * 1024), count / elapsed,
+                           format_memory(max_rss), format_memory(used)))
+                out.flush()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    logging.getLogger('flvlib').setLevel(logging.ERROR)
+    if len(sys.argv) == 4:
+        # Running a single benchmark for the parent process
+        print "%f %d %d %s %s" % run_benchmark(*sys.argv[1:])
+    else:
+        main()
@@ -1,15 +1,28 @@
 import os
+import struct
 import calendar
 import datetime
 import logging
 
 from primitives import *
+from primitives import double_struct, ui32_struct, ui16_struct
 from constants import *
 from helpers import OrderedAttrDict, utc
 
 
 """
 The AS types and their FLV representations.
+
+The get_* functions read values from file-like objects. The unpack_*
+functions decode them from a string or buffer at a given offset, returning
+the value together with the offset just past it. They raise EndOfFile if
+the value does not fit in the buffer.
+
+The make_* functions return the encoded values as strings. The write_*
+functions pass the encoded value in pieces to a write function, like the
+extend method of a bytearray or the write method of a file, so that
+nested values get encoded in one go, without building a string for every
+one of them.
 """
 
 log = logging.getLogger('flvlib.astypes')
@@ -23,15 +36,29 @@ class MalformedFLV(Exception):
 def get_number(f, max_offset=None):
     return get_double(f)
 
+def unpack_number(buf, offset=0, max_offset=None):
+    # The most common value, skip unpack_double's extra call
+    try:
+        return double_struct.unpack_from(buf, offset)[0], offset + 8
+    except struct.error:
+        raise EndOfFile
+
 def make_number(num):
     return make_double(num)
 
+def write_number(write, num):
+    write(double_struct.pack(num))
+
 
 # Boolean
 def get_boolean(f, max_offset=None):
     value = get_ui8(f)
     return bool(value)
 
+def unpack_boolean(buf, offset=0, max_offset=None):
+    value, offset = unpack_ui8(buf, offset)
+    return bool(value), offset
+
 def make_boolean(value):
     return make_ui8((value and 1) or 0)
 
@@ -44,6 +71,13 @@ def get_string(f, max_offset=None):
     ret = f.read(length)
     return ret
 
+def unpack_string(buf, offset=0, max_offset=None):
+    length, offset = unpack_ui16(buf, offset)
+    end = offset + length
+    if end > len(buf):
+        raise EndOfFile
+    return buf[offset:end], end
+
 def make_string(string):
     if isinstance(string, unicode):
         # We need a blob, not unicode. Arbitrarily choose UTF-8
@@ -51,6 +85,12 @@ def make_string(string):
     length = make_ui16(len(string))
     return length + string
 
+def write_string(write, string):
+    if isinstance(string, unicode):
+        string = string.encode('UTF-8')
+    write(ui16_struct.pack(len(string)))
+    write(string)
+
 
 # Longstring
 def get_longstring(f, max_offset=None):
@@ -60,6 +100,13 @@ def get_longstring(f, max_offset=None):
     ret = f.read(length)
     return ret
 
+def unpack_longstring(buf, offset=0, max_offset=None):
+    length, offset = unpack_ui32(buf, offset)
+    end = offset + length
+    if end > len(buf):
+        raise EndOfFile
+    return buf[offset:end], end
+
 def make_longstring(string):
     if isinstance(string, unicode):
         # We need a blob, not unicode. Arbitrarily choose UTF-8
@@ -73,6 +120,10 @@ class ECMAArray(OrderedAttrDict):
     pass
 
 
+# The end of an ECMA array or object: an empty name and the end type
+OBJECT_END_MARKER = '\x00\x00\x09'
+
+
 def get_ecma_array(f, max_offset=None):
     length = get_ui32(f)
     log.debug("The ECMA array has approximately %d elements", length)
@@ -83,7 +134,6 @@ def get_ecma_array(f, max_offset=None):
             break
         marker = get_ui24(f)
         if marker == 9:
-            log.debug("Marker!")
             break
         else:
             f.seek(-3, os.SEEK_CUR)
@@ -91,12 +141,32 @@ def get_ecma_array(f, max_offset=None):
         array[name] = value
     return array
 
+def unpack_ecma_array(buf, offset=0, max_offset=None):
+    # The approximate length is not needed
+    offset += 4
+    if offset > len(buf):
+        raise EndOfFile
+    array = ECMAArray()
+    while True:
+        if max_offset and offset == max_offset:
+            log.debug("Prematurely terminating reading an ECMA array")
+            break
+        if buf[offset:offset + 3] == OBJECT_END_MARKER:
+            offset += 3
+            break
+        (name, value), offset = unpack_script_data_variable(buf, offset,
+                                                            max_offset)
+        array[name] = value
+    return array, offset
+
 def make_ecma_array(d):
-    length = make_ui32(len(d))
-    rest = ''.join([make_script_data_variable(name, value)
-                    for name, value in d.iteritems()])
-    marker = make_ui24(9)
-    return length + rest + marker
+    return encode(write_ecma_array, d)
+
+def write_ecma_array(write, d):
+    write(ui32_struct.pack(len(d)))
+    for name, value in d.iteritems():
+        write_script_data_variable(write, name, value)
+    write(OBJECT_END_MARKER)
 
 
 # Strict Array
@@ -107,10 +177,39 @@ def get_strict_array(f, max_offset=None):
                 for _ in xrange(length)]
     return elements
 
+def is_number_array(buf, offset, length):
+    # Whether the length elements starting at offset are all numbers, that
+    # is a type byte followed by a double, checking every ninth byte at once
+    end = offset + 9 * length
+    return (length > 0 and end <= len(buf) and
+            buf[offset:end:9] == chr(VALUE_TYPE_NUMBER) * length)
+
+def unpack_number_array(buf, offset, length):
+    # Decode the elements of an all numbers array in bulk, by dropping the
+    # type bytes and unpacking the doubles with a single call
+    end = offset + 9 * length
+    doubles = bytearray(buf[offset:end])
+    del doubles[::9]
+    return list(struct.unpack('>%dd' % length, str(doubles))), end
+
+def unpack_strict_array(buf, offset=0, max_offset=None):
+    length, offset = unpack_ui32(buf, offset)
+    if is_number_array(buf, offset, length):
+        return unpack_number_array(buf, offset, length)
+    elements = []
+    append = elements.append
+    for _ in xrange(length):
+        value, offset = unpack_script_data_value(buf, offset, max_offset)
+        append(value)
+    return elements, offset
+
 def make_strict_array(l):
-    ret = make_ui32(len(l))
-    rest = ''.join([make_script_data_value(value) for value in l])
-    return ret + rest
+    return encode(write_strict_array, l)
+
+def write_strict_array(write, l):
+    write(ui32_struct.pack(len(l)))
+    for value in l:
+        write_script_data_value(write, value)
 
 
 # Date
@@ -127,6 +226,12 @@ def get_date(f, max_offset=None):
     _ignored = get_si16(f)
     return datetime.datetime.fromtimestamp(timestamp, utc)
 
+def unpack_date(buf, offset=0, max_offset=None):
+    timestamp, offset = unpack_double(buf, offset)
+    # The time zone offset gets ignored, see get_date
+    _ignored, offset = unpack_si16(buf, offset)
+    return datetime.datetime.fromtimestamp(timestamp / 1000.0, utc), offset
+
 def make_date(date):
     if date.tzinfo:
         utc_date = date.astimezone(utc)
@@ -142,6 +247,9 @@ def make_date(date):
 def get_null(f, max_offset=None):
     return None
 
+def unpack_null(buf, offset=0, max_offset=None):
+    return None, offset
+
 def make_null(none):
     return ''
 
@@ -159,7 +267,6 @@ def get_object(f, max_offset=None):
             break
         marker = get_ui24(f)
         if marker == 9:
-            log.debug("Marker!")
             break
         else:
             f.seek(-3, os.SEEK_CUR)
@@ -167,7 +274,24 @@ def get_object(f, max_offset=None):
         setattr(ret, name, value)
     return ret
 
+def unpack_object(buf, offset=0, max_offset=None):
+    ret = FLVObject()
+    while True:
+        if max_offset and offset == max_offset:
+            log.debug("Prematurely terminating reading an object")
+            break
+        if buf[offset:offset + 3] == OBJECT_END_MARKER:
+            offset += 3
+            break
+        # Like get_object, does not pass max_offset to the properties
+        (name, value), offset = unpack_script_data_variable(buf, offset)
+        setattr(ret, name, value)
+    return ret, offset
+
 def make_object(obj):
+    return encode(write_object, obj)
+
+def write_object(write, obj):
     # If the object is iterable, serialize keys/values. If not, fall
     # back on iterating over __dict__.
     # This makes sure that make_object(get_object(StringIO(blob))) == blob
@@ -175,10 +299,9 @@ def make_object(obj):
         iterator = obj.iteritems()
     except AttributeError:
         iterator = obj.__dict__.iteritems()
-    ret = ''.join([make_script_data_variable(name, value)
-                   for name, value in iterator])
-    marker = make_ui24(9)
-    return ret + marker
+    for name, value in iterator:
+        write_script_data_variable(write, name, value)
+    write(OBJECT_END_MARKER)
 
 
 # MovieClip
@@ -197,6 +320,10 @@ def get_movieclip(f, max_offset=None):
     ret = get_string(f)
     return MovieClip(ret)
 
+def unpack_movieclip(buf, offset=0, max_offset=None):
+    ret, offset = unpack_string(buf, offset)
+    return MovieClip(ret), offset
+
 def make_movieclip(clip):
     return make_string(clip.path)
 
@@ -213,6 +340,9 @@ class Undefined(object):
 def get_undefined(f, max_offset=None):
     return Undefined()
 
+def unpack_undefined(buf, offset=0, max_offset=None):
+    return Undefined(), offset
+
 def make_undefined(undefined):
     return ''
 
@@ -233,6 +363,10 @@ def get_reference(f, max_offset=None):
     ret = get_ui16(f)
     return Reference(ret)
 
+def unpack_reference(buf, offset=0, max_offset=None):
+    ret, offset = unpack_ui16(buf, offset)
+    return Reference(ret), offset
+
 def make_reference(reference):
     return make_ui16(reference.ref)
 
@@ -252,6 +386,21 @@ as_type_to_getter_and_maker = {
     VALUE_TYPE_LONGSTRING: (get_longstring, make_longstring)
 }
 
+as_type_to_unpacker = {
+    VALUE_TYPE_NUMBER: unpack_number,
+    VALUE_TYPE_BOOLEAN: unpack_boolean,
+    VALUE_TYPE_STRING: unpack_string,
+    VALUE_TYPE_OBJECT: unpack_object,
+    VALUE_TYPE_MOVIECLIP: unpack_movieclip,
+    VALUE_TYPE_NULL: unpack_null,
+    VALUE_TYPE_UNDEFINED: unpack_undefined,
+    VALUE_TYPE_REFERENCE: unpack_reference,
+    VALUE_TYPE_ECMA_ARRAY: unpack_ecma_array,
+    VALUE_TYPE_STRICT_ARRAY: unpack_strict_array,
+    VALUE_TYPE_DATE: unpack_date,
+    VALUE_TYPE_LONGSTRING: unpack_longstring
+}
+
 type_to_as_type = {
     bool: VALUE_TYPE_BOOLEAN,
     int: VALUE_TYPE_NUMBER,
@@ -274,37 +423,276 @@ type_to_as_type = {
 # SCRIPTDATAVARIABLE
 def get_script_data_variable(f, max_offset=None):
     name = get_string(f)
-    log.debug("The name is %s", name)
     value = get_script_data_value(f, max_offset=max_offset)
-    log.debug("The value is %r", value)
     return (name, value)
 
+def unpack_script_data_variable(buf, offset=0, max_offset=None):
+    name, offset = unpack_string(buf, offset)
+    value, offset = unpack_script_data_value(buf, offset, max_offset)
+    return (name, value), offset
+
 def make_script_data_variable(name, value):
-    log.debug("The name is %s", name)
-    log.debug("The value is %r", value)
-    ret = make_string(name) + make_script_data_value(value)
-    return ret
+    buf = bytearray()
+    write_script_data_variable(buf.extend, name, value)
+    return str(buf)
+
+def write_script_data_variable(write, name, value):
+    write_string(write, name)
+    write_script_data_value(write, value)
 
 
 # SCRIPTDATAVALUE
 def get_script_data_value(f, max_offset=None):
     value_type = get_ui8(f)
-    log.debug("The value type is %r", value_type)
     try:
         get_value = as_type_to_getter_and_maker[value_type][0]
     except KeyError:
         raise MalformedFLV("Invalid script data value type: %d", value_type)
-    log.debug("The getter function is %r", get_value)
     value = get_value(f, max_offset=max_offset)
     return value
 
+def unpack_script_data_value(buf, offset=0, max_offset=None):
+    try:
+        value_type = ord(buf[offset])
+    except IndexError:
+        raise EndOfFile
+    try:
+        unpack_value = as_type_to_unpacker[value_type]
+    except KeyError:
+        raise MalformedFLV("Invalid script data value type: %d", value_type)
+    return unpack_value(buf, offset + 1, max_offset)
+
 def make_script_data_value(value):
+    return encode(write_script_data_value, value)
+
+def write_script_data_value(write, value):
+    if value.__class__ is EncodedValue:
+        write(value.data)
+        return
     value_type = type_to_as_type.get(value.__class__, VALUE_TYPE_OBJECT)
-    log.debug("The value type is %r", value_type)
     #  KeyError can't happen here, because we always fall back on
     #  VALUE_TYPE_OBJECT when determining value_type
-    make_value = as_type_to_getter_and_maker[value_type][1]
-    log.debug("The maker function is %r", make_value)
-    type_tag = make_ui8(value_type)
-    ret = make_value(value)
-    return type_tag + ret
+    write(value_type_markers[value_type])
+    as_type_to_writer[value_type](write, value)
+
+
+def encode(write_value, value):
+    # Encode the value with the write function into a single buffer
+    buf = bytearray()
+    write_value(buf.extend, value)
+    return str(buf)
+
+
+def make_writer(make_value):
+    # A write function for the types that don't need a dedicated one
+    def write_value(write, value):
+        write(make_value(value))
+    return write_value
+
+
+as_type_to_writer = {
+    VALUE_TYPE_NUMBER: write_number,
+    VALUE_TYPE_BOOLEAN: make_writer(make_boolean),
+    VALUE_TYPE_STRING: write_string,
+    VALUE_TYPE_OBJECT: write_object,
+    VALUE_TYPE_MOVIECLIP: make_writer(make_movieclip),
+    VALUE_TYPE_NULL: make_writer(make_null),
+    VALUE_TYPE_UNDEFINED: make_writer(make_undefined),
+    VALUE_TYPE_REFERENCE: make_writer(make_reference),
+    VALUE_TYPE_ECMA_ARRAY: write_ecma_array,
+    VALUE_TYPE_STRICT_ARRAY: write_strict_array,
+    VALUE_TYPE_DATE: make_writer(make_date),
+    VALUE_TYPE_LONGSTRING: make_writer(make_longstring)
+}
+
+# The type markers, indexed by the value type
+value_type_markers = [chr(value_type) for value_type in range(256)]
+
+
+class EncodedValue(object):
+    """
+    A value that gets encoded once, when the EncodedValue is created, and
+    is then written out as it is wherever it appears. Useful for values
+    that have to be encoded several times without changing.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, value):
+        self.data = make_script_data_value(value)
+
+    def __repr__(self):
+        return "<EncodedValue of %d bytes>" % len(self.data)
+
+
+# Lazy decoding
+#
+# The skip_* functions return the offset just past a value without decoding
+# it. The lazy ECMA arrays and objects only skim their content when created,
+# remembering where the value of every key starts, and decode the values
+# when they are accessed.
+
+def make_fixed_size_skipper(size):
+    def skip_value(buf, offset=0, max_offset=None):
+        offset += size
+        if offset > len(buf):
+            raise EndOfFile
+        return offset
+    return skip_value
+
+def skip_string(buf, offset=0, max_offset=None):
+    length, offset = unpack_ui16(buf, offset)
+    offset += length
+    if offset > len(buf):
+        raise EndOfFile
+    return offset
+
+def skip_longstring(buf, offset=0, max_offset=None):
+    length, offset = unpack_ui32(buf, offset)
+    offset += length
+    if offset > len(buf):
+        raise EndOfFile
+    return offset
+
+def skip_ecma_array(buf, offset=0, max_offset=None):
+    offset += 4
+    if offset > len(buf):
+        raise EndOfFile
+    return skim_properties(buf, offset, max_offset, max_offset)
+
+def skip_object(buf, offset=0, max_offset=None):
+    return skim_properties(buf, offset, max_offset, None)
+
+def skip_strict_array(buf, offset=0, max_offset=None):
+    length, offset = unpack_ui32(buf, offset)
+    if is_number_array(buf, offset, length):
+        return offset + 9 * length
+    for _ in xrange(length):
+        offset = skip_script_data_value(buf, offset, max_offset)
+    return offset
+
+def skip_script_data_value(buf, offset=0, max_offset=None):
+    try:
+        value_type = ord(buf[offset])
+    except IndexError:
+        raise EndOfFile
+    try:
+        skip_value = as_type_to_skipper[value_type]
+    except KeyError:
+        raise MalformedFLV("Invalid script data value type: %d", value_type)
+    return skip_value(buf, offset + 1, max_offset)
+
+
+as_type_to_skipper = {
+    VALUE_TYPE_NUMBER: make_fixed_size_skipper(8),
+    VALUE_TYPE_BOOLEAN: make_fixed_size_skipper(1),
+    VALUE_TYPE_STRING: skip_string,
+    VALUE_TYPE_OBJECT: skip_object,
+    VALUE_TYPE_MOVIECLIP: skip_string,
+    VALUE_TYPE_NULL: make_fixed_size_skipper(0),
+    VALUE_TYPE_UNDEFINED: make_fixed_size_skipper(0),
+    VALUE_TYPE_REFERENCE: make_fixed_size_skipper(2),
+    VALUE_TYPE_ECMA_ARRAY: skip_ecma_array,
+    VALUE_TYPE_STRICT_ARRAY: skip_strict_array,
+    VALUE_TYPE_DATE: make_fixed_size_skipper(10),
+    VALUE_TYPE_LONGSTRING: skip_longstring
+}
+
+
+def skim_properties(buf, offset, max_offset, value_max_offset,
+                    defer_value=None):
+    # Skip the properties of an ECMA array or an object, returning the
+    # offset past its end. If defer_value is given, it gets called with the
+    # name and the offset of the value of every property.
+    while True:
+        if max_offset and offset == max_offset:
+            log.debug("Prematurely terminating reading an ECMA array or "
+                      "object")
+            break
+        if buf[offset:offset + 3] == OBJECT_END_MARKER:
+            offset += 3
+            break
+        name, offset = unpack_string(buf, offset)
+        if defer_value is not None:
+            defer_value(name, offset)
+        offset = skip_script_data_value(buf, offset, value_max_offset)
+    return offset
+
+
+class LazyProperties(object):
+    """
+    Decoding of the values of an ECMA array or object when they are first
+    accessed. Mixed into ECMAArray and FLVObject, before them.
+
+    Setting or deleting a value that has not been decoded yet just forgets
+    where it was, so it never gets decoded.
+    """
+
+    def __init__(self, buf, value_max_offset):
+        OrderedAttrDict.__init__(self)
+        self.__dict__['_buf_priv_'] = buf
+        self.__dict__['_max_offset_priv_'] = value_max_offset
+
+    def skim(self, offset, max_offset):
+        """
+        Find the properties starting at offset, returning the offset past
+        them.
+        """
+        return skim_properties(self._buf_priv_, offset, max_offset,
+                               self._max_offset_priv_, self.defer_value)
+
+    def load_value(self, key, offset):
+        value, _ = unpack_lazy_script_data_value(self._buf_priv_, offset,
+                                                 self._max_offset_priv_)
+        return value
+
+
+class LazyECMAArray(LazyProperties, ECMAArray):
+    pass
+
+
+class LazyFLVObject(LazyProperties, FLVObject):
+    pass
+
+
+type_to_as_type[LazyECMAArray] = VALUE_TYPE_ECMA_ARRAY
+
+
+def unpack_lazy_ecma_array(buf, offset=0, max_offset=None):
+    offset += 4
+    if offset > len(buf):
+        raise EndOfFile
+    array = LazyECMAArray(buf, max_offset)
+    return array, array.skim(offset, max_offset)
+
+def unpack_lazy_object(buf, offset=0, max_offset=None):
+    # Like unpack_object, does not pass max_offset to the properties
+    ret = LazyFLVObject(buf, None)
+    return ret, ret.skim(offset, max_offset)
+
+def unpack_lazy_script_data_value(buf, offset=0, max_offset=None):
+    """
+    Like unpack_script_data_value, but return ECMA arrays and objects that
+    decode their values only when they are accessed. The buffer is kept
+    until then, so it must not change.
+    """
+    try:
+        value_type = ord(buf[offset])
+    except IndexError:
+        raise EndOfFile
+    try:
+        unpack_value = as_type_to_lazy_unpacker[value_type]
+    except KeyError:
+        return unpack_script_data_value(buf, offset, max_offset)
+    return unpack_value(buf, offset + 1, max_offset)
+
+as_type_to_lazy_unpacker = {
+    VALUE_TYPE_OBJECT: unpack_lazy_object,
+    VALUE_TYPE_ECMA_ARRAY: unpack_lazy_ecma_array
+}
+
+
+def unpack_lazy_script_data_variable(buf, offset=0, max_offset=None):
+    name, offset = unpack_string(buf, offset)
+    value, offset = unpack_lazy_script_data_value(buf, offset, max_offset)
+    return (name, value), offset
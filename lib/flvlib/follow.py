@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+
+from primitives import get_ui24, EndOfFile
+from astypes import FLVObject
+from tags import FLV, VideoTag, AudioTag, SCAN_FULL, TAG_HEADER_SIZE
+
+"""
+Following FLV files that are still being written to.
+"""
+
+log = logging.getLogger('flvlib.follow')
+
+# FLV header (9) + PreviousTagSize0 (4)
+MIN_HEADER_SIZE = 13
+
+
+class FollowingFLV(FLV):
+    """
+    An FLV file that is still growing, for example because it's being
+    recorded.
+
+    follow_tags yields tags as soon as they are completely written and
+    waits for more at the end of the file. The offset of the next tag to
+    parse is kept in next_offset, so following can be stopped and resumed
+    without re-reading anything. The keyframes (in the same format as
+    written by index-flv) and the last media timestamp are kept up to date
+    as tags are parsed. Like in index-flv, files without video get every
+    SEEKPOINT_DENSITY-th audio tag as a seekpoint.
+
+    Waiting is done by polling the file size every poll_interval seconds.
+    Subclasses can override wait to use a notification mechanism instead.
+    """
+
+    SEEKPOINT_DENSITY = 10
+
+    def __init__(self, f, poll_interval=1.0, next_offset=None,
+                 scan_level=SCAN_FULL, policy=None):
+        FLV.__init__(self, f, scan_level, policy)
+        self.poll_interval = poll_interval
+        self.next_offset = next_offset
+        self.keyframes = FLVObject()
+        self.keyframes.filepositions = []
+        self.keyframes.times = []
+        self.last_timestamp = None
+        self.audio_tag_number = 0
+
+    def get_duration(self):
+        if self.last_timestamp is None:
+            return None
+        return self.last_timestamp / 1000.0
+
+    def get_file_size(self):
+        return os.fstat(self.f.fileno()).st_size
+
+    def wait(self):
+        time.sleep(self.poll_interval)
+
+    def wait_for_header(self, idle_timeout):
+        idle_since = time.time()
+        while True:
+            if self.get_file_size() >= MIN_HEADER_SIZE:
+                try:
+                    self.parse_header()
+                    return True
+                except EndOfFile:
+                    # The header is bigger than usual
+                    pass
+            if (idle_timeout is not None and
+                time.time() - idle_since >= idle_timeout):
+                return False
+            self.wait()
+
+    def get_complete_tag_size(self, available):
+        """
+        Return the size of the tag at next_offset, including its header and
+        PreviousTagSize, or None if it's not completely written yet.
+        """
+        if available < TAG_HEADER_SIZE:
+            return None
+        self.f.seek(self.next_offset + 1)
+        size = TAG_HEADER_SIZE + get_ui24(self.f) + 4
+        if available < size:
+            return None
+        return size
+
+    def follow_tags(self, idle_timeout=None):
+        """
+        Iterate over the tags of the file, waiting for more to be written
+        after reaching the last complete one.
+
+        Stops after the file did not grow for idle_timeout seconds, or never
+        if it's None. Can be called again to pick up where it stopped.
+        """
+        if self.next_offset is None:
+            if not self.wait_for_header(idle_timeout):
+                return
+            self.next_offset = self.f.tell()
+        elif self.version is None:
+            # Resuming from a given offset, still read the file flags
+            if not self.wait_for_header(idle_timeout):
+                return
+
+        f = self.f
+        idle_since = time.time()
+        while True:
+            available = self.get_file_size() - self.next_offset
+            if self.get_complete_tag_size(available) is not None:
+                tag = self.read_tag_at(self.next_offset)
+                self.next_offset = f.tell()
+                self.update_state(tag)
+                yield tag
+                idle_since = time.time()
+                continue
+
+            if (idle_timeout is not None and
+                time.time() - idle_since >= idle_timeout):
+                log.debug("No complete tag at offset 0x%08X after %s seconds",
+                          self.next_offset, idle_timeout)
+                return
+            self.wait()
+
+    def update_state(self, tag):
+        if isinstance(tag, (AudioTag, VideoTag)):
+            if (self.last_timestamp is None or
+                tag.timestamp > self.last_timestamp):
+                self.last_timestamp = tag.timestamp
+        if isinstance(tag, VideoTag):
+            if not self.is_seekpoint(tag):
+                return
+        elif isinstance(tag, AudioTag) and not self.has_video:
+            self.audio_tag_number += 1
+            if self.audio_tag_number % self.SEEKPOINT_DENSITY != 0:
+                return
+        else:
+            return
+        self.keyframes.filepositions.append(tag.offset)
+        self.keyframes.times.append(tag.timestamp / 1000.0)
@@ -0,0 +1,296 @@
+import math
+import random
+import logging
+
+from constants import *
+from primitives import make_ui8
+from astypes import ECMAArray, make_script_data_variable
+from tags import TAG_HEADER_SIZE, create_flv_header, create_flv_tag_chunks
+
+"""
+Generating synthetic FLV files.
+
+The files have the structure of real recordings: an onMetaData tag, the
+AAC and H.264 sequence headers and interleaved audio and video tags with
+keyframes at a fixed interval. The payloads are random bytes, sized to
+follow the chosen bitrates. Timestamp gaps, metadata at the end of the file
+and damaged tags can be added to test how software copes with them.
+"""
+
+log = logging.getLogger('flvlib.generate')
+
+(BITRATE_CONSTANT,
+ BITRATE_SINE,
+ BITRATE_RANDOM) = range(3)
+
+bitrate_shape_to_string = {
+    BITRATE_CONSTANT: 'constant',
+    BITRATE_SINE: 'sine',
+    BITRATE_RANDOM: 'random'
+}
+
+(METADATA_NONE,
+ METADATA_START,
+ METADATA_END,
+ METADATA_BOTH) = range(4)
+
+metadata_to_string = {
+    METADATA_NONE: 'none',
+    METADATA_START: 'start',
+    METADATA_END: 'end',
+    METADATA_BOTH: 'both'
+}
+
+# How many times a keyframe is bigger than an interframe
+KEYFRAME_RATIO = 8
+
+# The period of the sine bitrate shape, in milliseconds
+SINE_PERIOD = 60000
+
+# Audio frame lengths, in samples
+AAC_FRAME_SAMPLES = 1024
+MP3_FRAME_SAMPLES = 1152
+
+# How many tags to serialize at once when writing
+WRITE_BATCH = 256
+
+# The amount of random bytes the payloads are cut from
+RANDOM_BLOCK_SIZE = 65536
+
+# AAC LC, 44.1 kHz, stereo
+AAC_SEQUENCE_HEADER = '\x12\x10'
+
+# An AVCDecoderConfigurationRecord for a 640x480 Main profile stream
+AVC_SEQUENCE_HEADER = ('\x01\x4d\x40\x1e\xff\xe1\x00\x0f'
+                       '\x67\x4d\x40\x1e\x96\x56\x05\x01'
+                       '\xec\x80\x00\x00\x03\x00\x80\x01'
+                       '\x00\x04\x68\xeb\xec\xb2')
+
+sound_format_to_frame_samples = {
+    SOUND_FORMAT_AAC: AAC_FRAME_SAMPLES,
+    SOUND_FORMAT_MP3: MP3_FRAME_SAMPLES
+}
+
+supported_codec_ids = (CODEC_ID_H263, CODEC_ID_VP6, CODEC_ID_H264)
+
+
+class FLVGenerator(object):
+    """
+    A generator of synthetic FLV files.
+
+    Times are in milliseconds and bitrates in bits per second. Gaps are
+    given as (time, length) pairs and make all timestamps from time on
+    larger by length. The first tags with timestamps, after adding the gaps,
+    at or after the times given in corrupt get replaced by random bytes
+    when writing the file. The same seed always gives the
+    same file.
+    """
+
+    def __init__(self, duration=60000, has_audio=True, has_video=True,
+                 sound_format=SOUND_FORMAT_AAC, codec_id=CODEC_ID_H264,
+                 frame_rate=25.0, gop_length=50, video_bitrate=1000000,
+                 audio_bitrate=128000, bitrate_shape=BITRATE_CONSTANT,
+                 gaps=(), metadata=METADATA_START, corrupt=(), seed=0):
+        if sound_format not in sound_format_to_frame_samples:
+            raise ValueError("Unsupported sound format: %d" % sound_format)
+        if codec_id not in supported_codec_ids:
+            raise ValueError("Unsupported codec ID: %d" % codec_id)
+        if frame_rate <= 0 or gop_length < 1:
+            raise ValueError("The frame rate and GOP length have to be "
+                             "positive")
+
+        self.duration = duration
+        self.has_audio = has_audio
+        self.has_video = has_video
+        self.sound_format = sound_format
+        self.codec_id = codec_id
+        self.frame_rate = frame_rate
+        self.gop_length = gop_length
+        self.video_bitrate = video_bitrate
+        self.audio_bitrate = audio_bitrate
+        self.bitrate_shape = bitrate_shape
+        self.gaps = sorted(gaps)
+        self.metadata = metadata
+        self.corrupt = sorted(corrupt)
+        self.seed = seed
+
+        self.random = random.Random(seed)
+        self.random_data = ''.join([chr(self.random.getrandbits(8))
+                                    for _ in xrange(RANDOM_BLOCK_SIZE)])
+
+    def get_metadata(self):
+        metadata = ECMAArray()
+        metadata['duration'] = self.duration / 1000.0
+        if self.has_video:
+            metadata['videocodecid'] = self.codec_id
+            metadata['framerate'] = self.frame_rate
+            metadata['videodatarate'] = self.video_bitrate / 1000.0
+        if self.has_audio:
+            metadata['audiocodecid'] = self.sound_format
+            metadata['audiodatarate'] = self.audio_bitrate / 1000.0
+        metadata['metadatacreator'] = 'flvlib generate-flv'
+        return metadata
+
+    def get_data(self, size):
+        # Return size random bytes
+        while len(self.random_data) < size + RANDOM_BLOCK_SIZE:
+            self.random_data += self.random_data
+        start = self.random.randrange(RANDOM_BLOCK_SIZE)
+        return self.random_data[start:start + size]
+
+    def get_bitrate_factor(self, timestamp):
+        if self.bitrate_shape == BITRATE_SINE:
+            return 1 + 0.5 * math.sin(2 * math.pi * timestamp / SINE_PERIOD)
+        elif self.bitrate_shape == BITRATE_RANDOM:
+            return self.random.uniform(0.5, 1.5)
+        return 1.0
+
+    def get_timestamp(self, timestamp):
+        # Add the gaps that come before the timestamp
+        for time, length in self.gaps:
+            if time > timestamp:
+                break
+            timestamp += length
+        return timestamp
+
+    def iter_audio_tags(self):
+        if self.sound_format == SOUND_FORMAT_AAC:
+            flags = '\xaf'
+            yield (TAG_TYPE_AUDIO, flags + '\x00' + AAC_SEQUENCE_HEADER, 0)
+            flags += '\x01'
+        else:
+            # MP3, 44 kHz, 16 bit, stereo
+            flags = '\x2f'
+
+        frame_length = (sound_format_to_frame_samples[self.sound_format] *
+                        1000.0 / 44100)
+        frame_size = self.audio_bitrate / 8.0 * frame_length / 1000
+        frame = 0
+        while True:
+            timestamp = int(frame * frame_length)
+            if timestamp >= self.duration:
+                break
+            yield (TAG_TYPE_AUDIO, flags + self.get_data(int(frame_size)),
+                   timestamp)
+            frame += 1
+
+    def iter_video_tags(self):
+        keyframe = chr(FRAME_TYPE_KEYFRAME << 4 | self.codec_id)
+        interframe = chr(FRAME_TYPE_INTERFRAME << 4 | self.codec_id)
+        if self.codec_id == CODEC_ID_H264:
+            yield (TAG_TYPE_VIDEO,
+                   keyframe + '\x00\x00\x00\x00' + AVC_SEQUENCE_HEADER, 0)
+            # NAL units, with a zero composition time
+            keyframe += '\x01\x00\x00\x00'
+            interframe += '\x01\x00\x00\x00'
+        elif self.codec_id == CODEC_ID_VP6:
+            # No size adjustment
+            keyframe += '\x00'
+            interframe += '\x00'
+
+        frame_length = 1000.0 / self.frame_rate
+        average_size = self.video_bitrate / 8.0 / self.frame_rate
+        interframe_size = (average_size * self.gop_length /
+                           (KEYFRAME_RATIO + self.gop_length - 1))
+        frame = 0
+        while True:
+            timestamp = int(frame * frame_length)
+            if timestamp >= self.duration:
+                break
+            size = interframe_size * self.get_bitrate_factor(timestamp)
+            if frame % self.gop_length == 0:
+                flags = keyframe
+                size *= KEYFRAME_RATIO
+            else:
+                flags = interframe
+            yield TAG_TYPE_VIDEO, flags + self.get_data(int(size)), timestamp
+            frame += 1
+
+    def iter_tags(self):
+        """
+        Yield the tags of the file as (tag_type, data, timestamp) tuples,
+        in the order they appear in the file.
+        """
+        if self.metadata in (METADATA_START, METADATA_BOTH):
+            yield TAG_TYPE_SCRIPT, self.get_metadata_data(), 0
+
+        streams = []
+        if self.has_video:
+            streams.append(self.iter_video_tags())
+        if self.has_audio:
+            streams.append(self.iter_audio_tags())
+
+        # Merge the streams by timestamp, putting video first on equal ones
+        heads = []
+        for stream in streams[:]:
+            try:
+                heads.append(stream.next())
+            except StopIteration:
+                streams.remove(stream)
+
+        while heads:
+            i = min(range(len(heads)), key=lambda i: (heads[i][2], i))
+            tag_type, data, timestamp = heads[i]
+            yield tag_type, data, self.get_timestamp(timestamp)
+            try:
+                heads[i] = streams[i].next()
+            except StopIteration:
+                del heads[i]
+                del streams[i]
+
+        if self.metadata in (METADATA_END, METADATA_BOTH):
+            # Like some muxers do, with a zero timestamp
+            yield TAG_TYPE_SCRIPT, self.get_metadata_data(), 0
+
+    def get_metadata_data(self):
+        return make_ui8(VALUE_TYPE_STRING) + make_script_data_variable(
+            'onMetaData', self.get_metadata())
+
+    def write(self, f):
+        """
+        Write the file to f, returning the number of bytes written.
+        """
+        f.write(create_flv_header(self.has_audio, self.has_video))
+        written = 13
+
+        corrupt = list(self.corrupt)
+        batch = []
+        for tag in self.iter_tags():
+            tag_type, data, timestamp = tag
+            if (corrupt and timestamp >= corrupt[0] and
+                    tag_type != TAG_TYPE_SCRIPT):
+                while corrupt and timestamp >= corrupt[0]:
+                    del corrupt[0]
+                written += self.write_tags(f, batch)
+                batch = []
+                size = TAG_HEADER_SIZE + len(data) + 4
+                log.debug("Corrupting %d bytes at offset 0x%08X",
+                          size, written)
+                f.write(self.get_data(size))
+                written += size
+                continue
+
+            batch.append(tag)
+            if len(batch) == WRITE_BATCH:
+                written += self.write_tags(f, batch)
+                batch = []
+
+        written += self.write_tags(f, batch)
+        return written
+
+    def write_tags(self, f, tags):
+        chunks = create_flv_tag_chunks(tags)
+        f.writelines(chunks)
+        return sum([len(chunk) for chunk in chunks])
+
+
+def generate_file(path, **kwargs):
+    """
+    Write a synthetic FLV file to path. The keyword arguments are passed
+    to FLVGenerator.
+    """
+    f = open(path, 'wb')
+    try:
+        return FLVGenerator(**kwargs).write(f)
+    finally:
+        f.close()
@@ -1,5 +1,7 @@
 import os
+import sys
 import time
+import signal
 import datetime
 
 from StringIO import StringIO
@@ -31,11 +33,15 @@ class OrderedAttrDict(DictMixin):
     interface.
 
     Values can be transparently accessed and set as keys or as attributes.
+
+    Subclasses can add keys with defer_value and compute their values only
+    when they are first accessed, by overriding load_value.
     """
 
     def __init__(self, dict=None, **kwargs):
         self.__dict__["_order_priv_"] = []
         self.__dict__["_data_priv_"] = {}
+        self.__dict__["_deferred_priv_"] = {}
         if dict is not None:
             self.update(dict)
         if len(kwargs):
@@ -44,20 +50,63 @@ class OrderedAttrDict(DictMixin):
     # Mapping interface
 
     def __setitem__(self, key, value):
-        if key not in self:
+        if key in self._deferred_priv_:
+            del self._deferred_priv_[key]
+        elif key not in self._data_priv_:
             self._order_priv_.append(key)
         self._data_priv_[key] = value
 
     def __getitem__(self, key):
-        return self._data_priv_[key]
+        try:
+            return self._data_priv_[key]
+        except KeyError:
+            token = self._deferred_priv_[key]
+        value = self.load_value(key, token)
+        self._data_priv_[key] = value
+        del self._deferred_priv_[key]
+        return value
 
     def __delitem__(self, key):
-        del self._data_priv_[key]
+        if key in self._deferred_priv_:
+            del self._deferred_priv_[key]
+        else:
+            del self._data_priv_[key]
         self._order_priv_.remove(key)
 
+    def has_key(self, key):
+        return key in self._data_priv_ or key in self._deferred_priv_
+
+    __contains__ = has_key
+
     def keys(self):
         return list(self._order_priv_)
 
+    # Deferred values
+
+    def defer_value(self, key, token):
+        """
+        Add key without computing its value, which gets computed by calling
+        load_value with key and token when it is first accessed. A key that
+        is already there keeps its position and loses its current value.
+        """
+        if key in self._data_priv_:
+            del self._data_priv_[key]
+        elif key not in self._deferred_priv_:
+            self._order_priv_.append(key)
+        self._deferred_priv_[key] = token
+
+    def load_value(self, key, token):
+        """
+        Compute the value of a key added with defer_value.
+        """
+        raise NotImplementedError
+
+    def is_loaded(self, key):
+        """
+        Whether the value of key is there, rather than still deferred.
+        """
+        return key not in self._deferred_priv_
+
     # Attribute interface
 
     def __getattr__(self, name):
@@ -188,7 +237,11 @@ class ASPrettyPrinter(object):
         new_indent = indent + cls.io.tell() - last_pos
         indented = False
         values = list(iter(val))
-        if values:
+        if values and cls.all_numbers(values):
+            # Like printing them one by one, but faster for the long lists
+            # of keyframe times and positions
+            cls.io.write((",\n%s" % (" "*new_indent)).join(map(str, values)))
+        elif values:
             for v in values[:-1]:
                 indented |= cls.pprint_lookup(v, new_indent)
                 cls.io.write(",\n%s" % (" "*new_indent))
@@ -197,6 +250,13 @@ class ASPrettyPrinter(object):
         return (len(values) > 1) | indented
     pprint_list = classmethod(pprint_list)
 
+    def all_numbers(cls, values):
+        for v in values:
+            if not isinstance(v, (int, long, float)):
+                return False
+        return True
+    all_numbers = classmethod(all_numbers)
+
 pformat = ASPrettyPrinter.pformat
 pprint = ASPrettyPrinter.pprint
 
@@ -206,3 +266,66 @@ def force_remove(path):
         os.remove(path)
     except OSError:
         pass
+
+
+def read_file_list(path):
+    """
+    Read a list of NUL-separated file names from the file at path, or from
+    the standard input if path is "-".
+    """
+    if path == '-':
+        data = sys.stdin.read()
+    else:
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    return [name for name in data.split('\0') if name]
+
+
+# How long to wait for a job result at a time, in seconds. Waiting without
+# a timeout can't be interrupted by KeyboardInterrupt.
+JOB_WAIT_TIMEOUT = 1
+
+
+def ignore_sigint():
+    # Run in the pool processes, so that only the parent process handles
+    # Ctrl-C and terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def apply_args(function_and_args):
+    function, args = function_and_args
+    return function(*args)
+
+
+def run_jobs(function, arguments, jobs=1):
+    """
+    Call function with each tuple of arguments and yield the results, in
+    order. With more than one job the calls are made in a pool of that many
+    processes, so the function and its arguments need to be picklable.
+    """
+    if jobs <= 1:
+        for args in arguments:
+            yield function(*args)
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs, ignore_sigint)
+    try:
+        calls = [(function, args) for args in arguments]
+        results = pool.imap(apply_args, calls)
+        while True:
+            try:
+                result = results.next(JOB_WAIT_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                continue
+            except StopIteration:
+                break
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
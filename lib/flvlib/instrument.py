@@ -0,0 +1,169 @@
+import time
+
+import astypes
+import tags
+from constants import value_type_to_string
+
+"""
+Instrumentation hooks for the tag and AMF layers.
+
+A hook gets told about every AMF value decoded and every tag parsed, along
+with how long it took. While no hook is installed nothing gets checked or
+timed: installing one swaps the AMF value getters and unpackers and
+Tag.parse for timed wrappers and removing it puts the originals back.
+
+The times are inclusive, so the time of an ECMA array includes the time of
+its elements and the time of a script tag includes the time of its value.
+The exceptions are lazily decoded ECMA arrays and objects, whose time only
+covers skimming them, with their values reported when they are accessed.
+Strict arrays made only of numbers get decoded in bulk, so their elements
+are not reported one by one.
+"""
+
+# The installed hook and the functions it replaced
+_hook = None
+_original_getters = None
+_original_unpackers = None
+_original_lazy_unpackers = None
+_original_parse = None
+
+
+class Hook(object):
+    """
+    The base hook, doing nothing. Subclasses override the methods they are
+    interested in.
+    """
+
+    def value_decoded(self, value_type, elapsed):
+        pass
+
+    def tag_parsed(self, tag, elapsed):
+        pass
+
+
+class StatsHook(Hook):
+    """
+    Count the AMF values decoded, by value type, and the tags parsed, by tag
+    class name, along with the total time spent on each.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.value_counts = {}
+        self.value_times = {}
+        self.tag_counts = {}
+        self.tag_times = {}
+
+    def value_decoded(self, value_type, elapsed):
+        self.value_counts[value_type] = self.value_counts.get(value_type, 0) + 1
+        self.value_times[value_type] = (self.value_times.get(value_type, 0.0) +
+                                        elapsed)
+
+    def tag_parsed(self, tag, elapsed):
+        name = tag.__class__.__name__
+        self.tag_counts[name] = self.tag_counts.get(name, 0) + 1
+        self.tag_times[name] = self.tag_times.get(name, 0.0) + elapsed
+
+    def report(self):
+        """
+        Return the statistics as a list of lines.
+        """
+        lines = []
+        for value_type, count in sorted(self.value_counts.items()):
+            name = value_type_to_string.get(value_type, str(value_type))
+            lines.append("%-20s %10d %12.6fs" %
+                         (name, count, self.value_times[value_type]))
+        for name, count in sorted(self.tag_counts.items()):
+            lines.append("%-20s %10d %12.6fs" %
+                         (name, count, self.tag_times[name]))
+        return lines
+
+
+def make_timed_getter(hook, value_type, get_value):
+
+    def timed_getter(f, max_offset=None):
+        start = time.time()
+        value = get_value(f, max_offset=max_offset)
+        hook.value_decoded(value_type, time.time() - start)
+        return value
+
+    return timed_getter
+
+
+def make_timed_unpacker(hook, value_type, unpack_value):
+
+    def timed_unpacker(buf, offset=0, max_offset=None):
+        start = time.time()
+        ret = unpack_value(buf, offset, max_offset)
+        hook.value_decoded(value_type, time.time() - start)
+        return ret
+
+    return timed_unpacker
+
+
+def make_timed_parse(hook, parse):
+
+    def timed_parse(tag):
+        start = time.time()
+        parse(tag)
+        hook.tag_parsed(tag, time.time() - start)
+
+    return timed_parse
+
+
+def install_hook(hook):
+    """
+    Install hook, replacing the one that is installed, if any.
+    """
+    global _hook, _original_getters, _original_unpackers, _original_parse
+    global _original_lazy_unpackers
+    remove_hook()
+
+    table = astypes.as_type_to_getter_and_maker
+    _original_getters = table.copy()
+    for value_type, (get_value, make_value) in _original_getters.items():
+        table[value_type] = (make_timed_getter(hook, value_type, get_value),
+                             make_value)
+
+    table = astypes.as_type_to_unpacker
+    _original_unpackers = table.copy()
+    for value_type, unpack_value in _original_unpackers.items():
+        table[value_type] = make_timed_unpacker(hook, value_type, unpack_value)
+
+    table = astypes.as_type_to_lazy_unpacker
+    _original_lazy_unpackers = table.copy()
+    for value_type, unpack_value in _original_lazy_unpackers.items():
+        table[value_type] = make_timed_unpacker(hook, value_type, unpack_value)
+
+    _original_parse = tags.Tag.__dict__['parse']
+    tags.Tag.parse = make_timed_parse(hook, _original_parse)
+
+    _hook = hook
+
+
+def remove_hook():
+    """
+    Remove the installed hook, if there is one, restoring the original
+    functions.
+    """
+    global _hook, _original_getters, _original_unpackers, _original_parse
+    global _original_lazy_unpackers
+    if _hook is None:
+        return
+
+    astypes.as_type_to_getter_and_maker.update(_original_getters)
+    astypes.as_type_to_unpacker.update(_original_unpackers)
+    astypes.as_type_to_lazy_unpacker.update(_original_lazy_unpackers)
+    tags.Tag.parse = _original_parse
+
+    _hook = None
+    _original_getters = None
+    _original_unpackers = None
+    _original_lazy_unpackers = None
+    _original_parse = None
+
+
+def get_hook():
+    return _hook
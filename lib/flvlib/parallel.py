@@ -0,0 +1,143 @@
+import os
+import logging
+
+from primitives import EndOfFile
+from astypes import MalformedFLV
+from tags import FLV, TAG_HEADER_SIZE
+from table import TagTable
+from validation import CountPolicy
+from helpers import run_jobs
+from recovery import find_tag_boundary
+
+"""
+Scanning the tags of a single FLV file in several processes.
+
+The file is split into byte ranges and every range is scanned separately,
+starting from the first tag boundary found in it. The results are then
+joined into one tag table, checking that every range starts where the
+previous one ended.
+
+Failed checks are expected when a range starts at a false boundary, so the
+separate scans do not report them. A range where a check failed is scanned
+again from the end of the previous one, with the caller's policy.
+"""
+
+log = logging.getLogger('flvlib.parallel')
+
+# Ranges smaller than that are not worth a separate process
+MIN_RANGE_SIZE = 4 * 1024 * 1024
+
+
+def scan_range(path, start, end, first_offset=None, policy=None):
+    """
+    Scan the tags starting between start and end.
+
+    The first tag is looked for from start, unless its offset is given in
+    first_offset. Returns the offset of the first tag scanned, the offset
+    right after the last one and a TagTable with the scanned tags. If no
+    tag boundary is found in the range, or the one found turns out not to
+    be a real one, the offsets are None.
+
+    Without a policy, nothing gets reported and a failed check also makes
+    the offsets None, so that the range gets scanned again.
+    """
+    if policy is None:
+        checks = CountPolicy()
+    else:
+        checks = policy
+    table = TagTable()
+    f = open(path, 'rb')
+    try:
+        if first_offset is None:
+            first_offset = find_tag_boundary(f, start, end)
+            if first_offset is None:
+                return None, None, table
+        try:
+            next_offset = scan_tags_into(f, first_offset, end, table, checks)
+        except (MalformedFLV, EndOfFile):
+            if policy is not None:
+                raise
+            # The boundary found was not a real one, the caller will
+            # have to scan the range starting from a known tag
+            log.debug("Lost sync in range 0x%08X-0x%08X", start, end)
+            return None, None, TagTable()
+    finally:
+        f.close()
+
+    if policy is None and (checks.failures or checks.warnings):
+        # Either a false boundary too, or something the caller's policy has
+        # to see
+        log.debug("Failed checks in range 0x%08X-0x%08X", start, end)
+        return None, None, TagTable()
+
+    return first_offset, next_offset, table
+
+
+def scan_tags_into(f, offset, end, table, policy=None):
+    # Returns the offset right after the last tag scanned
+    append = table.append
+    for header in FLV(f, policy=policy).scan_tag_headers(offset, end):
+        append(*header)
+        offset = header[1] + TAG_HEADER_SIZE + header[2] + 4
+    return offset
+
+
+def split_ranges(start, end, count, min_size=MIN_RANGE_SIZE):
+    """
+    Split the bytes between start and end into at most count ranges, none of
+    them smaller than min_size, except when there's just one.
+    """
+    count = max(1, min(count, (end - start) // max(min_size, 1)))
+    size = (end - start) // count
+    boundaries = [start + i * size for i in range(count)] + [end]
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+def read_table_parallel(path, jobs=None, min_range_size=MIN_RANGE_SIZE,
+                        policy=None):
+    """
+    Read the headers of all tags in the FLV file at path into a TagTable,
+    using jobs processes, or one per CPU if it's None.
+
+    Gives the same result as FLV.read_table with the given policy.
+    """
+    if jobs is None:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+
+    f = open(path, 'rb')
+    try:
+        flv = FLV(f, policy=policy)
+        flv.parse_header()
+        policy = flv.policy
+        data_start = f.tell()
+        file_size = os.fstat(f.fileno()).st_size
+    finally:
+        f.close()
+
+    ranges = split_ranges(data_start, file_size, jobs, min_range_size)
+    log.debug("Scanning `%s' in %d ranges", path, len(ranges))
+
+    # The first range starts with a tag, no need to look for it
+    arguments = [(path, start, end, None) for start, end in ranges]
+    arguments[0] = (path, ranges[0][0], ranges[0][1], data_start)
+
+    table = TagTable()
+    expected = data_start
+    for (start, end), result in zip(ranges, run_jobs(scan_range, arguments,
+                                                     jobs)):
+        first_offset, next_offset, part = result
+        if first_offset is None and expected >= end:
+            # A tag from a previous range spans the whole range
+            continue
+        if first_offset != expected:
+            # The boundary found was a false positive, or the previous
+            # range ended past it. Scan again from the right place.
+            log.debug("Rescanning range 0x%08X-0x%08X from 0x%08X",
+                      start, end, expected)
+            first_offset, next_offset, part = scan_range(path, start, end,
+                                                         expected, policy)
+        table.extend(part)
+        expected = next_offset
+
+    return table
@@ -0,0 +1,151 @@
+from StringIO import StringIO
+
+from primitives import unpack_ui32, EndOfFile
+from astypes import MalformedFLV
+from tags import FLV, SCAN_FULL, TAG_HEADER_SIZE, tag_to_class
+from tags import unpack_tag_header, default_policy
+
+"""
+Parsing FLV data as it arrives, without doing any I/O.
+"""
+
+# The header is 9 bytes long, but its size is stored in the file. Anything
+# much larger is not an FLV header and would just make the parser buffer
+# data waiting for its end.
+MAX_HEADER_SIZE = 256
+
+
+class TagData(StringIO):
+    """
+    The data of a single tag, pretending to be at the tag's offset in the
+    stream, so the tag classes see the same positions as in a file.
+    """
+
+    def __init__(self, data, offset):
+        StringIO.__init__(self, data)
+        self.base_offset = offset
+
+    def tell(self):
+        return StringIO.tell(self) + self.base_offset
+
+
+class FLVParser(object):
+    """
+    An incremental FLV parser.
+
+    Data is passed to feed as it arrives, for instance from a socket, in
+    chunks of any size. feed returns the tags that were completed by the
+    data, parsed by the same tag classes FLV uses, with offsets counted
+    from the beginning of the stream.
+
+    Only the data of the tag currently being received is buffered, so
+    memory use is bounded by the maximum tag size.
+    """
+
+    def __init__(self, scan_level=SCAN_FULL, policy=None,
+                 lazy_metadata=True):
+        self.scan_level = scan_level
+        if policy is None:
+            policy = default_policy
+        self.policy = policy
+        self.lazy_metadata = lazy_metadata
+        self.version = None
+        self.has_audio = None
+        self.has_video = None
+        self.buffer = bytearray()
+        # The stream offset of the first byte in the buffer
+        self.offset = 0
+
+    def feed(self, data):
+        """
+        Add data to the parser and return a list of the tags it completed.
+        """
+        self.buffer.extend(data)
+        buf = self.buffer
+
+        tags = []
+        pos = 0
+        if self.version is None:
+            pos = self.parse_header()
+            if pos is None:
+                return tags
+
+        end = len(buf)
+        while end - pos >= TAG_HEADER_SIZE:
+            # DataSize is right after the tag type
+            size = (buf[pos + 1] << 16) | (buf[pos + 2] << 8) | buf[pos + 3]
+            tag_end = pos + TAG_HEADER_SIZE + size + 4
+            if tag_end > end:
+                break
+            tags.append(self.parse_tag(str(buf[pos:tag_end]),
+                                       self.offset + pos))
+            pos = tag_end
+
+        del buf[:pos]
+        self.offset += pos
+        return tags
+
+    def parse_header(self):
+        # Returns the size of the header, or None if it's not complete yet
+        buf = self.buffer
+        if len(buf) < 3:
+            return None
+        # Check the signature as soon as possible, to not wait for the rest
+        # of the header in a stream that's not an FLV at all
+        if buf[:3] != 'FLV':
+            raise MalformedFLV("File signature is incorrect: 0x%X 0x%X 0x%X",
+                               buf[0], buf[1], buf[2])
+        if len(buf) < 9:
+            return None
+        header_size, _ = unpack_ui32(buf, 5)
+        if header_size > MAX_HEADER_SIZE:
+            raise MalformedFLV("The header size is too large: %d bytes",
+                               header_size)
+        if len(buf) < header_size + 4:
+            return None
+
+        # Let FLV do the checking
+        flv = FLV(StringIO(str(buf[:header_size + 4])), policy=self.policy)
+        flv.parse_header()
+        self.version = flv.version
+        self.has_audio = flv.has_audio
+        self.has_video = flv.has_video
+
+        return header_size + 4
+
+    def parse_tag(self, data, offset):
+        tag_type, size, timestamp, stream_id, flags = unpack_tag_header(data)
+
+        tag_klass = self.tag_type_to_class(tag_type)
+        f = TagData(data, offset)
+        tag = tag_klass(self, f)
+
+        if flags is None:
+            f.seek(TAG_HEADER_SIZE)
+        else:
+            f.seek(TAG_HEADER_SIZE + 1)
+        tag.header = (offset, size, timestamp, stream_id, flags)
+        tag.parse()
+
+        return tag
+
+    def get_payload(self, tag):
+        # Every tag keeps its own data
+        return buffer(tag.f.getvalue(), TAG_HEADER_SIZE, tag.size)
+
+    def get_raw_bytes(self, tag):
+        return buffer(tag.f.getvalue())
+
+    def tag_type_to_class(self, tag_type):
+        try:
+            return tag_to_class[tag_type]
+        except KeyError:
+            raise MalformedFLV("Invalid tag type: %d", tag_type)
+
+    def close(self):
+        """
+        Signal the end of the stream. Raises EndOfFile if it ends in the
+        middle of a tag.
+        """
+        if self.version is None or self.buffer:
+            raise EndOfFile
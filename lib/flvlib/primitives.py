@@ -2,40 +2,69 @@ import struct
 
 """
 The internal FLV representations of numbers.
+
+The get_* functions read from file-like objects, the unpack_* functions
+decode from a buffer (a string, bytearray, buffer or memoryview) at a given
+offset and return the value together with the offset just past it.
 """
 
 
 __all__ = ['get_ui32', 'make_ui32', 'get_si32_extended', 'make_si32_extended',
            'get_ui24', 'make_ui24', 'get_ui16', 'make_ui16',
            'get_si16', 'make_si16', 'get_ui8', 'make_ui8',
-           'get_double', 'make_double', 'EndOfFile']
+           'get_double', 'make_double', 'EndOfFile',
+           'unpack_ui32', 'unpack_si32_extended', 'unpack_ui24',
+           'unpack_ui16', 'unpack_si16', 'unpack_ui8', 'unpack_double']
 
 
 class EndOfFile(Exception):
     pass
 
 
+ui32_struct = struct.Struct(">I")
+# The last 8 bits are the high 8 bits of the whole number
+# That's how Adobe likes it. Go figure...
+si32_extended_struct = struct.Struct(">HBb")
+ui24_struct = struct.Struct(">BH")
+ui16_struct = struct.Struct(">H")
+si16_struct = struct.Struct(">h")
+ui8_struct = struct.Struct("B")
+double_struct = struct.Struct(">d")
+
+
 # UI32
 def get_ui32(f):
     try:
-        ret = struct.unpack(">I", f.read(4))[0]
+        ret = ui32_struct.unpack(f.read(4))[0]
     except struct.error:
         raise EndOfFile
     return ret
 
+def unpack_ui32(buf, offset=0):
+    try:
+        ret = ui32_struct.unpack_from(buf, offset)[0]
+    except struct.error:
+        raise EndOfFile
+    return ret, offset + 4
+
 def make_ui32(num):
-    return struct.pack(">I", num)
+    return ui32_struct.pack(num)
 
 
 # SI32 extended
 def get_si32_extended(f):
-    # The last 8 bits are the high 8 bits of the whole number
-    # That's how Adobe likes it. Go figure...
-    low_high = f.read(4)
-    if len(low_high) < 4:
+    try:
+        high, low, extended = si32_extended_struct.unpack(f.read(4))
+    except struct.error:
         raise EndOfFile
-    combined = low_high[3] + low_high[:3]
-    return struct.unpack(">i", combined)[0]
+    return (extended << 24) | (high << 8) | low
+
+def unpack_si32_extended(buf, offset=0):
+    try:
+        high, low, extended = si32_extended_struct.unpack_from(buf, offset)
+    except struct.error:
+        raise EndOfFile
+    return (extended << 24) | (high << 8) | low, offset + 4
 
 def make_si32_extended(num):
     ret = struct.pack(">i", num)
@@ -45,51 +74,79 @@ def make_si32_extended(num):
 # UI24
 def get_ui24(f):
     try:
-        high, low = struct.unpack(">BH", f.read(3))
+        high, low = ui24_struct.unpack(f.read(3))
     except struct.error:
         raise EndOfFile
     ret = (high << 16) + low
     return ret
 
+def unpack_ui24(buf, offset=0):
+    try:
+        high, low = ui24_struct.unpack_from(buf, offset)
+    except struct.error:
+        raise EndOfFile
+    return (high << 16) + low, offset + 3
+
 def make_ui24(num):
-    ret = struct.pack(">I", num)
+    ret = ui32_struct.pack(num)
     return ret[1:]
 
 
 # UI16
 def get_ui16(f):
     try:
-        ret = struct.unpack(">H", f.read(2))[0]
+        ret = ui16_struct.unpack(f.read(2))[0]
     except struct.error:
         raise EndOfFile
     return ret
 
+def unpack_ui16(buf, offset=0):
+    try:
+        ret = ui16_struct.unpack_from(buf, offset)[0]
+    except struct.error:
+        raise EndOfFile
+    return ret, offset + 2
+
 def make_ui16(num):
-    return struct.pack(">H", num)
+    return ui16_struct.pack(num)
 
 
 # SI16
 def get_si16(f):
     try:
-        ret = struct.unpack(">h", f.read(2))[0]
+        ret = si16_struct.unpack(f.read(2))[0]
     except struct.error:
         raise EndOfFile
     return ret
 
+def unpack_si16(buf, offset=0):
+    try:
+        ret = si16_struct.unpack_from(buf, offset)[0]
+    except struct.error:
+        raise EndOfFile
+    return ret, offset + 2
+
 def make_si16(num):
-    return struct.pack(">h", num)
+    return si16_struct.pack(num)
 
 
 # UI8
 def get_ui8(f):
     try:
-        ret = struct.unpack("B", f.read(1))[0]
+        ret = ui8_struct.unpack(f.read(1))[0]
     except struct.error:
         raise EndOfFile
     return ret
 
+def unpack_ui8(buf, offset=0):
+    try:
+        ret = ui8_struct.unpack_from(buf, offset)[0]
+    except struct.error:
+        raise EndOfFile
+    return ret, offset + 1
+
 def make_ui8(num):
-    return struct.pack("B", num)
+    return ui8_struct.pack(num)
 
 
 
@@ -97,10 +154,17 @@ def make_ui8(num):
 def get_double(f):
     data = f.read(8)
     try:
-        ret = struct.unpack(">d", data)[0]
+        ret = double_struct.unpack(data)[0]
     except struct.error:
         raise EndOfFile
     return ret
 
+def unpack_double(buf, offset=0):
+    try:
+        ret = double_struct.unpack_from(buf, offset)[0]
+    except struct.error:
+        raise EndOfFile
+    return ret, offset + 8
+
 def make_double(num):
-    return struct.pack(">d", num)
+    return double_struct.pack(num)
@@ -0,0 +1,221 @@
+import os
+import re
+import logging
+
+from primitives import get_ui32, EndOfFile
+from astypes import MalformedFLV
+from tags import FLV, TAG_HEADER_SIZE, tag_to_class
+from validation import ValidationPolicy
+
+"""
+Reading damaged FLV files.
+
+When a tag can't be parsed, the file is searched for the next place that
+looks like the start of a tag and reading continues from there. The search
+is done with a regular expression over big blocks of the file, so even long
+damaged regions are skipped quickly.
+"""
+
+log = logging.getLogger('flvlib.recovery')
+
+# How much data to read at once when looking for a tag boundary
+SEARCH_BLOCK_SIZE = 1024 * 1024
+
+# A known tag type followed by the size and timestamp and a zero StreamID.
+# It's a lookahead, so that overlapping candidates are all found.
+tag_header_pattern = re.compile(
+    '(?=[%s].{7}\x00\x00\x00)' %
+    ''.join([re.escape(chr(tag_type)) for tag_type in sorted(tag_to_class)]),
+    re.DOTALL)
+
+
+def is_tag_header(data):
+    """
+    Check whether data starts with something that looks like a tag header:
+    a known tag type and a zero StreamID.
+    """
+    return (len(data) >= TAG_HEADER_SIZE and
+            ord(data[0]) in tag_to_class and
+            data[8:11] == '\x00\x00\x00')
+
+
+def is_tag_boundary(f, offset, data=None):
+    """
+    Check whether a tag starts at offset: it has to have a known tag type,
+    a zero StreamID and be followed by a matching PreviousTagSize.
+
+    The header can be passed in data, if it has already been read.
+    """
+    if data is None:
+        f.seek(offset)
+        data = f.read(TAG_HEADER_SIZE)
+    if not is_tag_header(data):
+        return False
+
+    size = (ord(data[1]) << 16) | (ord(data[2]) << 8) | ord(data[3])
+    f.seek(offset + TAG_HEADER_SIZE + size)
+    try:
+        return get_ui32(f) == size + TAG_HEADER_SIZE
+    except EndOfFile:
+        return False
+
+
+def find_tag_boundary(f, start, end):
+    """
+    Return the offset of the first tag starting between start and end, or
+    None if there is none.
+    """
+    block_start = start
+    while block_start < end:
+        f.seek(block_start)
+        # Read enough to have a whole header for every position
+        data = f.read(SEARCH_BLOCK_SIZE + TAG_HEADER_SIZE - 1)
+        if not data:
+            break
+        positions = min(SEARCH_BLOCK_SIZE, end - block_start)
+
+        pos = 0
+        endpos = positions + TAG_HEADER_SIZE - 1
+        while True:
+            match = tag_header_pattern.search(data, pos, endpos)
+            if match is None:
+                break
+            pos = match.start()
+            if is_tag_boundary(f, block_start + pos,
+                               data[pos:pos + TAG_HEADER_SIZE]):
+                return block_start + pos
+            pos += 1
+
+        block_start += positions
+    return None
+
+
+class FailureCountingPolicy(ValidationPolicy):
+    """
+    Pass everything to another policy, counting the failed checks.
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.failures = 0
+
+    def is_strict(self):
+        return self.policy.is_strict()
+
+    def failed(self, error_msg, args):
+        self.failures += 1
+        self.policy.failed(error_msg, args)
+
+    def warned(self, warning_msg, args):
+        self.policy.warned(warning_msg, args)
+
+    def report(self):
+        self.policy.report()
+
+
+class RecoveringFLV(FLV):
+    """
+    An FLV file that might have damaged parts.
+
+    Iterating over the tags skips over anything that can't be parsed,
+    continuing with the next tag found after it. The skipped byte ranges are
+    kept in skipped, as (start, end) pairs, and copy_data can be used to
+    copy parts of the file leaving them out.
+
+    Can be combined with other FLV subclasses through multiple inheritance,
+    as long as it comes first.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(RecoveringFLV, self).__init__(*args, **kwargs)
+        self.skipped = []
+        # To know which tags need a closer look
+        self.policy = FailureCountingPolicy(self.policy)
+
+    def iter_tags(self):
+        self.parse_header()
+        return self.iter_tags_from(self.f.tell())
+
+    def iter_tags_from(self, offset):
+        self.parse_header()
+        f = self.f
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+
+        while offset < end:
+            failures = self.policy.failures
+            try:
+                tag = self.read_tag_at(offset)
+                next_offset = f.tell()
+            except (MalformedFLV, EndOfFile):
+                tag = None
+
+            if tag is None or (self.policy.failures != failures and
+                               not self.is_plausible(offset, next_offset,
+                                                     end)):
+                next_offset = find_tag_boundary(f, offset + 1, end)
+                if next_offset is None:
+                    next_offset = end
+                self.skip(offset, next_offset)
+                offset = next_offset
+                continue
+
+            # The consumer might move the file position
+            offset = next_offset
+            yield tag
+
+    def is_plausible(self, offset, next_offset, end):
+        """
+        Check a tag that got parsed even though some checks failed. Parsing
+        that is not strict lets through tags with non zero StreamIDs and
+        wrong PreviousTagSizes. The former are not accepted, the latter only
+        if another tag follows.
+        """
+        f = self.f
+        f.seek(offset)
+        if not is_tag_header(f.read(TAG_HEADER_SIZE)):
+            return False
+        if next_offset == end or is_tag_boundary(f, offset):
+            return True
+        f.seek(next_offset)
+        return is_tag_header(f.read(TAG_HEADER_SIZE))
+
+    def skip(self, start, end):
+        log.warning("Skipping %d damaged bytes at offset 0x%08X",
+                    end - start, start)
+        self.skipped.append((start, end))
+
+    def skipped_bytes(self, start, end):
+        """
+        Return the number of bytes between start and end that were skipped.
+        """
+        return sum([min(e, end) - max(s, start) for s, e in self.skipped
+                    if s < end and e > start])
+
+    def copy_data(self, fo, start, end=None):
+        """
+        Copy the file from start to end, or to the end of the file if it's
+        None, to fo, leaving out the skipped ranges.
+        """
+        f = self.f
+        if end is None:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+
+        for s, e in sorted(self.skipped):
+            if e <= start or s >= end:
+                continue
+            self.copy_range(fo, start, s)
+            start = e
+        self.copy_range(fo, start, end)
+
+    def copy_range(self, fo, start, end):
+        f = self.f
+        f.seek(start)
+        left = end - start
+        while left > 0:
+            data = f.read(min(left, 65536))
+            if not data:
+                raise EndOfFile
+            fo.write(data)
+            left -= len(data)
@@ -10,6 +10,9 @@ from flvlib.constants import H264_PACKET_TYPE_SEQUENCE_HEADER
 from flvlib.constants import H264_PACKET_TYPE_NALU
 from flvlib.astypes import MalformedFLV, FLVObject
 from flvlib.tags import FLV, EndOfFile, AudioTag, VideoTag, ScriptTag
+from flvlib.tags import SCAN_FLAGS
+from flvlib.recovery import RecoveringFLV
+from flvlib.sidecar import load_index
 
 
 log = logging.getLogger('flvlib.cut-flv')
@@ -48,7 +51,8 @@ tag_to_class = {
 class CuttingFLV(FLV):
 
     def __init__(self, f):
-        FLV.__init__(self, f)
+        # Script tag values are never looked at, don't decode them
+        FLV.__init__(self, f, scan_level=SCAN_FLAGS)
         self.metadata = None
         self.keyframes = FLVObject()
         self.keyframes.filepositions = []
@@ -64,7 +68,32 @@ class CuttingFLV(FLV):
             raise MalformedFLV("Invalid tag type: %d", tag_type)
 
 
-def cut_file(inpath, outpath, start_time, end_time):
+class RecoveringCuttingFLV(RecoveringFLV, CuttingFLV):
+    pass
+
+
+def load_keyframe_index(flv, inpath):
+    # Take the keyframes from the sidecar index, building it if needed. If
+    # that fails, the file gets scanned and the problem reported then.
+    try:
+        index = load_index(inpath)
+    except (MalformedFLV, EndOfFile):
+        log.debug("Failed to index `%s'", inpath)
+        return
+    if index.keyframe_offsets:
+        flv.keyframe_index = (index.keyframe_timestamps,
+                              index.keyframe_offsets)
+
+
+def cut_file(inpath, outpath, start_time, end_time, recover=False,
+             sidecar=False, stop_early=False):
+    """
+    With sidecar set, the keyframes to skip to the start time with are
+    taken from the sidecar index of the input file, which gets built if
+    it's missing or out of date. With stop_early set, the input is not
+    read past the end of the part that gets copied, so errors after it
+    are not reported.
+    """
     log.debug("Cutting file `%s' into file `%s'", inpath, outpath)
 
     try:
@@ -88,15 +117,29 @@ def cut_file(inpath, outpath, start_time, end_time):
     else:
         end_time = int(end_time)
 
-    flv = CuttingFLV(f)
+    if recover:
+        flv = RecoveringCuttingFLV(f)
+    else:
+        flv = CuttingFLV(f)
     tag_iterator = flv.iter_tags()
     last_tag = None
     tag_after_last_tag = None
     first_keyframe_after_start = None
 
+    # Tags before the start time can be skipped, unless the end time is
+    # before the start time, in which case they can end the output
+    may_skip = start_time > 0 and (end_time == -1 or end_time >= start_time)
+    if recover:
+        # The keyframe index of a damaged file can't be trusted, and all
+        # damaged parts have to be found
+        may_skip = False
+    elif may_skip and sidecar:
+        load_keyframe_index(flv, inpath)
+
     try:
         while True:
             tag = tag_iterator.next()
+
             # some buggy software, like gstreamer's flvmux, puts a metadata tag
             # at the end of the file with timestamp 0, and we don't want to
             # base our duration computation on that
@@ -112,6 +155,23 @@ def cut_file(inpath, outpath, start_time, end_time):
                         first_keyframe_after_start = tag
                 elif flv.no_video:
                     first_keyframe_after_start = tag
+            if (stop_early and first_keyframe_after_start and
+                    tag_after_last_tag):
+                # Everything that will get copied is known
+                break
+
+            if (may_skip and flv.first_media_tag_offset and
+                    not first_keyframe_after_start):
+                # If the file has a keyframe index, jump straight to the
+                # last keyframe before the start time
+                may_skip = False
+                next_offset = f.tell()
+                keyframe = flv.seek_to_time(start_time, scan=False)
+                if keyframe is not None and keyframe.offset > tag.offset:
+                    log.debug("Skipping to keyframe %s", keyframe)
+                    tag_iterator = flv.iter_tags_from(keyframe.offset)
+                else:
+                    f.seek(next_offset)
     except MalformedFLV, e:
         message = e[0] % e[1:]
         log.error("The file `%s' is not a valid FLV file: %s", inpath, message)
@@ -144,7 +204,10 @@ def cut_file(inpath, outpath, start_time, end_time):
 
     f.seek(0)
     log.debug("copying up to %d bytes", flv.first_media_tag_offset)
-    fo.write(f.read(flv.first_media_tag_offset))
+    if recover:
+        flv.copy_data(fo, 0, flv.first_media_tag_offset)
+    else:
+        fo.write(f.read(flv.first_media_tag_offset))
     log.debug("seeking to %d bytes", first_keyframe_after_start.offset)
     if tag_after_last_tag:
         end_offset = tag_after_last_tag.offset
@@ -156,7 +219,10 @@ def cut_file(inpath, outpath, start_time, end_time):
 
     copy_bytes = end_offset - first_keyframe_after_start.offset
     log.debug("copying %d bytes", copy_bytes)
-    fo.write(f.read(copy_bytes))
+    if recover:
+        flv.copy_data(fo, first_keyframe_after_start.offset, end_offset)
+    else:
+        fo.write(f.read(copy_bytes))
     f.close()
     fo.close()
     return True
@@ -175,6 +241,17 @@ def process_options():
                           version=version)
     parser.add_option("-s", "--start-time", help="start time to cut from")
     parser.add_option("-e", "--end-time", help="end time to cut to")
+    parser.add_option("--recover", action="store_true",
+                      help=("skip over damaged parts of the file instead of "
+                            "rejecting it, leaving them out of the output"))
+    parser.add_option("--no-sidecar", action="store_false", dest="sidecar",
+                      default=True,
+                      help=("do not use or write a .flvidx sidecar index, "
+                            "look for keyframes in the file's metadata"))
+    parser.add_option("--stop-early", action="store_true",
+                      help=("stop reading the file once the part to copy is "
+                            "known, without checking the rest of it for "
+                            "errors"))
     parser.add_option("-v", "--verbose", action="count",
                       default=0, dest="verbosity",
                       help="be more verbose, each -v increases verbosity")
@@ -198,7 +275,8 @@ def process_options():
 
 def cut_files():
     options, args = process_options()
-    return cut_file(args[1], args[2], options.start_time, options.end_time)
+    return cut_file(args[1], args[2], options.start_time, options.end_time,
+                    options.recover, options.sidecar, options.stop_early)
 
 
 def main():
@@ -1,28 +1,40 @@
 import sys
 import logging
 
+from StringIO import StringIO
 from optparse import OptionParser
 
+import flvlib
 from flvlib import __versionstr__
 from flvlib import tags
 from flvlib import helpers
 from flvlib.astypes import MalformedFLV
+from flvlib.validation import StrictPolicy, WarnPolicy
 
 log = logging.getLogger('flvlib.debug-flv')
 log.setLevel(logging.ERROR)
 
 
-def debug_file(filename, quiet=False, metadata=False):
+def debug_file(filename, quiet=False, metadata=False, out=None,
+               strict=False):
+    if out is None:
+        out = sys.stdout
+
     try:
         f = open(filename, 'rb')
     except IOError, (errno, strerror):
         log.error("Failed to open `%s': %s", filename, strerror)
         return False
 
-    flv = tags.FLV(f)
+    if strict:
+        policy = StrictPolicy()
+    else:
+        # Warn once about every kind of problem and sum them up at the end
+        policy = WarnPolicy()
+    flv = tags.FLV(f, policy=policy)
 
     if not quiet:
-        print "=== `%s' ===" % filename
+        print >>out, "=== `%s' ===" % filename
 
     try:
         tag_generator = flv.iter_tags()
@@ -31,12 +43,13 @@ def debug_file(filename, quiet=False, metadata=False):
                 # If we're quiet, we just want to catch errors
                 continue
             # Print the tag information
-            print "#%05d %s" % (i + 1, tag)
+            print >>out, "#%05d %s" % (i + 1, tag)
             # Print the content of onMetaData tags
             if (isinstance(tag, tags.ScriptTag)
                 and tag.name == "onMetaData"):
-                helpers.pprint(tag.variable)
+                print >>out, helpers.pformat(tag.variable)
                 if metadata:
+                    policy.report()
                     return True
     except MalformedFLV, e:
         message = e[0] % e[1:]
@@ -48,10 +61,29 @@ def debug_file(filename, quiet=False, metadata=False):
         return False
 
     f.close()
+    policy.report()
 
     return True
 
 
+def debug_file_to_string(filename, quiet=False, metadata=False,
+                         strict=False):
+    """
+    Same as debug_file, but return the output and the logged messages
+    together with the outcome, for running in a separate process.
+    """
+    out = StringIO()
+    messages = StringIO()
+    # Keep the messages with the file they are about, instead of mixing
+    # them with the other processes' ones
+    stream, flvlib.handler.stream = flvlib.handler.stream, messages
+    try:
+        outcome = debug_file(filename, quiet, metadata, out, strict)
+    finally:
+        flvlib.handler.stream = stream
+    return outcome, out.getvalue(), messages.getvalue()
+
+
 def process_options():
     usage = "%prog [options] files ..."
     description = ("Checks FLV files for comformance with the FLV "
@@ -66,16 +98,25 @@ def process_options():
                       help="do not output anything unless there are errors")
     parser.add_option("-m", "--metadata", action="store_true",
                       help="exit immediately after printing an onMetaData tag")
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help="process up to JOBS files in parallel")
+    parser.add_option("--files0-from", metavar="FILE",
+                      help=("also process the files listed in FILE, separated "
+                            "by NUL characters, if FILE is - read the list "
+                            "from the standard input"))
     parser.add_option("-v", "--verbose", action="count",
                       default=0, dest="verbosity",
                       help="be more verbose, each -v increases verbosity")
     options, args = parser.parse_args(sys.argv)
 
+    if options.files0_from:
+        args.extend(helpers.read_file_list(options.files0_from))
+
     if len(args) < 2:
         parser.error("You have to provide at least one file path")
 
-    if options.strict:
-        tags.STRICT_PARSING = True
+    if options.jobs < 1:
+        parser.error("The number of jobs has to be positive")
 
     if options.verbosity > 3:
         options.verbosity = 3
@@ -92,8 +133,24 @@ def debug_files():
 
     clean_run = True
 
-    for filename in args[1:]:
-        if not debug_file(filename, options.quiet, options.metadata):
+    if options.jobs == 1:
+        for filename in args[1:]:
+            if not debug_file(filename, options.quiet, options.metadata,
+                              strict=options.strict):
+                clean_run = False
+        return clean_run
+
+    # Each file's output and messages are collected separately and printed
+    # in order
+    arguments = [(filename, options.quiet, options.metadata, options.strict)
+                 for filename in args[1:]]
+    for outcome, output, messages in helpers.run_jobs(debug_file_to_string,
+                                                      arguments,
+                                                      options.jobs):
+        sys.stdout.write(output)
+        sys.stdout.flush()
+        sys.stderr.write(messages)
+        if not outcome:
             clean_run = False
 
     return clean_run
@@ -0,0 +1,175 @@
+import sys
+import logging
+
+from optparse import OptionParser
+
+from flvlib import __versionstr__
+from flvlib.constants import SOUND_FORMAT_AAC, SOUND_FORMAT_MP3
+from flvlib.constants import CODEC_ID_H263, CODEC_ID_VP6, CODEC_ID_H264
+from flvlib.generate import FLVGenerator
+from flvlib.generate import bitrate_shape_to_string, metadata_to_string
+
+log = logging.getLogger('flvlib.generate-flv')
+
+sound_formats = {
+    'aac': SOUND_FORMAT_AAC,
+    'mp3': SOUND_FORMAT_MP3
+}
+
+codec_ids = {
+    'h264': CODEC_ID_H264,
+    'vp6': CODEC_ID_VP6,
+    'h263': CODEC_ID_H263
+}
+
+
+def reverse(d):
+    return dict([(value, key) for key, value in d.iteritems()])
+
+
+def generate_file(outpath, **kwargs):
+    log.debug("Generating file `%s'", outpath)
+
+    if outpath == '-':
+        fo = sys.stdout
+    else:
+        try:
+            fo = open(outpath, 'wb')
+        except IOError, (errno, strerror):
+            log.error("Failed to open `%s': %s", outpath, strerror)
+            return False
+
+    try:
+        written = FLVGenerator(**kwargs).write(fo)
+    finally:
+        if fo is not sys.stdout:
+            fo.close()
+
+    log.info("Wrote %d bytes", written)
+    return True
+
+
+def parse_gap(parser, gap):
+    try:
+        time, length = gap.split(':')
+        return int(float(time) * 1000), int(float(length) * 1000)
+    except ValueError:
+        parser.error("Invalid gap: %s" % gap)
+
+
+def process_options():
+    usage = "%prog [options] outfile"
+    description = ("Generate a synthetic FLV file, with random audio and "
+                   "video data following the given codecs and bitrates. "
+                   "Times are given in seconds and bitrates in kilobits per "
+                   "second. If outfile is - the file is written to the "
+                   "standard output.")
+    version = "%%prog flvlib %s" % __versionstr__
+    parser = OptionParser(usage=usage, description=description,
+                          version=version)
+    parser.add_option("-d", "--duration", type="float", default=60.0,
+                      help="duration of the file, 60 seconds by default")
+    parser.add_option("--no-audio", action="store_false", dest="has_audio",
+                      default=True, help="do not include audio")
+    parser.add_option("--no-video", action="store_false", dest="has_video",
+                      default=True, help="do not include video")
+    parser.add_option("--audio-codec", choices=sorted(sound_formats),
+                      default="aac", help="aac or mp3, aac by default")
+    parser.add_option("--video-codec", choices=sorted(codec_ids),
+                      default="h264",
+                      help="h264, vp6 or h263, h264 by default")
+    parser.add_option("--audio-bitrate", type="float", default=128.0,
+                      help="audio bitrate, 128 kbit/s by default")
+    parser.add_option("--video-bitrate", type="float", default=1000.0,
+                      help="video bitrate, 1000 kbit/s by default")
+    parser.add_option("--bitrate-shape",
+                      choices=sorted(bitrate_shape_to_string.values()),
+                      default="constant",
+                      help=("how the size of video frames varies, constant, "
+                            "sine or random, constant by default"))
+    parser.add_option("--frame-rate", type="float", default=25.0,
+                      help="video frame rate, 25 by default")
+    parser.add_option("--gop", type="int", default=50, dest="gop_length",
+                      help=("number of frames from one keyframe to the next, "
+                            "50 by default"))
+    parser.add_option("--gap", action="append", default=[], metavar="TIME:LEN",
+                      help=("make the timestamps jump forward by LEN at TIME, "
+                            "can be given more than once"))
+    parser.add_option("--metadata",
+                      choices=sorted(metadata_to_string.values()),
+                      default="start",
+                      help=("where to put the onMetaData tag, start, end, "
+                            "both or none, start by default"))
+    parser.add_option("--corrupt", action="append", type="float", default=[],
+                      metavar="TIME",
+                      help=("replace the tag at TIME with random bytes, can "
+                            "be given more than once"))
+    parser.add_option("--seed", type="int", default=0,
+                      help="seed for the random data, 0 by default")
+    parser.add_option("-v", "--verbose", action="count",
+                      default=0, dest="verbosity",
+                      help="be more verbose, each -v increases verbosity")
+    options, args = parser.parse_args(sys.argv)
+
+    if len(args) != 2:
+        parser.error("You have to provide one output file path")
+
+    if not options.has_audio and not options.has_video:
+        parser.error("The file has to have audio or video")
+
+    if options.frame_rate <= 0 or options.gop_length < 1:
+        parser.error("The frame rate and GOP length have to be positive")
+
+    options.gaps = [parse_gap(parser, gap) for gap in options.gap]
+
+    if options.verbosity > 3:
+        options.verbosity = 3
+
+    log.setLevel({0: logging.ERROR, 1: logging.WARNING,
+                  2: logging.INFO, 3: logging.DEBUG}[options.verbosity])
+
+    return options, args
+
+
+def generate_files():
+    options, args = process_options()
+    return generate_file(
+        args[1],
+        duration=int(options.duration * 1000),
+        has_audio=options.has_audio,
+        has_video=options.has_video,
+        sound_format=sound_formats[options.audio_codec],
+        codec_id=codec_ids[options.video_codec],
+        frame_rate=options.frame_rate,
+        gop_length=options.gop_length,
+        video_bitrate=int(options.video_bitrate * 1000),
+        audio_bitrate=int(options.audio_bitrate * 1000),
+        bitrate_shape=reverse(bitrate_shape_to_string)[options.bitrate_shape],
+        gaps=options.gaps,
+        metadata=reverse(metadata_to_string)[options.metadata],
+        corrupt=[int(time * 1000) for time in options.corrupt],
+        seed=options.seed)
+
+
+def main():
+    try:
+        outcome = generate_files()
+    except KeyboardInterrupt:
+        # give the right exit status, 128 + signal number
+        # signal.SIGINT = 2
+        sys.exit(128 + 2)
+    except EnvironmentError, (errno, strerror):
+        try:
+            print >>sys.stderr, strerror
+        except StandardError:
+            pass
+        sys.exit(2)
+
+    if outcome:
+        sys.exit(0)
+    else:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
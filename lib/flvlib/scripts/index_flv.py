@@ -9,56 +9,29 @@ from optparse import OptionParser
 from flvlib import __versionstr__
 from flvlib.constants import TAG_TYPE_AUDIO, TAG_TYPE_VIDEO, TAG_TYPE_SCRIPT
 from flvlib.constants import FRAME_TYPE_KEYFRAME
-from flvlib.astypes import MalformedFLV, FLVObject
+from flvlib.astypes import MalformedFLV, FLVObject, EncodedValue
 from flvlib.tags import FLV, EndOfFile, AudioTag, VideoTag, ScriptTag
 from flvlib.tags import create_script_tag, create_flv_header
-from flvlib.helpers import force_remove
+from flvlib.helpers import force_remove, read_file_list, run_jobs
+from flvlib.recovery import RecoveringFLV
+from flvlib.sidecar import load_index
 
 log = logging.getLogger('flvlib.index-flv')
 
 
 class IndexingAudioTag(AudioTag):
 
-    SEEKPOINT_DENSITY = 10
-
-    def __init__(self, parent_flv, f):
-        AudioTag.__init__(self, parent_flv, f)
-
     def parse(self):
-        parent = self.parent_flv
         AudioTag.parse(self)
-
-        if not parent.first_media_tag_offset:
-            parent.first_media_tag_offset = self.offset
-
-
-        # If the FLV has video, we're done. No need to store audio seekpoint
-        # information anymore.
-        if not parent.no_video:
-            return
-
-        # We haven't seen any video tag yet. Store every SEEKPOINT_DENSITY tag
-        # offset and timestamp.
-        parent.audio_tag_number += 1
-        if (parent.audio_tag_number % self.SEEKPOINT_DENSITY == 0):
-            parent.audio_seekpoints.filepositions.append(self.offset)
-            parent.audio_seekpoints.times.append(self.timestamp / 1000.0)
+        self.parent_flv.add_audio_tag(self.offset, self.timestamp)
 
 
 class IndexingVideoTag(VideoTag):
 
     def parse(self):
-        parent = self.parent_flv
         VideoTag.parse(self)
-
-        parent.no_video = False
-
-        if not parent.first_media_tag_offset:
-            parent.first_media_tag_offset = self.offset
-
-        if self.frame_type == FRAME_TYPE_KEYFRAME:
-            parent.keyframes.filepositions.append(self.offset)
-            parent.keyframes.times.append(self.timestamp / 1000.0)
+        self.parent_flv.add_video_tag(self.offset, self.timestamp,
+                                      self.frame_type)
 
 
 class IndexingScriptTag(ScriptTag):
@@ -82,6 +55,8 @@ tag_to_class = {
 
 class IndexingFLV(FLV):
 
+    SEEKPOINT_DENSITY = 10
+
     def __init__(self, f):
         FLV.__init__(self, f)
         self.metadata = None
@@ -113,6 +88,72 @@ class IndexingFLV(FLV):
         except KeyError:
             raise MalformedFLV("Invalid tag type: %d", tag_type)
 
+    def add_audio_tag(self, offset, timestamp):
+        if not self.first_media_tag_offset:
+            self.first_media_tag_offset = offset
+
+        # If the FLV has video, we're done. No need to store audio seekpoint
+        # information anymore.
+        if not self.no_video:
+            return
+
+        # We haven't seen any video tag yet. Store every SEEKPOINT_DENSITY tag
+        # offset and timestamp.
+        self.audio_tag_number += 1
+        if (self.audio_tag_number % self.SEEKPOINT_DENSITY == 0):
+            self.audio_seekpoints.filepositions.append(offset)
+            self.audio_seekpoints.times.append(timestamp / 1000.0)
+
+    def add_video_tag(self, offset, timestamp, frame_type):
+        self.no_video = False
+
+        if not self.first_media_tag_offset:
+            self.first_media_tag_offset = offset
+
+        if frame_type == FRAME_TYPE_KEYFRAME:
+            self.keyframes.filepositions.append(offset)
+            self.keyframes.times.append(timestamp / 1000.0)
+
+    def scan(self):
+        """
+        Parse all the tags, returning the timestamp of the last one with a
+        non-zero timestamp, or None if there are none.
+        """
+        last_timestamp = None
+        for tag in self.iter_tags():
+            # some buggy software, like gstreamer's flvmux, puts a metadata tag
+            # at the end of the file with timestamp 0, and we don't want to
+            # base our duration computation on that
+            if tag.timestamp != 0:
+                last_timestamp = tag.timestamp
+        return last_timestamp
+
+    def scan_index(self, index):
+        """
+        Like scan, but take the audio and video tags from the tag table of
+        the file's sidecar index. Only the script tags get parsed.
+        """
+        self.parse_header()
+        table = index.table
+        last_timestamp = None
+        for i in xrange(len(table)):
+            tag_type = table.tag_types[i]
+            offset = table.offsets[i]
+            timestamp = table.timestamps[i]
+            if tag_type == TAG_TYPE_AUDIO:
+                self.add_audio_tag(offset, timestamp)
+            elif tag_type == TAG_TYPE_VIDEO:
+                self.add_video_tag(offset, timestamp, table.frame_types[i])
+            else:
+                self.read_tag_at(offset)
+            if timestamp != 0:
+                last_timestamp = timestamp
+        return last_timestamp
+
+
+class RecoveringIndexingFLV(RecoveringFLV, IndexingFLV):
+    pass
+
 
 def filepositions_difference(metadata, original_metadata_size):
     test_payload = create_script_tag('onMetaData', metadata)
@@ -121,12 +162,13 @@ def filepositions_difference(metadata, original_metadata_size):
     return test_payload, difference
 
 
-def retimestamp_and_index_file(inpath, outpath=None, retimestamp=None):
+def retimestamp_and_index_file(inpath, outpath=None, retimestamp=None,
+                               recover=False, sidecar=False, jobs=1):
 
     # no retimestamping needed
     if retimestamp is None:
 
-        return index_file(inpath, outpath)
+        return index_file(inpath, outpath, recover, sidecar, jobs)
 
     # retimestamp the input in place and index
     elif retimestamp == 'inplace':
@@ -184,7 +226,14 @@ def retimestamp_and_index_file(inpath, outpath=None, retimestamp=None):
         return True
 
 
-def index_file(inpath, outpath=None):
+def index_file(inpath, outpath=None, recover=False, sidecar=False, jobs=1):
+    """
+    With sidecar set, the tags are taken from the sidecar index of the
+    input file, which gets built if it's missing or out of date. It's
+    saved only when writing to another file, since overwriting the input
+    makes its index stale. With more than one job, a missing index is
+    built by scanning the file in that many processes.
+    """
     out_text = (outpath and ("into file `%s'" % outpath)) or "and overwriting"
     log.debug("Indexing file `%s' %s", inpath, out_text)
 
@@ -194,18 +243,18 @@ def index_file(inpath, outpath=None):
         log.error("Failed to open `%s': %s", inpath, strerror)
         return False
 
-    flv = IndexingFLV(f)
-    tag_iterator = flv.iter_tags()
-    last_tag = None
+    if recover:
+        flv = RecoveringIndexingFLV(f)
+    else:
+        flv = IndexingFLV(f)
 
     try:
-        while True:
-            tag = tag_iterator.next()
-            # some buggy software, like gstreamer's flvmux, puts a metadata tag
-            # at the end of the file with timestamp 0, and we don't want to
-            # base our duration computation on that
-            if tag.timestamp != 0:
-                last_tag = tag
+        if sidecar and not recover:
+            index = load_index(inpath, save=bool(outpath), jobs=jobs,
+                               policy=flv.policy)
+            last_timestamp = flv.scan_index(index)
+        else:
+            last_timestamp = flv.scan()
     except MalformedFLV, e:
         message = e[0] % e[1:]
         log.error("The file `%s' is not a valid FLV file: %s", inpath, message)
@@ -213,14 +262,12 @@ def index_file(inpath, outpath=None):
     except EndOfFile:
         log.error("Unexpected end of file on file `%s'", inpath)
         return False
-    except StopIteration:
-        pass
 
     if not flv.first_media_tag_offset:
         log.error("The file `%s' does not have any media content", inpath)
         return False
 
-    if not last_tag:
+    if last_timestamp is None:
         log.error("The file `%s' does not have any content with a "
                   "non-zero timestamp", inpath)
         return False
@@ -240,16 +287,30 @@ def index_file(inpath, outpath=None):
                  inpath)
         keyframes = flv.audio_seekpoints
 
+    if recover and flv.skipped:
+        # The damaged parts are left out of the output, so everything after
+        # them moves back
+        keyframes.filepositions = [
+            pos - flv.skipped_bytes(flv.first_media_tag_offset, pos)
+            for pos in keyframes.filepositions]
+
     duration = metadata.get('duration')
     if not duration:
         # A duration of 0 is nonsensical, yet some tools put it like that. In
         # that case (or when there is no such field) update the duration value.
-        duration = last_tag.timestamp / 1000.0
+        duration = last_timestamp / 1000.0
 
     metadata['duration'] = duration
     metadata['keyframes'] = keyframes
     metadata['metadatacreator'] = 'flvlib %s' % __versionstr__
 
+    # Shifting the filepositions does not change the size of the metadata,
+    # and nothing else changes, so encode everything else only once
+    for key, value in metadata.items():
+        if key != 'keyframes':
+            metadata[key] = EncodedValue(value)
+    keyframes.times = EncodedValue(keyframes.times)
+
     # we're going to write new metadata, so we need to shift the
     # filepositions by the amount of bytes that we're going to add to
     # the metadata tag
@@ -287,8 +348,11 @@ def index_file(inpath, outpath=None):
         fo.write(create_flv_header(has_audio=flv.has_audio,
                                    has_video=flv.has_video))
         fo.write(payload)
-        f.seek(flv.first_media_tag_offset)
-        shutil.copyfileobj(f, fo)
+        if recover:
+            flv.copy_data(fo, flv.first_media_tag_offset)
+        else:
+            f.seek(flv.first_media_tag_offset)
+            shutil.copyfileobj(f, fo)
     except IOError, (errno, strerror):
         log.error("Failed to create the indexed file: %s", strerror)
         if not outpath:
@@ -313,7 +377,7 @@ def index_file(inpath, outpath=None):
 
 
 def process_options():
-    usage = "%prog [-U] file [outfile|file2 file3 ...]"
+    usage = "%prog [-U] [-j JOBS] file [outfile|file2 file3 ...]"
     description = ("Finds keyframe timestamps and file offsets "
                    "in FLV files and updates the onMetaData "
                    "script tag with that information. "
@@ -333,14 +397,35 @@ def process_options():
                       help=("same as -r but avoid creating temporary files at "
                             "the risk of corrupting the input files in case "
                             "of errors"))
+    parser.add_option("--recover", action="store_true",
+                      help=("skip over damaged parts of the files instead of "
+                            "rejecting them, leaving them out of the output"))
+    parser.add_option("--no-sidecar", action="store_false", dest="sidecar",
+                      default=True,
+                      help=("do not use or write .flvidx sidecar indexes, "
+                            "always scan the input files"))
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help=("process up to JOBS files in parallel, or scan "
+                            "a single file in JOBS processes to build its "
+                            "sidecar index when not using the update mode"))
+    parser.add_option("--files0-from", metavar="FILE",
+                      help=("also process the files listed in FILE, separated "
+                            "by NUL characters, if FILE is - read the list "
+                            "from the standard input"))
     parser.add_option("-v", "--verbose", action="count",
                       default=0, dest="verbosity",
                       help="be more verbose, each -v increases verbosity")
     options, args = parser.parse_args(sys.argv)
 
+    if options.files0_from:
+        args.extend(read_file_list(options.files0_from))
+
     if len(args) < 2:
         parser.error("You have to provide at least one file path")
 
+    if options.jobs < 1:
+        parser.error("The number of jobs has to be positive")
+
     if not options.update and len(args) != 3:
         parser.error("You need to provide one infile and one outfile "
                      "when not using the update mode")
@@ -348,6 +433,10 @@ def process_options():
     if options.retimestamp and options.retimestamp_inplace:
         parser.error("You cannot provide both -r and -R")
 
+    if options.recover and (options.retimestamp or
+                            options.retimestamp_inplace):
+        parser.error("You cannot retimestamp files while recovering them")
+
     if options.verbosity > 3:
         options.verbosity = 3
 
@@ -370,11 +459,17 @@ def index_files():
 
     if not options.update:
         clean_run = retimestamp_and_index_file(args[1], args[2],
-                                               retimestamp=retimestamp_mode)
+                                               retimestamp=retimestamp_mode,
+                                               recover=options.recover,
+                                               sidecar=options.sidecar,
+                                               jobs=options.jobs)
     else:
-        for filename in args[1:]:
-            if not retimestamp_and_index_file(filename,
-                                              retimestamp=retimestamp_mode):
+        arguments = [(filename, None, retimestamp_mode, options.recover,
+                      options.sidecar)
+                     for filename in args[1:]]
+        for outcome in run_jobs(retimestamp_and_index_file, arguments,
+                                options.jobs):
+            if not outcome:
                 clean_run = False
 
     return clean_run
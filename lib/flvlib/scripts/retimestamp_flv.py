@@ -7,24 +7,17 @@ import tempfile
 from optparse import OptionParser
 
 from flvlib import __versionstr__
-from flvlib.constants import TAG_TYPE_AUDIO, TAG_TYPE_VIDEO, TAG_TYPE_SCRIPT
 from flvlib.constants import AAC_PACKET_TYPE_SEQUENCE_HEADER
 from flvlib.constants import H264_PACKET_TYPE_SEQUENCE_HEADER
-from flvlib.primitives import make_ui8, make_ui24, make_si32_extended
+from flvlib.primitives import make_si32_extended
 from flvlib.astypes import MalformedFLV
 from flvlib.tags import FLV, EndOfFile, AudioTag, VideoTag, ScriptTag
-from flvlib.helpers import force_remove
+from flvlib.tags import SCAN_FLAGS
+from flvlib.helpers import force_remove, read_file_list, run_jobs
 
 log = logging.getLogger('flvlib.retimestamp-flv')
 
 
-class_to_tag = {
-    AudioTag: TAG_TYPE_AUDIO,
-    VideoTag: TAG_TYPE_VIDEO,
-    ScriptTag: TAG_TYPE_SCRIPT
-}
-
-
 def is_nonheader_media(tag):
     if isinstance(tag, ScriptTag):
         return False
@@ -34,28 +27,8 @@ def is_nonheader_media(tag):
         return tag.h264_packet_type != H264_PACKET_TYPE_SEQUENCE_HEADER
 
 
-def output_offset_tag(fi, fo, tag, offset):
-    new_timestamp = tag.timestamp - offset
-    # do not offset non-media and media header
-    if not is_nonheader_media(tag):
-        new_timestamp = tag.timestamp
-
-    # write the FLV tag value
-    fo.write(make_ui8(class_to_tag[tag.__class__]))
-    # the tag size remains unchanged
-    fo.write(make_ui24(tag.size))
-    # wirte the new timestamp
-    fo.write(make_si32_extended(new_timestamp))
-    # seek inside the input file
-    #   seek position: tag offset + tag (1) + size (3) + timestamp (4)
-    fi.seek(tag.offset + 8, os.SEEK_SET)
-    # copy the tag content to the output file
-    #   content size:  tag size + stream ID (3) + previous tag size (4)
-    fo.write(fi.read(tag.size + 7))
-
-
 def retimestamp_tags_inplace(f, fu):
-    flv = FLV(f)
+    flv = FLV(f, scan_level=SCAN_FLAGS)
     offset = None
 
     for tag in flv.iter_tags():
@@ -177,7 +150,7 @@ def retimestamp_file(inpath, outpath=None, inplace=False):
 
 
 def process_options():
-    usage = "%prog [-i] [-U] file [outfile|file2 file3 ...]"
+    usage = "%prog [-i] [-U] [-j JOBS] file [outfile|file2 file3 ...]"
     description = (
 """Rewrites timestamps in FLV files making by the first media tag timestamped
     with 0. The rest of the tags is retimestamped relatively. With the -i
@@ -194,14 +167,26 @@ def process_options():
     parser.add_option("-U", "--update", action="store_true",
                       help=("update mode, overwrites the given files "
                             "instead of writing to outfile"))
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help="process up to JOBS files in parallel")
+    parser.add_option("--files0-from", metavar="FILE",
+                      help=("also process the files listed in FILE, separated "
+                            "by NUL characters, if FILE is - read the list "
+                            "from the standard input"))
     parser.add_option("-v", "--verbose", action="count",
                       default=0, dest="verbosity",
                       help="be more verbose, each -v increases verbosity")
     options, args = parser.parse_args(sys.argv)
 
+    if options.files0_from:
+        args.extend(read_file_list(options.files0_from))
+
     if len(args) < 2:
         parser.error("You have to provide at least one file path")
 
+    if options.jobs < 1:
+        parser.error("The number of jobs has to be positive")
+
     if not options.update and options.inplace:
         parser.error("You need to use the update mode if you are updating "
                      "files in place")
@@ -227,8 +212,10 @@ def retimestamp_files():
     if not options.update:
         clean_run = retimestamp_file(args[1], args[2])
     else:
-        for filename in args[1:]:
-            if not retimestamp_file(filename, inplace=options.inplace):
+        arguments = [(filename, None, options.inplace)
+                     for filename in args[1:]]
+        for outcome in run_jobs(retimestamp_file, arguments, options.jobs):
+            if not outcome:
                 clean_run = False
 
     return clean_run
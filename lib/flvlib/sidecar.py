@@ -0,0 +1,270 @@
+import os
+import sys
+import stat
+import array
+import struct
+import logging
+import tempfile
+
+from constants import *
+from astypes import get_string
+from primitives import get_ui8
+from table import TagTable, OFFSET_TYPECODE
+from tags import FLV, TAG_HEADER_SIZE
+from parallel import read_table_parallel
+
+"""
+Persistent sidecar indexes of FLV files.
+
+A sidecar index is stored next to the FLV file, in a file with the .flvidx
+extension, and holds the tag table of the file, its keyframes, the offsets
+of AAC and H.264 sequence headers and the location of the onMetaData tag.
+It's keyed on the size and modification time of the FLV file, so a stale
+index is detected and rebuilt.
+
+The layout, with all numbers little-endian:
+
+  header          magic (6), version (UI16), file size (UI64),
+                  file mtime (DOUBLE), onMetaData offset (SI64),
+                  onMetaData size (SI64), column count (UI16), padding (6)
+  column entries  typecode (1), item size (UI8), padding (6), count (UI64)
+  column data     count * item size bytes, padded to a multiple of 8
+
+The keyframes are the video keyframes that can be seeked to, so H.264
+sequence headers are left out.
+"""
+
+log = logging.getLogger('flvlib.sidecar')
+
+INDEX_EXTENSION = '.flvidx'
+INDEX_MAGIC = 'FLVIDX'
+INDEX_VERSION = 1
+
+header_struct = struct.Struct("<6sHQdqqH6x")
+column_struct = struct.Struct("<cB6xQ")
+
+# The columns of the tag table come first, then the derived ones
+table_columns = [name for name, typecode in TagTable.columns]
+index_columns = TagTable.columns + (
+    ('keyframe_offsets', OFFSET_TYPECODE),
+    ('keyframe_timestamps', 'l'),
+    ('sequence_header_offsets', OFFSET_TYPECODE))
+
+
+class SidecarIndex(object):
+    """
+    The index of an FLV file.
+
+    The metadata offset and size describe the whole onMetaData tag,
+    including its header, or are None if the file has no such tag.
+    """
+
+    def __init__(self, file_size, file_mtime, table=None):
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        self.table = table or TagTable()
+        self.keyframe_offsets = array.array(OFFSET_TYPECODE)
+        self.keyframe_timestamps = array.array('l')
+        self.sequence_header_offsets = array.array(OFFSET_TYPECODE)
+        self.metadata_offset = None
+        self.metadata_size = None
+
+    def get_column(self, name):
+        if name in table_columns:
+            return getattr(self.table, name)
+        return getattr(self, name)
+
+    def is_fresh_for(self, path):
+        st = os.stat(path)
+        return (st.st_size == self.file_size and
+                st.st_mtime == self.file_mtime)
+
+
+def index_path(path):
+    return path + INDEX_EXTENSION
+
+
+def build_index(path, jobs=1, policy=None):
+    """
+    Scan an FLV file and build its index, checking it with policy. With
+    more than one job, the file is scanned in that many processes.
+    """
+    st = os.stat(path)
+    f = open(path, 'rb')
+    try:
+        if jobs == 1:
+            table = FLV(f, policy=policy).read_table()
+        else:
+            table = read_table_parallel(path, jobs, policy=policy)
+        index = SidecarIndex(st.st_size, st.st_mtime, table)
+        table = index.table
+
+        # Not using select, it might return NumPy arrays
+        for i in xrange(len(table)):
+            offset = table.offsets[i]
+            tag_type = table.tag_types[i]
+            if tag_type == TAG_TYPE_VIDEO:
+                is_h264 = table.codecs[i] == CODEC_ID_H264
+                if (table.frame_types[i] == FRAME_TYPE_KEYFRAME and
+                    (not is_h264 or
+                     table.packet_types[i] == H264_PACKET_TYPE_NALU)):
+                    index.keyframe_offsets.append(offset)
+                    index.keyframe_timestamps.append(table.timestamps[i])
+                if (is_h264 and
+                    table.packet_types[i] == H264_PACKET_TYPE_SEQUENCE_HEADER):
+                    index.sequence_header_offsets.append(offset)
+            elif tag_type == TAG_TYPE_AUDIO:
+                if (table.codecs[i] == SOUND_FORMAT_AAC and
+                    table.packet_types[i] == AAC_PACKET_TYPE_SEQUENCE_HEADER):
+                    index.sequence_header_offsets.append(offset)
+            elif (tag_type == TAG_TYPE_SCRIPT and
+                  index.metadata_offset is None):
+                # Script tags are rare, just read their names
+                f.seek(offset + TAG_HEADER_SIZE)
+                if get_ui8(f) == VALUE_TYPE_STRING:
+                    if get_string(f) == 'onMetaData':
+                        index.metadata_offset = offset
+                        index.metadata_size = (TAG_HEADER_SIZE +
+                                               table.sizes[i])
+    finally:
+        f.close()
+
+    return index
+
+
+def write_index(index, path):
+    """
+    Write the index of the FLV file at path into its sidecar file.
+
+    The index is written to a temporary file which then replaces the
+    sidecar, so readers never see a partial index. It gets the permissions
+    of the FLV file, without the execute bits, so that whoever can read the
+    file can read its index.
+    """
+    outpath = index_path(path)
+
+    metadata_offset = index.metadata_offset
+    metadata_size = index.metadata_size
+    if metadata_offset is None:
+        metadata_offset = metadata_size = -1
+
+    fd, temppath = tempfile.mkstemp(dir=os.path.dirname(outpath) or '.')
+    fo = os.fdopen(fd, 'wb')
+    try:
+        fo.write(header_struct.pack(INDEX_MAGIC, INDEX_VERSION,
+                                    index.file_size, index.file_mtime,
+                                    metadata_offset, metadata_size,
+                                    len(index_columns)))
+        for name, typecode in index_columns:
+            column = index.get_column(name)
+            fo.write(column_struct.pack(column.typecode, column.itemsize,
+                                        len(column)))
+        for name, typecode in index_columns:
+            column = index.get_column(name)
+            if sys.byteorder == 'big':
+                column = array.array(column.typecode, column)
+                column.byteswap()
+            column.tofile(fo)
+            fo.write('\x00' * (-(len(column) * column.itemsize) % 8))
+        fo.close()
+        # mkstemp creates the file readable only by its owner
+        os.chmod(temppath, stat.S_IMODE(os.stat(path).st_mode) & 0666)
+        os.rename(temppath, outpath)
+    except:
+        fo.close()
+        os.remove(temppath)
+        raise
+
+
+def read_index(path):
+    """
+    Read the sidecar index of the FLV file at path.
+
+    Returns None if there is no index, or if it is stale, unreadable or
+    was written on an incompatible platform.
+    """
+    try:
+        f = open(index_path(path), 'rb')
+    except IOError:
+        return None
+
+    try:
+        return read_index_file(f, path)
+    finally:
+        f.close()
+
+
+def read_index_file(f, path):
+    data = f.read(header_struct.size)
+    if len(data) < header_struct.size:
+        log.debug("Index of `%s' is truncated", path)
+        return None
+
+    (magic, version, file_size, file_mtime,
+     metadata_offset, metadata_size, count) = header_struct.unpack(data)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        log.debug("Index of `%s' has an unknown format", path)
+        return None
+
+    index = SidecarIndex(file_size, file_mtime)
+    if not index.is_fresh_for(path):
+        log.debug("Index of `%s' is stale", path)
+        return None
+
+    if metadata_offset >= 0:
+        index.metadata_offset = metadata_offset
+        index.metadata_size = metadata_size
+
+    if count != len(index_columns):
+        return None
+
+    entries = []
+    for name, typecode in index_columns:
+        data = f.read(column_struct.size)
+        if len(data) < column_struct.size:
+            return None
+        column_typecode, itemsize, length = column_struct.unpack(data)
+        column = index.get_column(name)
+        if (column_typecode != column.typecode or
+            itemsize != column.itemsize):
+            log.debug("Index of `%s' was written on a different platform",
+                      path)
+            return None
+        entries.append((column, length))
+
+    for column, length in entries:
+        try:
+            column.fromfile(f, length)
+        except EOFError:
+            log.debug("Index of `%s' is truncated", path)
+            return None
+        if sys.byteorder == 'big':
+            column.byteswap()
+        f.read(-(length * column.itemsize) % 8)
+
+    return index
+
+
+def load_index(path, save=True, jobs=1, policy=None):
+    """
+    Return the index of the FLV file at path, reading it from its sidecar
+    file if it's up to date and rebuilding it otherwise.
+
+    If save is true, a rebuilt index is written back to the sidecar file.
+    jobs and policy are passed to build_index.
+    """
+    index = read_index(path)
+    if index is not None:
+        return index
+
+    log.debug("Building the index of `%s'", path)
+    index = build_index(path, jobs, policy)
+
+    if save:
+        try:
+            write_index(index, path)
+        except EnvironmentError, (errno, strerror):
+            log.warning("Failed to write the index of `%s': %s",
+                        path, strerror)
+
+    return index
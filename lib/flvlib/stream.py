@@ -0,0 +1,187 @@
+import asyncore
+import logging
+from collections import deque
+
+from primitives import EndOfFile
+from astypes import MalformedFLV
+from parser import FLVParser
+from tags import SCAN_FULL
+from tags import create_flv_header, create_flv_tag, create_flv_tags
+from tags import create_script_tag
+
+"""
+Reading and writing FLV streams over non-blocking sockets with asyncore,
+so a single event loop can handle many streams at once.
+"""
+
+log = logging.getLogger('flvlib.stream')
+
+
+class FLVStreamReader(asyncore.dispatcher):
+    """
+    A dispatcher that parses the FLV stream it receives.
+
+    handle_tag gets called for every tag as soon as it's received and
+    handle_end once the stream is closed, with a flag telling whether it
+    ended cleanly on a tag boundary. A stream that turns out not to be a
+    valid FLV gets closed and ends as not clean. Reading can be suspended
+    with pause_reading, for instance when the tags can't be written out
+    fast enough.
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, sock=None, map=None, scan_level=SCAN_FULL,
+                 policy=None):
+        asyncore.dispatcher.__init__(self, sock, map)
+        self.parser = FLVParser(scan_level, policy)
+        self.paused = False
+        self.ended = False
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+    def readable(self):
+        return not self.paused
+
+    def writable(self):
+        # Needed to get notified when connecting completes
+        return not self.connected
+
+    def handle_connect(self):
+        pass
+
+    def handle_read(self):
+        data = self.recv(self.chunk_size)
+        if not data:
+            return
+        try:
+            tags = self.parser.feed(data)
+        except MalformedFLV, e:
+            message = e[0] % e[1:]
+            log.error("The stream is not a valid FLV stream: %s", message)
+            self.close()
+            self.end(False)
+            return
+        for tag in tags:
+            self.handle_tag(tag)
+
+    def handle_close(self):
+        self.close()
+        if self.ended:
+            return
+        try:
+            self.parser.close()
+        except EndOfFile:
+            log.warning("The stream ended in the middle of a tag")
+            self.end(False)
+        else:
+            self.end(True)
+
+    def end(self, complete):
+        # Make sure handle_end only gets called once
+        if not self.ended:
+            self.ended = True
+            self.handle_end(complete)
+
+    def handle_tag(self, tag):
+        pass
+
+    def handle_end(self, complete):
+        pass
+
+
+class FLVStreamWriter(asyncore.dispatcher):
+    """
+    A dispatcher that sends an FLV stream.
+
+    Data written is queued and sent when the socket is ready. When more
+    than high_water bytes are queued, should_pause returns True, and
+    handle_drain gets called once the queue drops to low_water bytes, so
+    producers can stop and restart instead of queueing without bounds.
+    """
+
+    chunk_size = 65536
+    high_water = 262144
+    low_water = 65536
+
+    def __init__(self, sock=None, map=None):
+        asyncore.dispatcher.__init__(self, sock, map)
+        self.queue = deque()
+        self.queued = 0
+        # How much of the first queued string has already been sent
+        self.sent = 0
+        self.draining = False
+        self.closing = False
+
+    def write(self, data):
+        if data:
+            self.queue.append(data)
+            self.queued += len(data)
+            if self.queued > self.high_water:
+                self.draining = True
+
+    def write_header(self, has_audio=True, has_video=True):
+        self.write(create_flv_header(has_audio, has_video))
+
+    def write_tag(self, tag_type, data, timestamp):
+        self.write(create_flv_tag(tag_type, data, timestamp))
+
+    def write_tags(self, tags):
+        """
+        Write a sequence of (tag_type, data, timestamp) tuples, serialized
+        together into one buffer.
+        """
+        self.write(create_flv_tags(tags))
+
+    def write_script_tag(self, name, data, timestamp=0):
+        self.write(create_script_tag(name, data, timestamp))
+
+    def should_pause(self):
+        return self.queued > self.high_water
+
+    def close_when_done(self):
+        """
+        Close the connection after everything queued has been sent.
+        """
+        self.closing = True
+        if not self.queue:
+            self.close()
+
+    def writable(self):
+        return bool(self.queue) or not self.connected
+
+    def handle_connect(self):
+        pass
+
+    def handle_read(self):
+        # Nothing is expected from the other side, this is here to notice
+        # when it closes the connection
+        self.recv(self.chunk_size)
+
+    def handle_write(self):
+        queue = self.queue
+        while queue:
+            data = queue[0]
+            sent = self.send(buffer(data, self.sent))
+            if not sent:
+                break
+            self.sent += sent
+            self.queued -= sent
+            if self.sent < len(data):
+                break
+            queue.popleft()
+            self.sent = 0
+
+        if self.draining and self.queued <= self.low_water:
+            self.draining = False
+            self.handle_drain()
+
+        if self.closing and not queue:
+            self.close()
+
+    def handle_drain(self):
+        pass
@@ -0,0 +1,167 @@
+import array
+from itertools import izip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from constants import *
+
+"""
+A columnar representation of the tags in an FLV file.
+"""
+
+# On most Unix systems an array of longs is 64 bits wide. Where it's not,
+# offsets in files bigger than 4 GB would overflow it, so store them as
+# doubles, which are exact up to 2^53.
+if array.array('L').itemsize >= 8:
+    OFFSET_TYPECODE = 'L'
+else:
+    OFFSET_TYPECODE = 'd'
+
+# The value stored in frame_types, codecs and packet_types for tags that do
+# not have the given field
+NO_VALUE = -1
+
+# Every tag has a header (11) and is followed by a PreviousTagSize (4)
+TAG_OVERHEAD = 15
+
+
+class TagTable(object):
+    """
+    The headers of all tags in an FLV file, stored column by column.
+
+    Every column is an array.array with one entry per tag. Frame types
+    are only present for video tags. Codecs are the sound format for audio
+    tags and the codec ID for video tags. Packet types are only present for
+    AAC and H.264 tags. Missing values are stored as NO_VALUE.
+
+    Queries return NumPy arrays if NumPy is available and array.arrays
+    otherwise.
+    """
+
+    columns = (('offsets', OFFSET_TYPECODE),
+               ('sizes', 'L'),
+               ('timestamps', 'l'),
+               ('tag_types', 'B'),
+               ('frame_types', 'b'),
+               ('codecs', 'b'),
+               ('packet_types', 'h'))
+
+    def __init__(self):
+        for name, typecode in self.columns:
+            setattr(self, name, array.array(typecode))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, tag_type, offset, size, timestamp, flags=None,
+               packet_type=None):
+        """
+        Add a tag, given its header, the first and the second byte of its
+        payload, as yielded by FLV.scan_tag_headers.
+        """
+        frame_type = codec = packet = NO_VALUE
+
+        if flags is not None:
+            if tag_type == TAG_TYPE_VIDEO:
+                frame_type = (flags & 0xF0) >> 4
+                codec = flags & 0xF
+                if codec == CODEC_ID_H264 and packet_type is not None:
+                    packet = packet_type
+            elif tag_type == TAG_TYPE_AUDIO:
+                codec = (flags & 0xF0) >> 4
+                if codec == SOUND_FORMAT_AAC and packet_type is not None:
+                    packet = packet_type
+
+        self.offsets.append(offset)
+        self.sizes.append(size)
+        self.timestamps.append(timestamp)
+        self.tag_types.append(tag_type)
+        self.frame_types.append(frame_type)
+        self.codecs.append(codec)
+        self.packet_types.append(packet)
+
+    def extend(self, other):
+        """
+        Add all tags from another table.
+        """
+        for name, typecode in self.columns:
+            getattr(self, name).extend(getattr(other, name))
+
+    def as_numpy(self, name):
+        """
+        Return a column as a NumPy array sharing memory with the table.
+        """
+        column = getattr(self, name)
+        return numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+
+    def select(self, name, tag_type=None, frame_type=None, codec=None,
+               packet_type=None):
+        """
+        Return the values of a column for the tags matching all the given
+        criteria. Criteria left as None match every tag.
+        """
+        criteria = [(column, value) for column, value in
+                    (('tag_types', tag_type), ('frame_types', frame_type),
+                     ('codecs', codec), ('packet_types', packet_type))
+                    if value is not None]
+
+        if numpy is not None:
+            values = self.as_numpy(name)
+            if not criteria:
+                return values.copy()
+            mask = numpy.ones(len(self), dtype=bool)
+            for column, value in criteria:
+                mask &= self.as_numpy(column) == value
+            return values[mask]
+
+        values = getattr(self, name)
+        selected = array.array(values.typecode)
+        if not criteria:
+            selected.extend(values)
+            return selected
+
+        matching = None
+        for column, value in criteria:
+            matches = [v == value for v in getattr(self, column)]
+            if matching is None:
+                matching = matches
+            else:
+                matching = [m1 and m2 for m1, m2 in izip(matching, matches)]
+        selected.extend([v for v, m in izip(values, matching) if m])
+        return selected
+
+    def keyframe_offsets(self):
+        return self.select('offsets', tag_type=TAG_TYPE_VIDEO,
+                           frame_type=FRAME_TYPE_KEYFRAME)
+
+    def keyframe_timestamps(self):
+        return self.select('timestamps', tag_type=TAG_TYPE_VIDEO,
+                           frame_type=FRAME_TYPE_KEYFRAME)
+
+    def timestamps_of(self, tag_type):
+        return self.select('timestamps', tag_type=tag_type)
+
+    def bytes_per_second(self):
+        """
+        Return the number of bytes taken up by tags, including their headers,
+        in every second of the file, indexed by second. Tags with negative
+        timestamps are counted in the first second.
+        """
+        if not len(self):
+            if numpy is not None:
+                return numpy.zeros(0, dtype=numpy.int64)
+            return []
+
+        if numpy is not None:
+            seconds = self.as_numpy('timestamps') // 1000
+            seconds = numpy.maximum(seconds, 0)
+            sizes = self.as_numpy('sizes') + TAG_OVERHEAD
+            return numpy.bincount(seconds, weights=sizes).astype(numpy.int64)
+
+        totals = [0] * (max(max(self.timestamps) // 1000, 0) + 1)
+        for timestamp, size in izip(self.timestamps, self.sizes):
+            totals[max(timestamp // 1000, 0)] += size + TAG_OVERHEAD
+        return totals
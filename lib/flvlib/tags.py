@@ -1,79 +1,234 @@
 import os
+import mmap
+import bisect
 import struct
 import logging
 
 from primitives import *
+from primitives import ui32_struct
 from constants import *
-from astypes import MalformedFLV
-from astypes import get_script_data_variable, make_script_data_variable
+from astypes import MalformedFLV, get_string
+from astypes import unpack_script_data_variable, write_script_data_variable
+from astypes import unpack_lazy_script_data_variable
+from table import TagTable
+from validation import ValidationPolicy
 
 log = logging.getLogger('flvlib.tags')
 
 STRICT_PARSING = False
-def strict_parser():
-    return globals()['STRICT_PARSING']
+
+
+class DefaultPolicy(ValidationPolicy):
+    """
+    The validation policy used unless another one is given. It's strict if
+    STRICT_PARSING is set and logs a warning for every failed check
+    otherwise.
+    """
+
+    def is_strict(self):
+        return STRICT_PARSING
+
+    def failed(self, error_msg, args):
+        if STRICT_PARSING:
+            raise MalformedFLV(error_msg, *args)
+        log.warning('Skipping non-conformant value in FLV file')
+
+    def warned(self, warning_msg, args):
+        log.warning(warning_msg, *args)
+
+default_policy = DefaultPolicy()
 
 
 class EndOfTags(Exception):
     pass
 
 
-def ensure(value, expected, error_msg):
-    if value == expected:
-        return
+# How much of each tag gets parsed: only the header, the header and the
+# codec flags of audio and video tags (and the names of script tags), or
+# everything, including the values of script tags
+(SCAN_HEADERS,
+ SCAN_FLAGS,
+ SCAN_FULL) = range(3)
 
-    if strict_parser():
-        raise MalformedFLV(error_msg)
-    else:
-        log.warning('Skipping non-conformant value in FLV file')
+
+# TagType (1) + DataSize (3) + Timestamp (3) + TimestampExtended (1) +
+# StreamID (3)
+TAG_HEADER_SIZE = 11
+
+# The tag header followed by the first byte of the tag's payload, which for
+# audio and video tags holds the codec flags. Reading both in one go means
+# a single read and a single unpack per tag.
+tag_header_struct = struct.Struct(">BBHBHBBHB")
+
+# The tag header alone, for writing tags
+tag_header_out_struct = struct.Struct(">BBHBHBBH")
+
+
+def unpack_tag_header(data, offset=0):
+    """
+    Decode a tag header and the first payload byte.
+
+    Returns a (tag_type, size, timestamp, stream_id, flags) tuple. The flags
+    byte is meaningless for tags with no payload, in that case it is None.
+    """
+    try:
+        (tag_type, size_high, size_low, time_high, time_low, time_ext,
+         stream_high, stream_low, flags) = \
+            tag_header_struct.unpack_from(data, offset)
+    except struct.error:
+        raise EndOfFile
+
+    size = (size_high << 16) | size_low
+    timestamp = (time_ext << 24) | (time_high << 16) | time_low
+    if timestamp & 0x80000000:
+        timestamp -= 0x100000000
+    if not size:
+        flags = None
+
+    return (tag_type, size, timestamp,
+            (stream_high << 16) | stream_low, flags)
+
+
+def ensure_previous_tag_size(previous_tag_size, size, policy=default_policy):
+    if previous_tag_size != size + TAG_HEADER_SIZE:
+        policy.failed("PreviousTagSize of %d (0x%08X) "
+                      "not equal to actual tag size of %d (0x%08X)",
+                      (previous_tag_size, previous_tag_size,
+                       size + TAG_HEADER_SIZE, size + TAG_HEADER_SIZE))
 
 
 class Tag(object):
 
+    # Files can have hundreds of thousands of tags, don't give each of them
+    # an instance dictionary
+    __slots__ = ('f', 'parent_flv', 'offset', 'size', 'timestamp',
+                 'header', 'first_byte', 'cached_payload')
+
     def __init__(self, parent_flv, f):
         self.f = f
         self.parent_flv = parent_flv
         self.offset = None
         self.size = None
         self.timestamp = None
+        # A (offset, size, timestamp, stream_id, flags) tuple, filled in by
+        # FLV.get_next_tag when it already read the header
+        self.header = None
+        # The first payload byte, if it was read together with the header
+        self.first_byte = None
+        self.cached_payload = None
 
     def parse(self):
         f = self.f
 
-        self.offset = f.tell() - 1
+        if self.header is None:
+            self.offset = f.tell() - 1
+
+            # DataSize
+            self.size = get_ui24(f)
 
-        # DataSize
-        self.size = get_ui24(f)
+            # Timestamp + TimestampExtended
+            self.timestamp = get_si32_extended(f)
 
-        # Timestamp + TimestampExtended
-        self.timestamp = get_si32_extended(f)
+            # StreamID
+            stream_id = get_ui24(f)
+        else:
+            (self.offset, self.size, self.timestamp,
+             stream_id, self.first_byte) = self.header
+            self.header = None
 
+        policy = self.get_policy()
         if self.timestamp < 0:
-            log.warning("The tag at offset 0x%08X has negative timestamp: %d",
+            policy.warn("The tag at offset 0x%08X has negative timestamp: %d",
                         self.offset, self.timestamp)
 
-        # StreamID
-        stream_id = get_ui24(f)
-        ensure(stream_id, 0, "StreamID non zero: 0x%06X" % stream_id)
+        policy.ensure(stream_id, 0, "StreamID non zero: 0x%06X", stream_id)
 
         # The rest gets parsed in the subclass, it should move f to the
         # correct position to read PreviousTagSize
-        self.parse_tag_content()
+        if self.get_scan_level() == SCAN_HEADERS:
+            Tag.parse_tag_content(self)
+        else:
+            self.parse_tag_content()
 
         previous_tag_size = get_ui32(f)
-        ensure(previous_tag_size, self.size + 11,
-               "PreviousTagSize of %d (0x%08X) "
-               "not equal to actual tag size of %d (0x%08X)" %
-               (previous_tag_size, previous_tag_size,
-                self.size + 11, self.size + 11))
+        ensure_previous_tag_size(previous_tag_size, self.size, policy)
 
     def parse_tag_content(self):
-        # By default just seek past the tag content
-        self.f.seek(self.size, os.SEEK_CUR)
+        # By default just seek past the tag content, taking into account
+        # the byte that might have been read together with the header
+        if self.first_byte is None:
+            self.f.seek(self.size, os.SEEK_CUR)
+        else:
+            self.f.seek(self.size - 1, os.SEEK_CUR)
+
+    def detach(self):
+        """
+        Drop the references to the file and the parent FLV, leaving only
+        the parsed fields.
+        """
+        self.f = None
+        self.parent_flv = None
+
+    def get_scan_level(self):
+        if self.parent_flv is None:
+            return SCAN_FULL
+        return self.parent_flv.scan_level
+
+    def get_policy(self):
+        if self.parent_flv is None:
+            return default_policy
+        return self.parent_flv.policy
+
+    def get_lazy_metadata(self):
+        if self.parent_flv is None:
+            return False
+        return self.parent_flv.lazy_metadata
+
+    def get_payload(self, cache=False):
+        """
+        Return the payload of the tag, loading it from the file. If the FLV
+        supports it, like MmapFLV does, it's a view of the file's data and
+        not a copy.
+
+        With cache set, the payload is kept in the tag and returned by later
+        calls, even after the tag gets detached.
+        """
+        if self.cached_payload is not None:
+            return self.cached_payload
+        payload = self.get_parent().get_payload(self)
+        if cache:
+            self.cached_payload = payload
+        return payload
+
+    payload = property(get_payload)
+
+    def get_raw_bytes(self):
+        """
+        Return the whole tag as stored in the file: the header, the payload
+        and the PreviousTagSize that follows them.
+        """
+        return self.get_parent().get_raw_bytes(self)
+
+    raw_bytes = property(get_raw_bytes)
+
+    def get_parent(self):
+        if self.parent_flv is None:
+            raise ValueError("The tag is detached from its file")
+        return self.parent_flv
+
+    def get_first_byte(self):
+        # Return the first byte of the payload, reading it from the file
+        # only if it was not read together with the header
+        if self.first_byte is None:
+            return get_ui8(self.f)
+        return self.first_byte
 
 
 class AudioTag(Tag):
 
+    __slots__ = ('sound_format', 'sound_rate', 'sound_size', 'sound_type',
+                 'aac_packet_type')
+
     def __init__(self, parent_flv, f):
         Tag.__init__(self, parent_flv, f)
         self.sound_format = None
@@ -85,7 +240,7 @@ class AudioTag(Tag):
     def parse_tag_content(self):
         f = self.f
 
-        sound_flags = get_ui8(f)
+        sound_flags = self.get_first_byte()
         read_bytes = 1
 
         self.sound_format = (sound_flags & 0xF0) >> 4
@@ -99,16 +254,17 @@ class AudioTag(Tag):
             # able to interpret the rest of the data.
             self.aac_packet_type = get_ui8(f)
             read_bytes += 1
+            policy = self.get_policy()
             # AAC always has sampling rate of 44 kHz
-            ensure(self.sound_rate, SOUND_RATE_44_KHZ,
-                   "AAC sound format with incorrect sound rate: %d" %
-                   self.sound_rate)
+            policy.ensure(self.sound_rate, SOUND_RATE_44_KHZ,
+                          "AAC sound format with incorrect sound rate: %d",
+                          self.sound_rate)
             # AAC is always stereo
-            ensure(self.sound_type, SOUND_TYPE_STEREO,
-                   "AAC sound format with incorrect sound type: %d" %
-                   self.sound_type)
+            policy.ensure(self.sound_type, SOUND_TYPE_STEREO,
+                          "AAC sound format with incorrect sound type: %d",
+                          self.sound_type)
 
-        if strict_parser():
+        if self.get_policy().is_strict():
             try:
                 sound_format_to_string[self.sound_format]
             except KeyError:
@@ -139,6 +295,8 @@ class AudioTag(Tag):
 
 class VideoTag(Tag):
 
+    __slots__ = ('frame_type', 'codec_id', 'h264_packet_type')
+
     def __init__(self, parent_flv, f):
         Tag.__init__(self, parent_flv, f)
         self.frame_type = None
@@ -148,7 +306,7 @@ class VideoTag(Tag):
     def parse_tag_content(self):
         f = self.f
 
-        video_flags = get_ui8(f)
+        video_flags = self.get_first_byte()
         read_bytes = 1
 
         self.frame_type = (video_flags & 0xF0) >> 4
@@ -160,7 +318,7 @@ class VideoTag(Tag):
             self.h264_packet_type = get_ui8(f)
             read_bytes += 1
 
-        if strict_parser():
+        if self.get_policy().is_strict():
             try:
                 frame_type_to_string[self.frame_type]
             except KeyError:
@@ -198,6 +356,8 @@ class VideoTag(Tag):
 
 class ScriptTag(Tag):
 
+    __slots__ = ('name', 'variable')
+
     def __init__(self, parent_flv, f):
         Tag.__init__(self, parent_flv, f)
         self.name = None
@@ -209,26 +369,49 @@ class ScriptTag(Tag):
         # Here there's always a byte with the value of 0x02,
         # which means "string", although the spec says NOTHING
         # about it..
-        value_type = get_ui8(f)
-        ensure(value_type, 2, "The name of a script tag is not a string")
-
-        # Need to pass the tag end offset, because apparently YouTube
+        value_type = self.get_first_byte()
+        self.get_policy().ensure(value_type, 2,
+                                 "The name of a script tag is not a string")
+
+        if self.get_scan_level() < SCAN_FULL:
+            # Just get the name and skip decoding the value
+            self.name = get_string(f)
+            # 3 = value type (1) + name length (2)
+            f.seek(self.size - 3 - len(self.name), os.SEEK_CUR)
+            return
+
+        # The rest of the payload gets decoded from a buffer
+        data_size = max(self.size - 1, 0)
+        data = f.read(data_size)
+        if len(data) < data_size:
+            raise EndOfFile
+
+        # Need to pass the payload end offset, because apparently YouTube
         # doesn't give a *shit* about the FLV spec and just happily
         # ends the onMetaData tag after self.size bytes, instead of
         # ending it with the *required* 0x09 marker. Bastards!
 
-        if strict_parser():
-            # If we're strict, just don't pass this info
-            tag_end = None
+        if self.get_policy().is_strict():
+            # If we're strict, just don't pass this info, so that a missing
+            # end marker is an error
+            data_end = None
         else:
-            # 11 = tag type (1) + data size (3) + timestamp (4) + stream id (3)
-            tag_end = self.offset + 11 + self.size
-            log.debug("max offset is 0x%08X", tag_end)
+            data_end = len(data)
 
-        self.name, self.variable = \
-                   get_script_data_variable(f, max_offset=tag_end)
-        log.debug("A script tag with a name of %s and value of %r",
-                  self.name, self.variable)
+        if self.get_lazy_metadata():
+            # Only skim the value, decoding the values of ECMA arrays and
+            # objects when they are accessed. Most readers only look at a
+            # few keys of onMetaData.
+            unpack_variable = unpack_lazy_script_data_variable
+        else:
+            unpack_variable = unpack_script_data_variable
+
+        (self.name, self.variable), offset = \
+                   unpack_variable(data, max_offset=data_end)
+        self.get_policy().ensure(offset, len(data),
+                                 "The script tag at offset 0x%08X has %d "
+                                 "bytes of trailing data", self.offset,
+                                 len(data) - offset)
 
     def __repr__(self):
         if self.offset is None:
@@ -240,6 +423,8 @@ class ScriptTag(Tag):
 
 class ScriptAMF3Tag(Tag):
 
+    __slots__ = ()
+
     def __repr__(self):
         if self.offset is None:
             return "<ScriptAMF3Tag unparsed>"
@@ -258,12 +443,21 @@ tag_to_class = {
 
 class FLV(object):
 
-    def __init__(self, f):
+    def __init__(self, f, scan_level=SCAN_FULL, policy=None,
+                 lazy_metadata=True):
         self.f = f
+        self.scan_level = scan_level
+        if policy is None:
+            policy = default_policy
+        self.policy = policy
+        # Whether script tags decode the values of ECMA arrays and objects
+        # only when they are accessed
+        self.lazy_metadata = lazy_metadata
         self.version = None
         self.has_audio = None
         self.has_video = None
         self.tags = []
+        self.keyframe_index = None
 
     def parse_header(self):
         f = self.f
@@ -286,10 +480,12 @@ class FLV(object):
         # TypeFlags
         flags = get_ui8(f)
 
-        ensure(flags & 0xF8, 0,
-               "First TypeFlagsReserved field non zero: 0x%X" % (flags & 0xF8))
-        ensure(flags & 0x2, 0,
-               "Second TypeFlagsReserved field non zero: 0x%X" % (flags & 0x2))
+        self.policy.ensure(flags & 0xF8, 0,
+                           "First TypeFlagsReserved field non zero: 0x%X",
+                           flags & 0xF8)
+        self.policy.ensure(flags & 0x2, 0,
+                           "Second TypeFlagsReserved field non zero: 0x%X",
+                           flags & 0x2)
 
         self.has_audio = False
         self.has_video = False
@@ -308,7 +504,8 @@ class FLV(object):
         f.seek(header_size)
 
         tag_0_size = get_ui32(f)
-        ensure(tag_0_size, 0, "PreviousTagSize0 non zero: 0x%08X" % tag_0_size)
+        self.policy.ensure(tag_0_size, 0, "PreviousTagSize0 non zero: 0x%08X",
+                           tag_0_size)
 
     def iter_tags(self):
         self.parse_header()
@@ -319,20 +516,167 @@ class FLV(object):
         except EndOfTags:
             pass
 
-    def read_tags(self):
-        self.tags = list(self.iter_tags())
+    def iter_tags_from(self, offset):
+        """
+        Iterate over the tags, starting with the one at the given offset.
+        """
+        self.parse_header()
+        self.f.seek(offset)
+        try:
+            while True:
+                tag = self.get_next_tag()
+                yield tag
+        except EndOfTags:
+            pass
 
-    def get_next_tag(self):
+    def iter_tags_reversed(self):
+        """
+        Iterate over the tags from the last one to the first, finding each
+        tag from the PreviousTagSize that follows it.
+        """
+        self.parse_header()
         f = self.f
 
-        try:
-            tag_type = get_ui8(f)
-        except EndOfFile:
+        first_tag_offset = f.tell()
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+
+        while end > first_tag_offset:
+            f.seek(end - 4)
+            previous_tag_size = get_ui32(f)
+            offset = end - 4 - previous_tag_size
+            if (previous_tag_size < TAG_HEADER_SIZE or
+                offset < first_tag_offset):
+                raise MalformedFLV("Invalid PreviousTagSize of %d "
+                                   "at offset 0x%08X",
+                                   previous_tag_size, end - 4)
+
+            tag = self.read_tag_at(offset)
+            # Going backwards relies on the sizes matching, so check it even
+            # when not parsing strictly
+            if tag.size + TAG_HEADER_SIZE != previous_tag_size:
+                raise MalformedFLV("PreviousTagSize of %d at offset 0x%08X "
+                                   "does not match the tag at 0x%08X",
+                                   previous_tag_size, end - 4, offset)
+            yield tag
+
+            end = offset
+
+    def get_last_timestamp(self):
+        """
+        Return the timestamp of the last audio or video tag, reading only
+        the end of the file, or None if there are no such tags.
+        """
+        for tag in self.iter_tags_reversed():
+            if isinstance(tag, (AudioTag, VideoTag)):
+                return tag.timestamp
+        return None
+
+    def read_tags(self):
+        # The stored tags do not need to keep the file and the FLV alive
+        tags = []
+        for tag in self.iter_tags():
+            tag.detach()
+            tags.append(tag)
+        self.tags = tags
+
+    def scan_tags(self):
+        """
+        Iterate over the tags without creating Tag objects.
+
+        Yields (tag_type, offset, size, timestamp, flags) tuples, where flags
+        is the first byte of the tag payload, or None for empty tags. Only
+        the headers are looked at, the payloads are skipped.
+        """
+        for (tag_type, offset, size, timestamp,
+             flags, packet_type) in self.scan_tag_headers():
+            yield (tag_type, offset, size, timestamp, flags)
+
+    def scan_tag_headers(self, offset=None, end=None):
+        """
+        Like scan_tags, but also yield the second byte of the payload, which
+        is the packet type of AAC and H.264 tags, or None for tags shorter
+        than two bytes.
+
+        If offset is given, scanning starts from the tag at that offset
+        instead of the first one. If end is given, it stops before the first
+        tag starting at or after it, without checking its header.
+        """
+        f = self.f
+        policy = self.policy
+        if offset is None:
+            self.parse_header()
+            offset = f.tell()
+        else:
+            f.seek(offset)
+
+        data = f.read(TAG_HEADER_SIZE + 2)
+        while data:
+            if end is not None and offset >= end:
+                break
+            tag_type, size, timestamp, stream_id, flags = \
+                unpack_tag_header(data)
+            self.tag_type_to_class(tag_type)
+            policy.ensure(stream_id, 0, "StreamID non zero: 0x%06X",
+                          stream_id)
+
+            if size > 1:
+                packet_type, _ = unpack_ui8(data, TAG_HEADER_SIZE + 1)
+            else:
+                packet_type = None
+
+            yield (tag_type, offset, size, timestamp, flags, packet_type)
+
+            # Skip the payload and read PreviousTagSize together with the
+            # next tag's header
+            f.seek(size - 2, os.SEEK_CUR)
+            data = f.read(4 + TAG_HEADER_SIZE + 2)
+            previous_tag_size, _ = unpack_ui32(data)
+            ensure_previous_tag_size(previous_tag_size, size, policy)
+            offset += size + TAG_HEADER_SIZE + 4
+            data = data[4:]
+
+    def read_table(self):
+        """
+        Read the headers of all tags into a TagTable, without creating Tag
+        objects.
+        """
+        table = TagTable()
+        append = table.append
+        for header in self.scan_tag_headers():
+            append(*header)
+        return table
+
+    def read_tag_header(self):
+        """
+        Read the header of the next tag.
+
+        Returns the tag type and an (offset, size, timestamp, stream_id,
+        flags) tuple, leaving the file positioned after the flags byte, or
+        right after the header if the tag is empty.
+        """
+        f = self.f
+
+        offset = f.tell()
+        data = f.read(TAG_HEADER_SIZE + 1)
+        if not data:
             raise EndOfTags
 
+        tag_type, size, timestamp, stream_id, flags = unpack_tag_header(data)
+
+        if flags is None:
+            # An empty tag, the last byte read belongs to PreviousTagSize
+            f.seek(-1, os.SEEK_CUR)
+
+        return tag_type, (offset, size, timestamp, stream_id, flags)
+
+    def get_next_tag(self):
+        tag_type, header = self.read_tag_header()
+
         tag_klass = self.tag_type_to_class(tag_type)
-        tag = tag_klass(self, f)
+        tag = tag_klass(self, self.f)
 
+        tag.header = header
         tag.parse()
 
         return tag
@@ -343,22 +687,338 @@ class FLV(object):
         except KeyError:
             raise MalformedFLV("Invalid tag type: %d", tag_type)
 
+    def read_tag_at(self, offset):
+        self.f.seek(offset)
+        return self.get_next_tag()
 
-def create_flv_tag(type, data, timestamp=0):
-    tag_type = struct.pack("B", type)
-    timestamp = make_si32_extended(timestamp)
-    stream_id = make_ui24(0)
+    def read_data(self, offset, size):
+        """
+        Read size bytes from offset. The file position is left unchanged, so
+        this can be used while iterating over the tags.
+        """
+        f = self.f
+        position = f.tell()
+        f.seek(offset)
+        data = f.read(size)
+        f.seek(position)
+        if len(data) < size:
+            raise EndOfFile
+        return data
+
+    def get_payload(self, tag):
+        return self.read_data(tag.offset + TAG_HEADER_SIZE, tag.size)
+
+    def get_raw_bytes(self, tag):
+        return self.read_data(tag.offset, TAG_HEADER_SIZE + tag.size + 4)
+
+    def get_keyframe_index(self):
+        """
+        Return the keyframes of the file as a (timestamps, offsets) pair of
+        sequences, with timestamps in milliseconds, or None if the file has
+        no keyframe index.
+
+        The keyframes come from the file's sidecar index, if there is an up
+        to date one, or else from the keyframes object of the onMetaData
+        tag, as written by index-flv.
+        """
+        if self.keyframe_index is None:
+            self.keyframe_index = (self.read_sidecar_keyframes() or
+                                   self.read_metadata_keyframes() or ())
+        return self.keyframe_index or None
+
+    def read_sidecar_keyframes(self):
+        # Avoid a circular import, the sidecar module uses FLV
+        from sidecar import read_index
+
+        path = getattr(self.f, 'name', None)
+        if not isinstance(path, basestring):
+            return None
+        index = read_index(path)
+        if index is None or not index.keyframe_offsets:
+            return None
+        return index.keyframe_timestamps, index.keyframe_offsets
+
+    def read_metadata_keyframes(self):
+        # The onMetaData tag is among the script tags at the beginning of
+        # the file. Parse it with a plain ScriptTag, it's not an actual step
+        # in iterating over the tags, with a plain FLV as its parent to
+        # decode its value whatever the scan level, but with this policy.
+        self.parse_header()
+        parent = FLV(self.f, policy=self.policy)
+        try:
+            while True:
+                tag_type, header = self.read_tag_header()
+                if tag_type != TAG_TYPE_SCRIPT:
+                    return None
+                tag = ScriptTag(parent, self.f)
+                tag.header = header
+                tag.parse()
+                if tag.name == 'onMetaData':
+                    break
+        except (EndOfTags, EndOfFile, MalformedFLV):
+            return None
 
-    data_size = len(data)
-    tag_size = data_size + 11
+        try:
+            keyframes = tag.variable['keyframes']
+            times = keyframes['times']
+            filepositions = keyframes['filepositions']
+            pairs = sorted([(int(round(time * 1000)), int(position))
+                            for time, position in zip(times, filepositions)])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not pairs:
+            return None
+        return [t for t, p in pairs], [p for t, p in pairs]
+
+    def find_keyframe(self, timestamp):
+        """
+        Find the last keyframe at or before the given timestamp, or the
+        first keyframe if the timestamp is before it, using the keyframe
+        index. Returns a (timestamp, offset) pair or None if the file has
+        no keyframe index.
+        """
+        index = self.get_keyframe_index()
+        if index is None:
+            return None
+        timestamps, offsets = index
+        i = max(bisect.bisect_right(timestamps, timestamp) - 1, 0)
+        return timestamps[i], offsets[i]
+
+    def seek_to_time(self, timestamp, scan=True):
+        """
+        Find the keyframe to start playing from to get to the given
+        timestamp, in milliseconds, and return it as a parsed tag.
+
+        The keyframe is looked up in the keyframe index and verified by
+        parsing the tag it points to. In files with no video, audio tags
+        serve as keyframes. If there is no index, or it does not match the
+        file, the tag headers get scanned from the beginning, unless scan is
+        false, in which case None is returned. None is also returned if no
+        keyframe is found at all.
+        """
+        self.parse_header()
 
-    return ''.join([tag_type, make_ui24(data_size), timestamp, stream_id,
-                    data, make_ui32(tag_size)])
+        keyframe = self.find_keyframe(timestamp)
+        if keyframe is not None:
+            try:
+                tag = self.read_tag_at(keyframe[1])
+            except (EndOfTags, EndOfFile, MalformedFLV):
+                tag = None
+            if tag is not None and self.is_seekpoint(tag):
+                return tag
+            log.warning("The keyframe index points to a tag at offset "
+                        "0x%08X which is not a keyframe", keyframe[1])
+
+        if not scan:
+            return None
+
+        keyframe_offset = None
+        audio_offset = None
+        for (tag_type, offset, size, tag_timestamp,
+             flags, packet_type) in self.scan_tag_headers():
+            if tag_type == TAG_TYPE_VIDEO:
+                if flags is None or (flags >> 4) != FRAME_TYPE_KEYFRAME:
+                    continue
+                if ((flags & 0xF) == CODEC_ID_H264 and
+                    packet_type != H264_PACKET_TYPE_NALU):
+                    continue
+                if tag_timestamp > timestamp and keyframe_offset is not None:
+                    break
+                keyframe_offset = offset
+            elif tag_type == TAG_TYPE_AUDIO and keyframe_offset is None:
+                if tag_timestamp > timestamp and audio_offset is not None:
+                    if not self.has_video:
+                        break
+                    continue
+                audio_offset = offset
+
+        if keyframe_offset is None:
+            keyframe_offset = audio_offset
+        if keyframe_offset is None:
+            return None
+        return self.read_tag_at(keyframe_offset)
+
+    def is_seekpoint(self, tag):
+        # A video keyframe, other than an H.264 sequence header or end, or,
+        # for files without video, any audio tag
+        if isinstance(tag, VideoTag):
+            return (tag.first_byte is not None and
+                    (tag.first_byte >> 4) == FRAME_TYPE_KEYFRAME and
+                    tag.h264_packet_type in (None, H264_PACKET_TYPE_NALU))
+        return isinstance(tag, AudioTag) and not self.has_video
+
+
+class MmapFLV(FLV):
+    """
+    An FLV backed by a memory map of the file.
+
+    Tags are located by offset arithmetic on the map instead of through file
+    reads and seeks, and their payloads are available as views into the map,
+    without copying.
+    """
+
+    def __init__(self, f, scan_level=SCAN_FULL, policy=None,
+                 lazy_metadata=True):
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses to map empty files
+            raise MalformedFLV("The file is shorter than 3 bytes")
+        self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        FLV.__init__(self, self.mmap, scan_level, policy, lazy_metadata)
+        self.end_offset = len(self.mmap)
+        # Python 2 mmap objects do not support memoryviews, fall back to
+        # buffer objects there
+        try:
+            self.view = memoryview(self.mmap)
+        except (NameError, TypeError):
+            self.view = None
+
+    def scan_tag_headers(self, offset=None, end=None):
+        m = self.mmap
+        policy = self.policy
+        if offset is None:
+            self.parse_header()
+            offset = m.tell()
+
+        if end is None or end > self.end_offset:
+            end = self.end_offset
+        while offset < end:
+            tag_type, size, timestamp, stream_id, flags = \
+                unpack_tag_header(m, offset)
+            self.tag_type_to_class(tag_type)
+            policy.ensure(stream_id, 0, "StreamID non zero: 0x%06X",
+                          stream_id)
+
+            if size > 1:
+                packet_type, _ = unpack_ui8(m, offset + TAG_HEADER_SIZE + 1)
+            else:
+                packet_type = None
+
+            yield (tag_type, offset, size, timestamp, flags, packet_type)
+
+            previous_tag_size, next_offset = \
+                unpack_ui32(m, offset + TAG_HEADER_SIZE + size)
+            ensure_previous_tag_size(previous_tag_size, size, policy)
+            offset = next_offset
+
+    def read_tag_header(self):
+        m = self.mmap
+
+        offset = m.tell()
+        if offset >= self.end_offset:
+            raise EndOfTags
+
+        tag_type, size, timestamp, stream_id, flags = \
+            unpack_tag_header(m, offset)
+
+        if flags is None:
+            m.seek(offset + TAG_HEADER_SIZE)
+        else:
+            m.seek(offset + TAG_HEADER_SIZE + 1)
+
+        return tag_type, (offset, size, timestamp, stream_id, flags)
+
+    def read_data(self, offset, size):
+        """
+        Return a view into the map instead of reading.
+        """
+        if offset + size > self.end_offset:
+            raise EndOfFile
+        if self.view is not None:
+            return self.view[offset:offset + size]
+        return buffer(self.mmap, offset, size)
+
+    def close(self):
+        self.view = None
+        self.mmap.close()
+
+
+def check_timestamp(timestamp):
+    # The masking below would silently wrap timestamps that do not fit in
+    # a signed 32-bit integer
+    if not -0x80000000 <= timestamp <= 0x7FFFFFFF:
+        raise ValueError("Timestamp out of range: %d" % timestamp)
+
+
+def make_tag_header(tag_type, size, timestamp):
+    # The timestamp is stored as its lower 24 bits followed by the upper 8
+    check_timestamp(timestamp)
+    return tag_header_out_struct.pack(tag_type, size >> 16, size & 0xFFFF,
+                                      (timestamp >> 16) & 0xFF,
+                                      timestamp & 0xFFFF,
+                                      (timestamp >> 24) & 0xFF, 0, 0)
+
+
+def pack_tag_header_into(buf, offset, tag_type, size, timestamp):
+    check_timestamp(timestamp)
+    tag_header_out_struct.pack_into(buf, offset, tag_type,
+                                    size >> 16, size & 0xFFFF,
+                                    (timestamp >> 16) & 0xFF,
+                                    timestamp & 0xFFFF,
+                                    (timestamp >> 24) & 0xFF, 0, 0)
+
+
+def create_flv_tag(type, data, timestamp=0):
+    data_size = len(data)
+    return ''.join([make_tag_header(type, data_size, timestamp), data,
+                    ui32_struct.pack(data_size + TAG_HEADER_SIZE)])
+
+
+def create_flv_tags(tags):
+    """
+    Serialize a sequence of (tag_type, data, timestamp) tuples into the
+    tags that create_flv_tag would produce for them, one after another.
+
+    All tags are written into a single bytearray, allocated once, which is
+    returned.
+    """
+    # The tags get iterated over twice, so iterators have to be consumed
+    # into a list first
+    tags = list(tags)
+    total_size = 0
+    for tag_type, data, timestamp in tags:
+        total_size += TAG_HEADER_SIZE + len(data) + 4
+
+    buf = bytearray(total_size)
+    pack_previous_tag_size = ui32_struct.pack_into
+    offset = 0
+    for tag_type, data, timestamp in tags:
+        size = len(data)
+        pack_tag_header_into(buf, offset, tag_type, size, timestamp)
+        offset += TAG_HEADER_SIZE
+        buf[offset:offset + size] = data
+        offset += size
+        pack_previous_tag_size(buf, offset, size + TAG_HEADER_SIZE)
+        offset += 4
+
+    return buf
+
+
+def create_flv_tag_chunks(tags):
+    """
+    Like create_flv_tags, but return a list of chunks that make up the tags
+    when written one after another, for instance with writelines. The
+    payloads are included as they are, without copying them.
+    """
+    chunks = []
+    append = chunks.append
+    for tag_type, data, timestamp in tags:
+        size = len(data)
+        append(make_tag_header(tag_type, size, timestamp))
+        append(data)
+        append(ui32_struct.pack(size + TAG_HEADER_SIZE))
+    return chunks
 
 
 def create_script_tag(name, data, timestamp=0):
-    payload = make_ui8(2) + make_script_data_variable(name, data)
-    return create_flv_tag(TAG_TYPE_SCRIPT, payload, timestamp)
+    # Encode the payload right after room for the header, so that the whole
+    # tag is built in one buffer
+    buf = bytearray(TAG_HEADER_SIZE)
+    buf.append(VALUE_TYPE_STRING)
+    write_script_data_variable(buf.extend, name, data)
+    size = len(buf) - TAG_HEADER_SIZE
+    pack_tag_header_into(buf, 0, TAG_TYPE_SCRIPT, size, timestamp)
+    buf.extend(ui32_struct.pack(size + TAG_HEADER_SIZE))
+    return str(buf)
 
 
 def create_flv_header(has_audio=True, has_video=True):
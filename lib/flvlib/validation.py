@@ -0,0 +1,126 @@
+import logging
+
+from astypes import MalformedFLV
+
+"""
+Policies deciding what to do with values in FLV files that do not conform
+to the specification.
+
+Checks are made with ensure, passing the error message as a format string
+and its arguments separately, so that the message only gets built when a
+check fails. Values that conform to the specification but are suspicious,
+like negative timestamps, are reported with warn, in the same way, and never
+make parsing fail.
+"""
+
+log = logging.getLogger('flvlib.validation')
+
+
+class ValidationPolicy(object):
+    """
+    The base validation policy, which ignores all failed checks and
+    warnings.
+
+    Subclasses override failed and warned, which get the message format and
+    its arguments.
+    """
+
+    strict = False
+
+    def ensure(self, value, expected, error_msg, *args):
+        if value != expected:
+            self.failed(error_msg, args)
+
+    def warn(self, warning_msg, *args):
+        self.warned(warning_msg, args)
+
+    def is_strict(self):
+        """
+        Whether parsing should check things that are only worth checking
+        when failures are fatal.
+        """
+        return self.strict
+
+    def failed(self, error_msg, args):
+        pass
+
+    def warned(self, warning_msg, args):
+        pass
+
+    def report(self):
+        """
+        Called after parsing a file, for policies that summarise what they
+        have seen.
+        """
+        pass
+
+
+class IgnorePolicy(ValidationPolicy):
+    """
+    Accept everything.
+    """
+
+
+class CountPolicy(ValidationPolicy):
+    """
+    Count failed checks and warnings, in total and by message format.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.warnings = 0
+        self.counts = {}
+
+    def failed(self, error_msg, args):
+        self.failures += 1
+        self.counts[error_msg] = self.counts.get(error_msg, 0) + 1
+
+    def warned(self, warning_msg, args):
+        self.warnings += 1
+        self.counts[warning_msg] = self.counts.get(warning_msg, 0) + 1
+
+
+class WarnPolicy(CountPolicy):
+    """
+    Log a warning the first time each kind of check fails or of warning
+    occurs and count the rest, logging the totals in report.
+    """
+
+    def __init__(self, logger=None):
+        CountPolicy.__init__(self)
+        self.log = logger or log
+        # The first message of each kind, as it was logged
+        self.first_messages = {}
+
+    def log_first(self, msg, args):
+        if msg not in self.counts:
+            self.first_messages[msg] = msg % args
+            self.log.warning(self.first_messages[msg])
+
+    def failed(self, error_msg, args):
+        self.log_first(error_msg, args)
+        CountPolicy.failed(self, error_msg, args)
+
+    def warned(self, warning_msg, args):
+        self.log_first(warning_msg, args)
+        CountPolicy.warned(self, warning_msg, args)
+
+    def report(self):
+        for error_msg, count in sorted(self.counts.items()):
+            if count > 1:
+                self.log.warning("%d more like: %s", count - 1,
+                                 self.first_messages[error_msg])
+
+
+class StrictPolicy(ValidationPolicy):
+    """
+    Reject files with any non-conformant value. Warnings are only logged.
+    """
+
+    strict = True
+
+    def failed(self, error_msg, args):
+        raise MalformedFLV(error_msg, *args)
+
+    def warned(self, warning_msg, args):
+        log.warning(warning_msg, *args)
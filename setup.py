@@ -81,7 +81,8 @@ sys.path = sys.path[1:]
 # Don't install man pages and the README on a non-Linux system
 if sys.platform == 'linux2':
     data_files = [('share/man/man1', ['man/debug-flv.1', 'man/index-flv.1',
-                                      'man/retimestamp-flv.1'])]
+                                      'man/retimestamp-flv.1',
+                                      'man/generate-flv.1'])]
 else:
     data_files = []
 
@@ -98,6 +99,31 @@ class test(Command):
         from test.test_flvlib import main
         main()
 
+# Define a `bench' command to run the benchmarks
+class bench(Command):
+    description = "run the benchmark suite"
+    user_options = [('sizes=', 's',
+                     "comma separated sizes of the files to use, in MB"),
+                    ('repeat=', 'r', "number of runs of every benchmark"),
+                    ('benchmarks=', 'b',
+                     "comma separated names of the benchmarks to run")]
+
+    def initialize_options(self):
+        self.sizes = None
+        self.repeat = 3
+        self.benchmarks = None
+
+    def finalize_options(self):
+        if self.sizes is not None:
+            self.sizes = [int(size) for size in self.sizes.split(',')]
+        self.repeat = int(self.repeat)
+        if self.benchmarks is not None:
+            self.benchmarks = self.benchmarks.split(',')
+
+    def run(self):
+        from bench.bench_flvlib import main, DEFAULT_SIZES
+        main(self.sizes or DEFAULT_SIZES, self.repeat, self.benchmarks)
+
 setup(name="flvlib",
       version=__versionstr__,
       description="Parsing, manipulating and indexing FLV files",
@@ -124,6 +150,7 @@ setup(name="flvlib",
       package_dir={'': 'lib'},
       packages=["flvlib", "flvlib.scripts"],
       scripts=["scripts/debug-flv", "scripts/index-flv",
-               "scripts/retimestamp-flv", "scripts/cut-flv"],
+               "scripts/retimestamp-flv", "scripts/cut-flv",
+               "scripts/generate-flv"],
       data_files=data_files,
-      cmdclass={'test': test})
+      cmdclass={'test': test, 'bench': bench})
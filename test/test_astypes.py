@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import unittest
 from StringIO import StringIO
 from datetime import datetime, timedelta, tzinfo
 from test_common import SerializerTester
@@ -18,7 +19,22 @@ class FakeTZInfo(tzinfo):
         return "Fake Timezone"
 
 
-class ScriptDataValueSerializerTester(SerializerTester):
+class UnpackTester(object):
+
+    def run_unpack_tests(self):
+        # The buffer based decoder should give the same results
+        unpacker, maker = (getattr(self.module, 'unpack_' + self.name),
+                           getattr(self.module, 'make_' + self.name))
+        for input, expected in self.get_tests:
+            self.assertEquals(unpacker(input), (expected, len(input)))
+            self.assertEquals(unpacker('xx' + input, 2),
+                              (expected, len(input) + 2))
+        for value in self.equivalence_tests:
+            blob = maker(value)
+            self.assertEquals(unpacker(blob), (value, len(blob)))
+
+
+class ScriptDataValueSerializerTester(SerializerTester, UnpackTester):
 
     def run_tests(self):
         SerializerTester.run_tests(self)
@@ -30,11 +46,15 @@ class ScriptDataValueSerializerTester(SerializerTester):
         for value in self.equivalence_tests:
             self.script_data_value_equivalent(value, getter, maker, value_type)
 
+        self.run_unpack_tests()
+
     def script_data_value_equivalent(self, val, getter, maker, value_type):
         s = StringIO(primitives.make_ui8(value_type) + maker(val))
         self.assertEquals(astypes.make_script_data_value(val), s.getvalue())
         self.assertEquals(val, astypes.get_script_data_value(s))
         self.assertEquals(s.read(), '')
+        self.assertEquals(astypes.unpack_script_data_value(s.getvalue()),
+                          (val, len(s.getvalue())))
 
 
 class TestASTypes(ScriptDataValueSerializerTester):
@@ -73,6 +93,10 @@ class TestASTypes(ScriptDataValueSerializerTester):
         self.add_equivalence_test('')
         self.run_tests()
 
+        # A string longer than the buffer
+        self.assertRaises(primitives.EndOfFile, astypes.unpack_string,
+                          '\x00\x05ab')
+
     def test_longstring(self):
         self.set_name('longstring')
         self.add_get_test('\x00\x00\x00\x0btest string', 'test string')
@@ -125,6 +149,12 @@ class TestASTypes(ScriptDataValueSerializerTester):
         # try not using the max_offset kwarg and removing the marker, should fail
         self.assertRaises(primitives.EndOfFile, astypes.get_ecma_array, StringIO('\x00\x00\x00\x04\x00\x00\x01\x00\x00\x01 \x00\x40\x08\x00\x00\x00\x00\x00\x00\x00\x03goo\x02\x00\x02λ\x00\x00'))
 
+        # the same with the buffer based decoder
+        blob = '\x00\x00\x00\x04\x00\x00\x01\x00\x00\x01 \x00\x40\x08\x00\x00\x00\x00\x00\x00\x00\x03goo\x02\x00\x02λ\x00\x00'
+        self.assertEquals(astypes.unpack_ecma_array(blob, max_offset=30), ({'': False, ' ': 3, 'goo': u'λ'.encode('utf-8')}, 30))
+        self.assertRaises(primitives.EndOfFile, astypes.unpack_ecma_array, blob)
+        self.assertRaises(primitives.EndOfFile, astypes.unpack_ecma_array, '\x00\x00')
+
     def test_strict_array(self):
         self.set_name('strict_array')
         self.add_get_test('\x00\x00\x00\x01\x00\x3f\xf0\x00\x00\x00\x00\x00\x00', [1])
@@ -208,6 +238,11 @@ class TestASTypes(ScriptDataValueSerializerTester):
         # try not using the max_offset kwarg and removing the marker, should fail
         self.assertRaises(primitives.EndOfFile, astypes.get_object, StringIO('\x00\x00\x01\x00\x00\x01 \x00\x40\x08\x00\x00\x00\x00\x00\x00\x00\x03goo\x02\x00\x02λ\x00\x00'))
 
+        # the same with the buffer based decoder
+        blob = '\x00\x00\x01\x00\x00\x01 \x00\x40\x08\x00\x00\x00\x00\x00\x00\x00\x03goo\x02\x00\x02λ\x00\x00'
+        self.assertEquals(astypes.unpack_object(blob, max_offset=26), (o, 26))
+        self.assertRaises(primitives.EndOfFile, astypes.unpack_object, blob)
+
     def test_movieclip(self):
         self.set_name('movieclip')
         self.add_get_test('\x00\x0d/path/to/clip', astypes.MovieClip('/path/to/clip'))
@@ -240,12 +275,16 @@ class TestASTypes(ScriptDataValueSerializerTester):
         self.assertEquals(repr(astypes.Reference(1)), '<Reference to 1>')
 
 
-class TestScriptSerialization(SerializerTester):
+class TestScriptSerialization(SerializerTester, UnpackTester):
 
     def setUp(self):
         SerializerTester.setUp(self)
         self.module = astypes
 
+    def run_tests(self):
+        SerializerTester.run_tests(self)
+        self.run_unpack_tests()
+
     def test_script_data_value(self):
         self.set_name('script_data_value')
         self.add_get_test('\x08\x00\x00\x00\x01\x00\x03\x66\x6f\x6f\x0a\x00\x00\x00\x03\x01\x00\x05\x0a\x00\x00\x00\x01\x00\x40\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x09', {'foo': [False, None, [3.5]]})
@@ -260,6 +299,7 @@ class TestScriptSerialization(SerializerTester):
 
         # Invalid value type
         self.assertRaises(astypes.MalformedFLV, astypes.get_script_data_value, StringIO('\x09\x00\x00\x00\x01\x00\x03\x66\x6f\x6f\x0a\x00\x00\x00\x03\x01\x00\x05\x0a\x00\x00\x00\x01\x00\x40\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x09'))
+        self.assertRaises(astypes.MalformedFLV, astypes.unpack_script_data_value, '\x09\x00\x00\x00\x01\x00\x03\x66\x6f\x6f\x0a\x00\x00\x00\x03\x01\x00\x05\x0a\x00\x00\x00\x01\x00\x40\x0c\x00\x00\x00\x00\x00\x00\x00\x00\x09')
 
     def test_script_data_variable(self):
         self.set_name('script_data_variable')
@@ -268,3 +308,175 @@ class TestScriptSerialization(SerializerTester):
 
         # can't just add a maker test, because it expects the maker to accept only one argument
         self.assertEquals(astypes.make_script_data_variable('variable name', [1, 2, '3']), '\x00\x0d\x76\x61\x72\x69\x61\x62\x6c\x65\x20\x6e\x61\x6d\x65\x0a\x00\x00\x00\x03\x00\x3f\xf0\x00\x00\x00\x00\x00\x00\x00\x40\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01\x33')
+
+
+class TestWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.value = astypes.ECMAArray()
+        self.value['duration'] = 10.5
+        self.value['keyframes'] = astypes.FLVObject()
+        self.value['keyframes'].times = [0.0, 5.0]
+        self.value['name'] = u'λ'
+        self.blob = astypes.make_script_data_value(self.value)
+
+    def test_write_to_file(self):
+        s = StringIO()
+        astypes.write_script_data_value(s.write, self.value)
+        self.assertEquals(s.getvalue(), self.blob)
+
+    def test_write_to_bytearray(self):
+        buf = bytearray('prefix')
+        astypes.write_script_data_value(buf.extend, self.value)
+        self.assertEquals(str(buf), 'prefix' + self.blob)
+
+    def test_encoded_value(self):
+        encoded = astypes.EncodedValue(self.value['keyframes'])
+        self.assertEquals(encoded.data, astypes.make_script_data_value(
+                self.value['keyframes']))
+
+        self.value['keyframes'] = encoded
+        self.assertEquals(astypes.make_script_data_value(self.value),
+                          self.blob)
+        self.assertEquals(astypes.make_script_data_value([encoded, 1]),
+                          astypes.make_script_data_value(
+                [astypes.get_script_data_value(StringIO(encoded.data)), 1]))
+
+
+class TestLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.value = astypes.ECMAArray()
+        self.value['duration'] = 10.5
+        self.value['keyframes'] = astypes.FLVObject()
+        self.value['keyframes'].times = [0.0, 5.0]
+        self.value['keyframes'].filepositions = [13.0, 4096.0]
+        self.value['created'] = datetime(2009, 01, 01, 20, 0, 0,
+                                         tzinfo=FakeTZInfo(10))
+        self.value['extra'] = [astypes.Undefined(), None, True,
+                               astypes.Reference(3), 'foo',
+                               astypes.MovieClip('/bar'), {'baz': 1.0}]
+        self.blob = astypes.make_script_data_value(self.value)
+
+    def test_skip(self):
+        self.assertEquals(astypes.skip_script_data_value(self.blob),
+                          len(self.blob))
+        self.assertEquals(astypes.skip_script_data_value(self.blob + 'x'),
+                          len(self.blob))
+        self.assertEquals(astypes.skip_script_data_value(
+                '\x0c\x00\x00\x00\x03foo'), 8)
+        self.assertRaises(astypes.EndOfFile, astypes.skip_script_data_value,
+                          self.blob[:-4])
+        self.assertRaises(astypes.EndOfFile, astypes.skip_script_data_value,
+                          '\x00\x40')
+        self.assertRaises(astypes.MalformedFLV,
+                          astypes.skip_script_data_value, '\x0e')
+
+    def test_equivalence(self):
+        value, offset = astypes.unpack_lazy_script_data_value(self.blob)
+        self.assertEquals(offset, len(self.blob))
+        self.assertTrue(isinstance(value, astypes.LazyECMAArray))
+        self.assertEquals(value, self.value)
+        self.assertEquals(value, astypes.unpack_script_data_value(self.blob)[0])
+        self.assertEquals(astypes.make_script_data_value(value), self.blob)
+
+        # other values get decoded right away
+        self.assertEquals(astypes.unpack_lazy_script_data_value(
+                '\x00\x40\x00\x00\x00\x00\x00\x00\x00'), (2.0, 9))
+
+    def test_decoding_on_access(self):
+        value, _ = astypes.unpack_lazy_script_data_value(self.blob)
+        self.assertEquals(value.keys(), ['duration', 'keyframes', 'created',
+                                         'extra'])
+        self.assertTrue('keyframes' in value)
+        self.assertFalse('missing' in value)
+        self.assertFalse(value.is_loaded('keyframes'))
+
+        keyframes = value.keyframes
+        self.assertTrue(value.is_loaded('keyframes'))
+        self.assertTrue(isinstance(keyframes, astypes.LazyFLVObject))
+        self.assertTrue(value['keyframes'] is keyframes)
+        self.assertFalse(keyframes.is_loaded('times'))
+        self.assertEquals(keyframes.filepositions, [13.0, 4096.0])
+        self.assertFalse(keyframes.is_loaded('times'))
+        self.assertFalse(value.is_loaded('duration'))
+
+        self.assertRaises(KeyError, value.__getitem__, 'missing')
+        self.assertRaises(AttributeError, getattr, value, 'missing')
+
+    def test_modification(self):
+        value, _ = astypes.unpack_lazy_script_data_value(self.blob)
+        value['keyframes'] = [1.0]
+        value.duration = 20.0
+        del value['created']
+        value['new'] = 'x'
+        self.assertFalse(value.is_loaded('extra'))
+
+        self.assertEquals(value.keys(), ['duration', 'keyframes', 'extra',
+                                         'new'])
+        self.assertEquals(value.keyframes, [1.0])
+        self.assertEquals(value.duration, 20.0)
+        self.assertRaises(KeyError, value.__delitem__, 'created')
+        self.assertEquals(value.extra, self.value.extra)
+
+    def test_max_offset(self):
+        # an ECMA array without the end marker
+        blob = ('\x08\x00\x00\x00\x01\x00\x08duration'
+                '\x00\x3f\xf0\x00\x00\x00\x00\x00\x00')
+        value, offset = astypes.unpack_lazy_script_data_value(
+            blob, max_offset=len(blob))
+        self.assertEquals(offset, len(blob))
+        self.assertEquals(value, {'duration': 1.0})
+        self.assertRaises(astypes.EndOfFile,
+                          astypes.unpack_lazy_script_data_value, blob)
+
+    def test_duplicate_keys(self):
+        # the last value wins, in the position of the first one
+        blob = ('\x03\x00\x01a\x00\x3f\xf0\x00\x00\x00\x00\x00\x00'
+                '\x00\x01b\x05'
+                '\x00\x01a\x00\x40\x00\x00\x00\x00\x00\x00\x00'
+                '\x00\x00\x09')
+        value, _ = astypes.unpack_lazy_script_data_value(blob)
+        self.assertEquals(value.items(), [('a', 2.0), ('b', None)])
+        self.assertEquals(value, astypes.unpack_script_data_value(blob)[0])
+
+
+class TestNumberArrays(unittest.TestCase):
+
+    def test_bulk(self):
+        numbers = [0.0, -1.5, 1e300, float('inf'), 65536.0]
+        blob = astypes.make_strict_array(numbers)
+        self.assertTrue(astypes.is_number_array(blob, 4, len(numbers)))
+        self.assertEquals(astypes.unpack_strict_array(blob),
+                          (numbers, len(blob)))
+        self.assertEquals(astypes.unpack_strict_array('x' + blob, 1),
+                          (numbers, len(blob) + 1))
+        self.assertEquals(astypes.skip_strict_array(blob), len(blob))
+
+        value, offset = astypes.unpack_strict_array(blob)
+        self.assertTrue(isinstance(value, list))
+        self.assertEquals(astypes.make_strict_array(value), blob)
+
+    def test_fallback(self):
+        # mixed types
+        mixed = [1.0, 2.0, 'foo', 3.0]
+        blob = astypes.make_strict_array(mixed)
+        self.assertFalse(astypes.is_number_array(blob, 4, len(mixed)))
+        self.assertEquals(astypes.unpack_strict_array(blob),
+                          (mixed, len(blob)))
+        self.assertEquals(astypes.skip_strict_array(blob), len(blob))
+
+        # a string of zero bytes, followed by a number
+        mixed = ['\x00' * 8, 1.0]
+        blob = astypes.make_strict_array(mixed)
+        self.assertEquals(astypes.unpack_strict_array(blob),
+                          (mixed, len(blob)))
+
+        # empty and truncated arrays
+        self.assertEquals(astypes.unpack_strict_array('\x00\x00\x00\x00'),
+                          ([], 4))
+        blob = astypes.make_strict_array([1.0, 2.0])
+        self.assertRaises(astypes.EndOfFile, astypes.unpack_strict_array,
+                          blob[:-1])
+        self.assertRaises(astypes.EndOfFile, astypes.skip_strict_array,
+                          blob[:-1])
@@ -1,8 +1,14 @@
 import unittest
-import test_primitives, test_astypes, test_helpers, test_tags
+import test_primitives, test_astypes, test_helpers, test_tags, test_table
+import test_sidecar, test_follow, test_parser
+import test_stream, test_parallel, test_recovery, test_validation
+import test_instrument, test_generate, test_scripts
 
 def get_suite():
-    modules = (test_primitives, test_astypes, test_helpers, test_tags)
+    modules = (test_primitives, test_astypes, test_helpers, test_tags,
+               test_table, test_sidecar, test_follow, test_parser,
+               test_stream, test_parallel, test_recovery, test_validation,
+               test_instrument, test_generate, test_scripts)
     suites = [unittest.TestLoader().loadTestsFromModule(module) for
               module in modules]
     return unittest.TestSuite(suites)
@@ -0,0 +1,91 @@
+import os
+import unittest
+import tempfile
+
+from flvlib import constants, tags, follow
+
+
+class TestFollowingFLV(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.writer = os.fdopen(fd, 'wb')
+        self.reader = open(self.path, 'rb')
+        self.tags = [
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', 0),
+            tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 0),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x22v', 40),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', 80),
+            tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 90)]
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+        os.remove(self.path)
+
+    def write(self, data):
+        self.writer.write(data)
+        self.writer.flush()
+
+    def follow(self, flv):
+        return list(flv.follow_tags(idle_timeout=0))
+
+    def test_follow(self):
+        flv = follow.FollowingFLV(self.reader, poll_interval=0)
+
+        # no header yet
+        self.write('FLV\x01\x05')
+        self.assertEquals(self.follow(flv), [])
+        self.assertTrue(flv.next_offset is None)
+
+        header = tags.create_flv_header()
+        self.write(header[5:] + self.tags[0] + self.tags[1][:7])
+        followed = self.follow(flv)
+        self.assertEquals([t.offset for t in followed], [13])
+        self.assertEquals(flv.next_offset, 13 + len(self.tags[0]))
+
+        # the second tag is missing its PreviousTagSize
+        self.write(self.tags[1][7:-1])
+        self.assertEquals(self.follow(flv), [])
+
+        self.write(self.tags[1][-1:] + ''.join(self.tags[2:4]))
+        followed = self.follow(flv)
+        self.assertEquals([t.timestamp for t in followed], [0, 40, 80])
+        self.assertEquals(flv.keyframes.times, [0.0, 0.08])
+        self.assertEquals(flv.get_duration(), 0.08)
+
+        self.write(self.tags[4])
+        followed = self.follow(flv)
+        self.assertEquals([t.timestamp for t in followed], [90])
+        self.assertEquals(flv.keyframes.filepositions,
+                          [13, 13 + sum(map(len, self.tags[:3]))])
+        self.assertEquals(flv.get_duration(), 0.09)
+
+    def test_resume(self):
+        self.write(tags.create_flv_header() + ''.join(self.tags))
+        offset = 13 + sum(map(len, self.tags[:3]))
+
+        flv = follow.FollowingFLV(self.reader, poll_interval=0,
+                                  next_offset=offset)
+        followed = self.follow(flv)
+        self.assertEquals([t.offset for t in followed],
+                          [offset, offset + len(self.tags[3])])
+        self.assertEquals(flv.has_video, True)
+
+    def test_audio_only(self):
+        audio = [tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa',
+                                     i * 20)
+                 for i in range(25)]
+        self.write(tags.create_flv_header(has_video=False) +
+                   ''.join(audio[:15]))
+
+        flv = follow.FollowingFLV(self.reader, poll_interval=0)
+        self.follow(flv)
+        self.assertEquals(flv.keyframes.times, [0.18])
+        self.assertEquals(flv.keyframes.filepositions,
+                          [13 + sum(map(len, audio[:9]))])
+
+        self.write(''.join(audio[15:]))
+        self.follow(flv)
+        self.assertEquals(flv.keyframes.times, [0.18, 0.38])
+        self.assertEquals(flv.get_duration(), 0.48)
@@ -0,0 +1,133 @@
+import logging
+import unittest
+from StringIO import StringIO
+
+import test_common
+
+from flvlib import constants, tags, generate, recovery
+
+
+class TestGenerate(unittest.TestCase):
+
+    def generate(self, **kwargs):
+        f = StringIO()
+        written = generate.FLVGenerator(**kwargs).write(f)
+        self.assertEquals(written, len(f.getvalue()))
+        return f.getvalue()
+
+    def read(self, data):
+        flv = tags.FLV(StringIO(data))
+        return flv, list(flv.iter_tags())
+
+    def test_default(self):
+        flv, read = self.read(self.generate(duration=4000))
+        self.assertTrue(flv.has_audio)
+        self.assertTrue(flv.has_video)
+
+        self.assertEquals(read[0].name, 'onMetaData')
+        self.assertEquals(read[0].variable['duration'], 4.0)
+        self.assertEquals(read[1].h264_packet_type,
+                          constants.H264_PACKET_TYPE_SEQUENCE_HEADER)
+        self.assertEquals(read[3].aac_packet_type,
+                          constants.AAC_PACKET_TYPE_SEQUENCE_HEADER)
+
+        video = [tag for tag in read if isinstance(tag, tags.VideoTag)]
+        audio = [tag for tag in read if isinstance(tag, tags.AudioTag)]
+        # 25 frames per second and the sequence header
+        self.assertEquals(len(video), 101)
+        # 1024 samples at 44.1 kHz and the sequence header
+        self.assertEquals(len(audio), 174)
+
+        keyframes = [tag.timestamp for tag in video
+                     if tag.frame_type == constants.FRAME_TYPE_KEYFRAME and
+                     tag.h264_packet_type == constants.H264_PACKET_TYPE_NALU]
+        self.assertEquals(keyframes, [0, 2000])
+
+        timestamps = [tag.timestamp for tag in read]
+        self.assertEquals(timestamps, sorted(timestamps))
+        self.assertTrue(timestamps[-1] < 4000)
+
+    def test_bitrate(self):
+        data = self.generate(duration=10000, video_bitrate=800000,
+                             audio_bitrate=64000)
+        # Within a few percent of the bitrates
+        self.assertTrue(abs(len(data) - 1080000) < 50000)
+
+        # Over a whole period the sine shape averages to the bitrate
+        constant = self.generate(duration=generate.SINE_PERIOD,
+                                 video_bitrate=80000, audio_bitrate=16000)
+        sine = self.generate(duration=generate.SINE_PERIOD,
+                             video_bitrate=80000, audio_bitrate=16000,
+                             bitrate_shape=generate.BITRATE_SINE)
+        self.assertTrue(abs(len(sine) - len(constant)) < len(constant) / 50)
+
+    def test_codecs(self):
+        flv, read = self.read(self.generate(
+                duration=1000, sound_format=constants.SOUND_FORMAT_MP3,
+                codec_id=constants.CODEC_ID_VP6,
+                bitrate_shape=generate.BITRATE_RANDOM))
+        self.assertEquals(
+            set([tag.sound_format for tag in read
+                 if isinstance(tag, tags.AudioTag)]),
+            set([constants.SOUND_FORMAT_MP3]))
+        video = [tag for tag in read if isinstance(tag, tags.VideoTag)]
+        self.assertEquals(set([tag.codec_id for tag in video]),
+                          set([constants.CODEC_ID_VP6]))
+        self.assertEquals(video[0].frame_type, constants.FRAME_TYPE_KEYFRAME)
+        self.assertEquals(video[1].frame_type,
+                          constants.FRAME_TYPE_INTERFRAME)
+
+        self.assertRaises(ValueError, generate.FLVGenerator,
+                          codec_id=constants.CODEC_ID_JPEG)
+
+    def test_audio_only(self):
+        flv, read = self.read(self.generate(duration=1000, has_video=False,
+                                            metadata=generate.METADATA_NONE))
+        self.assertFalse(flv.has_video)
+        self.assertTrue(read)
+        for tag in read:
+            self.assertTrue(isinstance(tag, tags.AudioTag))
+
+    def test_gaps(self):
+        flv, read = self.read(self.generate(duration=3000,
+                                            gaps=[(1000, 5000)]))
+        timestamps = [tag.timestamp for tag in read]
+        self.assertEquals([t for t in timestamps if 1000 <= t < 6000], [])
+        self.assertEquals(min([t for t in timestamps if t >= 6000]), 6000)
+        self.assertTrue(timestamps[-1] >= 7900)
+
+    def test_trailing_metadata(self):
+        flv, read = self.read(self.generate(duration=1000,
+                                            metadata=generate.METADATA_BOTH))
+        self.assertTrue(isinstance(read[0], tags.ScriptTag))
+        self.assertTrue(isinstance(read[-1], tags.ScriptTag))
+        self.assertEquals(read[-1].timestamp, 0)
+
+        flv, read = self.read(self.generate(duration=1000,
+                                            metadata=generate.METADATA_END))
+        self.assertFalse(isinstance(read[0], tags.ScriptTag))
+        self.assertTrue(isinstance(read[-1], tags.ScriptTag))
+
+    def test_corrupt(self):
+        data = self.generate(duration=3000, corrupt=[1000, 2000])
+        clean_flv, clean = self.read(self.generate(duration=3000))
+
+        filter = test_common.WarningCounterFilter()
+        logging.getLogger('flvlib.recovery').addFilter(filter)
+        try:
+            flv = recovery.RecoveringFLV(StringIO(data))
+            read = list(flv.iter_tags())
+        finally:
+            logging.getLogger('flvlib.recovery').removeFilter(filter)
+
+        self.assertEquals(len(flv.skipped), 2)
+        # The corrupted tags have the same sizes as the real ones
+        self.assertEquals(len(data), len(clean_flv.f.getvalue()))
+        self.assertEquals(len(read), len(clean) - 2)
+        self.assertEquals(read[-1].offset, clean[-1].offset)
+
+    def test_seed(self):
+        self.assertEquals(self.generate(duration=1000, seed=3),
+                          self.generate(duration=1000, seed=3))
+        self.assertNotEquals(self.generate(duration=1000, seed=3),
+                             self.generate(duration=1000, seed=4))
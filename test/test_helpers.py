@@ -2,8 +2,13 @@
 
 import unittest
 
+import os
 import sys
+import time
+import signal
 import datetime
+import subprocess
+import tempfile
 from StringIO import StringIO
 
 from flvlib import helpers
@@ -204,6 +209,48 @@ class TestOrderedAttrDict(unittest.TestCase):
         o[(1, 2, u'3')] = 5
         self.assertEquals(o[(1, 2, u'3')], 5)
 
+    def test_deferred(self):
+        loaded = []
+
+        class Deferred(helpers.OrderedAttrDict):
+            def load_value(self, key, token):
+                loaded.append(key)
+                return token * 2
+
+        o = Deferred()
+        o.a = 1
+        o.defer_value('b', 2)
+        o.defer_value('c', 3)
+        o.defer_value('d', 4)
+        self.assertEquals(o.keys(), ['a', 'b', 'c', 'd'])
+        self.assertTrue('b' in o)
+        self.assertTrue(o.has_key('c'))
+        self.assertFalse(o.is_loaded('b'))
+        self.assertTrue(o.is_loaded('a'))
+        self.assertEquals(loaded, [])
+
+        self.assertEquals(o.b, 4)
+        self.assertEquals(o['b'], 4)
+        self.assertTrue(o.is_loaded('b'))
+        self.assertEquals(loaded, ['b'])
+
+        # setting or deleting a deferred value never loads it
+        o.c = 'c'
+        del o['d']
+        self.assertEquals(o.keys(), ['a', 'b', 'c'])
+        self.assertEquals(o.c, 'c')
+        self.assertEquals(loaded, ['b'])
+
+        # deferring an existing key keeps its position
+        o.defer_value('a', 5)
+        self.assertEquals(o.keys(), ['a', 'b', 'c'])
+        self.assertEquals(o.items(), [('a', 10), ('b', 4), ('c', 'c')])
+        self.assertEquals(loaded, ['b', 'a'])
+
+        self.assertRaises(KeyError, lambda: o['d'])
+        self.assertRaises(NotImplementedError,
+                          helpers.OrderedAttrDict().load_value, 'a', 1)
+
     def test_repr(self):
         o = helpers.OrderedAttrDict()
         o.a = 1
@@ -262,6 +309,10 @@ class TestASPrettyPrinter(unittest.TestCase):
     def test_list(self):
         self.assertEquals(self.pp.pformat([1, 2, 3]), "[1,\n 2,\n 3]")
         self.assertEquals(self.pp.pformat([]), "[]")
+        self.assertEquals(self.pp.pformat([0.4, 10L, 'a']),
+                          "[0.4,\n 10,\n 'a']")
+        self.assertEquals(self.pp.pformat({'a': [0.4, 10L]}),
+                          "{'a': [0.4,\n       10]}")
 
     def test_other_types(self):
         self.assertEquals(self.pp.pformat(None), "None")
@@ -304,3 +355,75 @@ class TestASPrettyPrinter(unittest.TestCase):
          5]]},
  (10, 11)]"""
         self.assertEquals(self.pp.pformat(l), expected.lstrip('\n'))
+
+
+def power(x, y):
+    return x ** y
+
+
+def slow_power(x, y):
+    time.sleep(helpers.JOB_WAIT_TIMEOUT * 1.5)
+    return x ** y
+
+
+# Runs jobs that never finish, waiting to be interrupted
+INTERRUPT_SCRIPT = """
+import sys, time
+from flvlib import helpers
+try:
+    list(helpers.run_jobs(time.sleep, [(3600,)] * 4, 2))
+except KeyboardInterrupt:
+    sys.exit(130)
+"""
+
+
+class TestJobs(unittest.TestCase):
+
+    def test_read_file_list(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, 'a.flv\0dir/b c.flv\0\0d.flv\0')
+        os.close(fd)
+        try:
+            self.assertEquals(helpers.read_file_list(path),
+                              ['a.flv', 'dir/b c.flv', 'd.flv'])
+        finally:
+            os.remove(path)
+
+        old_stdin, sys.stdin = sys.stdin, StringIO('x.flv\0y.flv')
+        try:
+            self.assertEquals(helpers.read_file_list('-'), ['x.flv', 'y.flv'])
+        finally:
+            sys.stdin = old_stdin
+
+    def test_run_jobs(self):
+        arguments = [(x, 2) for x in range(10)]
+        expected = [x ** 2 for x in range(10)]
+        self.assertEquals(list(helpers.run_jobs(power, arguments)), expected)
+        self.assertEquals(list(helpers.run_jobs(power, arguments, 3)),
+                          expected)
+
+    def test_slow_jobs(self):
+        # results taking longer than the wait timeout
+        self.assertEquals(list(helpers.run_jobs(slow_power, [(2, 3), (3, 2)],
+                                                2)), [8, 9])
+
+    def test_interrupt(self):
+        if not hasattr(os, 'killpg'):
+            return
+        lib = os.path.dirname(os.path.dirname(helpers.__file__))
+        env = os.environ.copy()
+        env['PYTHONPATH'] = lib
+        # Like pressing Ctrl-C, signal the whole process group
+        process = subprocess.Popen([sys.executable, '-c', INTERRUPT_SCRIPT],
+                                   env=env, preexec_fn=os.setsid)
+        time.sleep(1)
+        os.killpg(process.pid, signal.SIGINT)
+        for _ in range(100):
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            self.fail("Interrupting the jobs did not stop them")
+        self.assertEquals(process.returncode, 130)
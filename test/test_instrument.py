@@ -0,0 +1,106 @@
+import unittest
+from StringIO import StringIO
+
+from flvlib import constants, tags, astypes, instrument
+
+
+class RecordingHook(instrument.Hook):
+
+    def __init__(self):
+        self.values = []
+        self.tags = []
+
+    def value_decoded(self, value_type, elapsed):
+        self.values.append(value_type)
+
+    def tag_parsed(self, tag, elapsed):
+        self.tags.append(tag)
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        metadata = astypes.ECMAArray()
+        metadata['duration'] = 1.5
+        metadata['times'] = [0.0, 1.0]
+        self.data = (tags.create_flv_header() +
+                     tags.create_script_tag('onMetaData', metadata) +
+                     tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v') +
+                     tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa',
+                                         40))
+        self.getters = astypes.as_type_to_getter_and_maker.copy()
+        self.parse = tags.Tag.__dict__['parse']
+
+    def tearDown(self):
+        instrument.remove_hook()
+
+    def read(self):
+        return list(tags.FLV(StringIO(self.data)).iter_tags())
+
+    def test_nothing_installed(self):
+        self.assertEquals(instrument.get_hook(), None)
+        self.assertEquals(astypes.as_type_to_getter_and_maker, self.getters)
+        self.assertTrue(tags.Tag.__dict__['parse'] is self.parse)
+
+    def test_hook(self):
+        hook = RecordingHook()
+        instrument.install_hook(hook)
+        self.assertTrue(instrument.get_hook() is hook)
+
+        read = self.read()
+        self.assertEquals(hook.tags, read)
+        self.assertEquals(read[0].variable,
+                          {'duration': 1.5, 'times': [0.0, 1.0]})
+        # arrays of numbers are decoded in bulk, without reporting each one
+        self.assertEquals(sorted(hook.values),
+                          [constants.VALUE_TYPE_NUMBER] +
+                          [constants.VALUE_TYPE_ECMA_ARRAY,
+                           constants.VALUE_TYPE_STRICT_ARRAY])
+
+    def test_remove(self):
+        hook = RecordingHook()
+        instrument.install_hook(hook)
+        instrument.remove_hook()
+        self.assertEquals(instrument.get_hook(), None)
+        self.assertEquals(astypes.as_type_to_getter_and_maker, self.getters)
+        self.assertTrue(tags.Tag.__dict__['parse'] is self.parse)
+
+        self.read()
+        self.assertEquals(hook.tags, [])
+        self.assertEquals(hook.values, [])
+
+    def test_replace(self):
+        first, second = RecordingHook(), RecordingHook()
+        instrument.install_hook(first)
+        instrument.install_hook(second)
+        self.read()
+        self.assertEquals(first.tags, [])
+        self.assertEquals(len(second.tags), 3)
+
+        instrument.remove_hook()
+        self.assertEquals(astypes.as_type_to_getter_and_maker, self.getters)
+
+    def test_stats(self):
+        hook = instrument.StatsHook()
+        instrument.install_hook(hook)
+        # The values of onMetaData get decoded when they are accessed
+        for _ in range(2):
+            self.assertEquals(self.read()[0].variable.items(),
+                              [('duration', 1.5), ('times', [0.0, 1.0])])
+
+        self.assertEquals(hook.tag_counts, {'ScriptTag': 2, 'VideoTag': 2,
+                                            'AudioTag': 2})
+        self.assertEquals(hook.value_counts,
+                          {constants.VALUE_TYPE_NUMBER: 2,
+                           constants.VALUE_TYPE_ECMA_ARRAY: 2,
+                           constants.VALUE_TYPE_STRICT_ARRAY: 2})
+        for elapsed in hook.value_times.values() + hook.tag_times.values():
+            self.assertTrue(elapsed >= 0)
+
+        report = hook.report()
+        self.assertEquals(len(report), 6)
+        self.assertTrue(report[0].startswith('Number'))
+
+        hook.reset()
+        self.assertEquals(hook.tag_counts, {})
+        self.assertEquals(hook.value_counts, {})
@@ -0,0 +1,79 @@
+import os
+import unittest
+import tempfile
+
+from flvlib import constants, tags, parallel, validation
+
+
+class TestParallelScan(unittest.TestCase):
+
+    def setUp(self):
+        # An audio tag that has a complete, valid tag inside its payload
+        self.fake = tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x17f', 5)
+        self.tags = [tags.create_script_tag('onMetaData', {'duration': 1.0})]
+        for i in range(30):
+            self.tags.append(tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                                 '\x12\x00' + 'v' * i, i * 40))
+            self.tags.append(tags.create_flv_tag(constants.TAG_TYPE_AUDIO,
+                                                 '\xaf\x01' + 'a' * (i % 7),
+                                                 i * 40 + 20))
+            if i % 10 == 5:
+                self.tags.append(tags.create_flv_tag(
+                        constants.TAG_TYPE_AUDIO, '\xaf\x01' + self.fake * 3,
+                        i * 40 + 30))
+
+        fd, self.path = tempfile.mkstemp()
+        f = os.fdopen(fd, 'wb')
+        f.write(tags.create_flv_header() + ''.join(self.tags))
+        f.close()
+
+        f = open(self.path, 'rb')
+        self.expected = tags.FLV(f).read_table()
+        f.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def assertSameTable(self, table):
+        for name, typecode in table.columns:
+            self.assertEquals(getattr(table, name),
+                              getattr(self.expected, name))
+
+    def test_split_ranges(self):
+        self.assertEquals(parallel.split_ranges(13, 113, 4, 10),
+                          [(13, 38), (38, 63), (63, 88), (88, 113)])
+        self.assertEquals(parallel.split_ranges(13, 113, 4, 50),
+                          [(13, 63), (63, 113)])
+        self.assertEquals(parallel.split_ranges(13, 13, 4, 50), [(13, 13)])
+
+    def test_read_table(self):
+        size = os.path.getsize(self.path)
+        self.assertSameTable(parallel.read_table_parallel(self.path, 1))
+        for jobs in (2, 3, 7):
+            self.assertSameTable(parallel.read_table_parallel(self.path,
+                                                              jobs, 1))
+        # small ranges, many of them inside the big tags
+        for min_size in (7, 19, 33):
+            table = parallel.read_table_parallel(self.path,
+                                                 size // min_size, min_size)
+            self.assertSameTable(table)
+
+    def test_policy(self):
+        # a tag with a non zero StreamID, the only failed check in the file
+        offset = 13 + sum(map(len, self.tags[:40]))
+        f = open(self.path, 'r+b')
+        f.seek(offset + 10)
+        f.write('\x01')
+        f.close()
+
+        size = os.path.getsize(self.path)
+        for min_size in (19, 33):
+            policy = validation.CountPolicy()
+            table = parallel.read_table_parallel(self.path, 16, min_size,
+                                                 policy)
+            self.assertSameTable(table)
+            # the false starts inside the big tags are not reported
+            self.assertEquals(policy.failures, 1)
+
+        self.assertRaises(tags.MalformedFLV, parallel.read_table_parallel,
+                          self.path, 16, 19, validation.StrictPolicy())
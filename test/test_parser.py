@@ -0,0 +1,97 @@
+import unittest
+
+from flvlib import constants, tags, parser, primitives
+from flvlib.astypes import MalformedFLV
+
+
+class TestFLVParser(unittest.TestCase):
+
+    def setUp(self):
+        self.tags = [
+            tags.create_script_tag('onMetaData', {'duration': 0.08}, 0),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', 0),
+            tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 0),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x22v', 40),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', 80)]
+        self.data = tags.create_flv_header() + ''.join(self.tags)
+
+    def check_tags(self, parsed):
+        self.assertEquals([type(t) for t in parsed],
+                          [tags.ScriptTag, tags.VideoTag, tags.AudioTag,
+                           tags.VideoTag, tags.VideoTag])
+        self.assertEquals([t.timestamp for t in parsed], [0, 0, 0, 40, 80])
+        offsets = [13]
+        for tag in self.tags[:-1]:
+            offsets.append(offsets[-1] + len(tag))
+        self.assertEquals([t.offset for t in parsed], offsets)
+        self.assertEquals(parsed[0].name, 'onMetaData')
+        self.assertEquals(parsed[0].variable, {'duration': 0.08})
+        self.assertEquals(parsed[3].frame_type, constants.FRAME_TYPE_INTERFRAME)
+
+    def test_feed_whole(self):
+        p = parser.FLVParser()
+        self.check_tags(p.feed(self.data))
+        self.assertEquals((p.version, p.has_audio, p.has_video), (1, True, True))
+        p.close()
+
+    def test_feed_bytes(self):
+        p = parser.FLVParser()
+        parsed = []
+        for c in self.data:
+            parsed.extend(p.feed(c))
+            # never more than one tag is kept around
+            self.assertTrue(len(p.buffer) <= max(map(len, self.tags)))
+        self.check_tags(parsed)
+        p.close()
+
+    def test_feed_chunks(self):
+        p = parser.FLVParser()
+        parsed = []
+        for i in range(0, len(self.data), 7):
+            parsed.extend(p.feed(self.data[i:i + 7]))
+        self.check_tags(parsed)
+        self.assertEquals(p.offset, len(self.data))
+
+    def test_payload(self):
+        p = parser.FLVParser()
+        parsed = p.feed(self.data)
+        self.assertEquals(str(parsed[2].payload), '\x2fa')
+        self.assertEquals([str(t.raw_bytes) for t in parsed], self.tags)
+
+    def test_scan_level(self):
+        p = parser.FLVParser(scan_level=tags.SCAN_HEADERS)
+        parsed = p.feed(self.data)
+        self.assertEquals(len(parsed), 5)
+        self.assertTrue(parsed[0].variable is None)
+        self.assertEquals(parsed[1].get_first_byte(), 0x12)
+
+    def test_truncated(self):
+        p = parser.FLVParser()
+        self.assertEquals(len(p.feed(self.data[:-3])), 4)
+        self.assertRaises(primitives.EndOfFile, p.close)
+
+        p = parser.FLVParser()
+        self.assertEquals(p.feed(self.data[:12]), [])
+        self.assertRaises(primitives.EndOfFile, p.close)
+
+    def test_malformed(self):
+        p = parser.FLVParser()
+        self.assertRaises(MalformedFLV, p.feed, 'FLX' + self.data[3:])
+
+        # the signature gets checked before the rest of the header arrives
+        p = parser.FLVParser()
+        self.assertEquals(p.feed('FL'), [])
+        self.assertRaises(MalformedFLV, p.feed, 'X')
+        p = parser.FLVParser()
+        self.assertRaises(MalformedFLV, p.feed, 'GARBAGE\xff\xff\xff\xff')
+
+        # and so does the header size, instead of buffering up to it
+        p = parser.FLVParser()
+        self.assertRaises(MalformedFLV, p.feed,
+                          'FLV\x01\x05\xff\xff\xff\xff')
+        p = parser.FLVParser()
+        self.assertEquals(p.feed('FLV\x01\x05\x00\x00\x01\x00'), [])
+
+        p = parser.FLVParser()
+        p.feed(self.data[:13])
+        self.assertRaises(MalformedFLV, p.feed, '\x07' + self.tags[1][1:])
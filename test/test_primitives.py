@@ -6,6 +6,24 @@ from flvlib import primitives
 
 class EOFSerializerTester(SerializerTester):
 
+    def run_tests(self):
+        SerializerTester.run_tests(self)
+
+        unpacker = getattr(self.module, 'unpack_' + self.name)
+        for input, expected in self.get_tests:
+            self.unpacks(input, expected, unpacker)
+
+    def unpacks(self, input, expected, unpacker):
+        self.assertEquals(unpacker(input), (expected, len(input)))
+        # the unpacker should work at any offset in any kind of buffer
+        padded = 'pre' + input + 'post'
+        for buf in (padded, bytearray(padded), buffer(padded),
+                    memoryview(padded)):
+            self.assertEquals(unpacker(buf, 3), (expected, 3 + len(input)))
+        self.assertRaises(primitives.EndOfFile, unpacker, input[1:])
+        self.assertRaises(primitives.EndOfFile, unpacker, padded,
+                          len(padded) - len(input) + 1)
+
     def equivalent(self, val, getter, maker):
         SerializerTester.equivalent(self, val, getter, maker)
         s = StringIO(maker(val))
@@ -0,0 +1,146 @@
+import logging
+import unittest
+from StringIO import StringIO
+
+import test_common
+
+from flvlib import constants, tags, recovery, validation
+
+
+class TestBoundaries(unittest.TestCase):
+
+    def setUp(self):
+        self.tags = [
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', 0),
+            # the payload looks like a tag header, but there's no matching
+            # PreviousTagSize
+            tags.create_flv_tag(constants.TAG_TYPE_AUDIO,
+                                '\x2f\x09\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+                                '\x00\x00\x00', 20),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x22v', 40)]
+        self.f = StringIO(tags.create_flv_header() + ''.join(self.tags))
+        self.second = 13 + len(self.tags[0])
+        self.third = self.second + len(self.tags[1])
+
+    def test_is_tag_boundary(self):
+        self.assertTrue(recovery.is_tag_boundary(self.f, 13))
+        self.assertTrue(recovery.is_tag_boundary(self.f, self.second))
+        self.assertFalse(recovery.is_tag_boundary(self.f, 14))
+        self.assertFalse(recovery.is_tag_boundary(self.f, self.second + 12))
+        self.assertFalse(recovery.is_tag_boundary(self.f, len(self.f.getvalue())))
+
+    def test_find_tag_boundary(self):
+        find = recovery.find_tag_boundary
+        self.assertEquals(find(self.f, 14, 1000), self.second)
+        self.assertEquals(find(self.f, 14, self.second), None)
+        self.assertEquals(find(self.f, self.second + 1, 1000), self.third)
+        self.assertEquals(find(self.f, self.third + 1, 1000), None)
+
+    def test_small_blocks(self):
+        old_size = recovery.SEARCH_BLOCK_SIZE
+        try:
+            for size in (1, 2, 5, 17):
+                recovery.SEARCH_BLOCK_SIZE = size
+                self.assertEquals(recovery.find_tag_boundary(self.f, 14, 1000),
+                                  self.second)
+                self.assertEquals(recovery.find_tag_boundary(self.f,
+                                                             self.second + 1,
+                                                             1000),
+                                  self.third)
+        finally:
+            recovery.SEARCH_BLOCK_SIZE = old_size
+
+
+class TestRecoveringFLV(unittest.TestCase):
+
+    def setUp(self):
+        self.tags = [
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', 0),
+            tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 20),
+            tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x22v', 40),
+            tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 60)]
+        self.header = tags.create_flv_header()
+
+    def read(self, data):
+        flv = recovery.RecoveringFLV(StringIO(data))
+        f = test_common.WarningCounterFilter()
+        # the damaged parts can also make parsing warn
+        tags_filter = test_common.WarningCounterFilter()
+        logging.getLogger('flvlib.recovery').addFilter(f)
+        logging.getLogger('flvlib.tags').addFilter(tags_filter)
+        try:
+            read = list(flv.iter_tags())
+        finally:
+            logging.getLogger('flvlib.recovery').removeFilter(f)
+            logging.getLogger('flvlib.tags').removeFilter(tags_filter)
+        self.assertEquals(f.warnings, len(flv.skipped))
+        return flv, read
+
+    def test_clean(self):
+        flv, read = self.read(self.header + ''.join(self.tags))
+        self.assertEquals([t.timestamp for t in read], [0, 20, 40, 60])
+        self.assertEquals(flv.skipped, [])
+
+    def test_garbage(self):
+        garbage = '\x07garbage\x00\x00\x00' * 10
+        data = (self.header + self.tags[0] + garbage + self.tags[1] +
+                self.tags[2][:5] + self.tags[3])
+        flv, read = self.read(data)
+        self.assertEquals([t.timestamp for t in read], [0, 20, 60])
+
+        first = 13 + len(self.tags[0])
+        second = first + len(garbage) + len(self.tags[1])
+        self.assertEquals(flv.skipped, [(first, first + len(garbage)),
+                                        (second, second + 5)])
+        self.assertEquals(flv.skipped_bytes(0, len(data)), len(garbage) + 5)
+        self.assertEquals(flv.skipped_bytes(first + 10, second + 1),
+                          len(garbage) - 10 + 1)
+
+        out = StringIO()
+        flv.copy_data(out, 0)
+        self.assertEquals(out.getvalue(),
+                          self.header + self.tags[0] + self.tags[1] +
+                          self.tags[3])
+
+        out = StringIO()
+        flv.copy_data(out, first + 1, second + 2)
+        self.assertEquals(out.getvalue(), self.tags[1])
+
+    def test_truncated(self):
+        data = self.header + ''.join(self.tags)[:-6]
+        flv, read = self.read(data)
+        self.assertEquals([t.timestamp for t in read], [0, 20, 40])
+        self.assertEquals(flv.skipped, [(len(data) - len(self.tags[3]) + 6,
+                                         len(data))])
+
+    def test_checks(self):
+        checked = []
+
+        class CheckRecordingFLV(recovery.RecoveringFLV):
+            def is_plausible(self, offset, next_offset, end):
+                checked.append(offset)
+                return recovery.RecoveringFLV.is_plausible(
+                    self, offset, next_offset, end)
+
+        # tags that pass all checks are not read again
+        policy = validation.CountPolicy()
+        data = self.header + ''.join(self.tags)
+        flv = CheckRecordingFLV(StringIO(data), policy=policy)
+        self.assertEquals(len(list(flv.iter_tags())), 4)
+        self.assertEquals(checked, [])
+
+        # a non zero StreamID makes the tag get checked and skipped, and
+        # the failure still goes to the given policy
+        bad = self.tags[1][:10] + '\x01' + self.tags[1][11:]
+        data = self.header + self.tags[0] + bad + ''.join(self.tags[2:])
+        flv = CheckRecordingFLV(StringIO(data), policy=policy)
+        f = test_common.WarningCounterFilter()
+        logging.getLogger('flvlib.recovery').addFilter(f)
+        try:
+            read = list(flv.iter_tags())
+        finally:
+            logging.getLogger('flvlib.recovery').removeFilter(f)
+        self.assertEquals(f.warnings, 1)
+        self.assertEquals([t.timestamp for t in read], [0, 40, 60])
+        self.assertEquals(checked, [13 + len(self.tags[0])])
+        self.assertEquals(policy.failures, 1)
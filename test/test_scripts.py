@@ -0,0 +1,166 @@
+import os
+import shutil
+import logging
+import unittest
+import tempfile
+
+import flvlib
+from flvlib import generate, sidecar
+from flvlib.scripts import index_flv, cut_flv, debug_flv
+
+
+class ScriptTester(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def generate(self, name, **kwargs):
+        path = self.path(name)
+        generate.generate_file(path, duration=10000, **kwargs)
+        return path
+
+    def read(self, path):
+        f = open(path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+
+class TestIndex(ScriptTester):
+
+    def check_sidecar(self, jobs=1, **kwargs):
+        path = self.generate('in.flv', **kwargs)
+
+        self.assertTrue(index_flv.index_file(path, self.path('scan.flv')))
+        self.assertFalse(os.path.exists(sidecar.index_path(path)))
+
+        # builds and saves the index, then uses the saved one
+        for i in range(2):
+            self.assertTrue(index_flv.index_file(path, self.path('index.flv'),
+                                                 sidecar=True, jobs=jobs))
+            self.assertTrue(sidecar.read_index(path) is not None)
+            self.assertEquals(self.read(self.path('index.flv')),
+                              self.read(self.path('scan.flv')))
+
+    def test_sidecar(self):
+        self.check_sidecar()
+
+    def test_sidecar_audio_only(self):
+        self.check_sidecar(has_video=False, metadata=generate.METADATA_BOTH)
+
+    def test_sidecar_jobs(self):
+        self.check_sidecar(jobs=2)
+
+    def test_sidecar_update(self):
+        path = self.generate('in.flv')
+        expected = self.path('expected.flv')
+        self.assertTrue(index_flv.index_file(path, expected))
+
+        # overwriting the input makes its index stale, so it's not saved
+        self.assertTrue(index_flv.index_file(path, sidecar=True))
+        self.assertFalse(os.path.exists(sidecar.index_path(path)))
+        self.assertEquals(self.read(path), self.read(expected))
+
+
+CuttingFLV = cut_flv.CuttingFLV
+
+
+class SkipRecordingFLV(CuttingFLV):
+
+    use_index = True
+    skipped_to = None
+
+    def get_keyframe_index(self):
+        if not self.use_index:
+            return None
+        return CuttingFLV.get_keyframe_index(self)
+
+    def iter_tags_from(self, offset):
+        SkipRecordingFLV.skipped_to = offset
+        return CuttingFLV.iter_tags_from(self, offset)
+
+
+class TestCut(ScriptTester):
+
+    def setUp(self):
+        ScriptTester.setUp(self)
+        cut_flv.CuttingFLV = SkipRecordingFLV
+        SkipRecordingFLV.skipped_to = None
+
+    def tearDown(self):
+        cut_flv.CuttingFLV = CuttingFLV
+        SkipRecordingFLV.use_index = True
+        ScriptTester.tearDown(self)
+
+    def cut(self, path, name, **kwargs):
+        SkipRecordingFLV.skipped_to = None
+        outpath = self.path(name)
+        self.assertTrue(cut_flv.cut_file(path, outpath, 4000, 6000, **kwargs))
+        return self.read(outpath), SkipRecordingFLV.skipped_to
+
+    def test_skip_metadata(self):
+        # the keyframes are in the metadata of an indexed file
+        path = self.path('indexed.flv')
+        self.assertTrue(index_flv.index_file(self.generate('in.flv'), path))
+
+        data, skipped_to = self.cut(path, 'skip.flv')
+        self.assertTrue(skipped_to is not None)
+
+        SkipRecordingFLV.use_index = False
+        expected, skipped_to = self.cut(path, 'scan.flv')
+        self.assertTrue(skipped_to is None)
+        self.assertEquals(data, expected)
+
+    def test_skip_sidecar(self):
+        path = self.generate('in.flv')
+        expected, skipped_to = self.cut(path, 'scan.flv')
+        self.assertTrue(skipped_to is None)
+
+        data, skipped_to = self.cut(path, 'skip.flv', sidecar=True)
+        self.assertTrue(skipped_to is not None)
+        self.assertTrue(sidecar.read_index(path) is not None)
+        self.assertEquals(data, expected)
+
+    def test_stop_early(self):
+        # damage after the end time is reported unless stopping early
+        path = self.generate('in.flv', corrupt=[8000])
+        logger = logging.getLogger('flvlib.cut-flv')
+        logger.disabled = True
+        try:
+            self.assertFalse(cut_flv.cut_file(path, self.path('out.flv'),
+                                              4000, 6000))
+        finally:
+            logger.disabled = False
+        self.cut(path, 'out.flv', stop_early=True)
+
+
+class TestDebug(ScriptTester):
+
+    def test_messages(self):
+        good = self.generate('good.flv')
+        bad = self.path('bad.flv')
+        data = self.read(good)
+        f = open(bad, 'wb')
+        f.write(data[:len(data) // 2])
+        f.close()
+
+        stream = flvlib.handler.stream
+        outcome, output, messages = debug_flv.debug_file_to_string(good)
+        self.assertTrue(outcome)
+        self.assertTrue(output.startswith("=== `%s' ===" % good))
+        self.assertEquals(messages, '')
+
+        # the messages about a file are returned with its output
+        outcome, output, messages = debug_flv.debug_file_to_string(bad)
+        self.assertFalse(outcome)
+        self.assertTrue(output.startswith("=== `%s' ===" % bad))
+        self.assertTrue(("Unexpected end of file on file `%s'" % bad)
+                        in messages)
+        self.assertTrue(flvlib.handler.stream is stream)
@@ -0,0 +1,111 @@
+import os
+import stat
+import shutil
+import unittest
+import tempfile
+
+from flvlib import constants, tags, sidecar
+
+
+class TestSidecar(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.flv')
+        self.write_flv()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_flv(self, extra=''):
+        f = open(self.path, 'wb')
+        f.write(tags.create_flv_header())
+        f.write(tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x17\x00cfg'))
+        f.write(tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\xaf\x00a'))
+        f.write(tags.create_script_tag('onMetaData', {'duration': 1.0}))
+        f.write(tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                    '\x17\x01' + 'k' * 20, 40))
+        f.write(tags.create_flv_tag(constants.TAG_TYPE_AUDIO,
+                                    '\xaf\x01' + 'a' * 10, 60))
+        f.write(tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                    '\x27\x01' + 'i' * 10, 80))
+        f.write(extra)
+        f.close()
+
+    def check_index(self, index):
+        self.assertEquals(len(index.table), 6)
+        self.assertEquals(list(index.table.offsets),
+                          [13, 33, 51, 106, 143, 170])
+        self.assertEquals(list(index.table.timestamps), [0, 0, 0, 40, 60, 80])
+        # the H.264 sequence header is not a keyframe that can be seeked to
+        self.assertEquals(list(index.keyframe_offsets), [106])
+        self.assertEquals(list(index.keyframe_timestamps), [40])
+        self.assertEquals(list(index.sequence_header_offsets), [13, 33])
+        self.assertEquals(index.metadata_offset, 51)
+        self.assertEquals(index.metadata_size, 51)
+
+    def test_build(self):
+        self.check_index(sidecar.build_index(self.path))
+
+    def test_roundtrip(self):
+        self.assertTrue(sidecar.read_index(self.path) is None)
+
+        index = sidecar.load_index(self.path)
+        self.check_index(index)
+        self.assertTrue(os.path.exists(sidecar.index_path(self.path)))
+
+        index = sidecar.read_index(self.path)
+        self.check_index(index)
+        self.assertEquals(list(index.table.packet_types),
+                          [0, 0, -1, 1, 1, 1])
+
+    def test_permissions(self):
+        for mode in (0644, 0640, 0755):
+            os.chmod(self.path, mode)
+            sidecar.write_index(sidecar.build_index(self.path), self.path)
+            index_mode = os.stat(sidecar.index_path(self.path)).st_mode
+            self.assertEquals(stat.S_IMODE(index_mode), mode & 0666)
+
+    def test_seek(self):
+        flv = tags.FLV(open(self.path, 'rb'))
+        # the metadata has no keyframes and there is no sidecar index
+        self.assertTrue(flv.get_keyframe_index() is None)
+        flv.f.close()
+
+        sidecar.load_index(self.path)
+        flv = tags.FLV(open(self.path, 'rb'))
+        self.assertEquals(flv.find_keyframe(50), (40, 106))
+        tag = flv.seek_to_time(50, scan=False)
+        self.assertEquals(tag.offset, 106)
+        flv.f.close()
+
+    def test_stale(self):
+        sidecar.load_index(self.path)
+
+        # appending a tag changes the size of the file
+        tag = tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2f', 100)
+        self.write_flv(tag)
+        self.assertTrue(sidecar.read_index(self.path) is None)
+
+        index = sidecar.load_index(self.path)
+        self.assertEquals(len(index.table), 7)
+        self.assertEquals(len(sidecar.read_index(self.path).table), 7)
+
+        # same size, different modification time
+        st = os.stat(self.path)
+        os.utime(self.path, (st.st_atime, st.st_mtime + 10))
+        self.assertTrue(sidecar.read_index(self.path) is None)
+
+    def test_invalid(self):
+        f = open(sidecar.index_path(self.path), 'wb')
+        f.write('garbage')
+        f.close()
+        self.assertTrue(sidecar.read_index(self.path) is None)
+        self.check_index(sidecar.load_index(self.path))
+
+        # a truncated index
+        data = open(sidecar.index_path(self.path), 'rb').read()
+        f = open(sidecar.index_path(self.path), 'wb')
+        f.write(data[:-20])
+        f.close()
+        self.assertTrue(sidecar.read_index(self.path) is None)
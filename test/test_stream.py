@@ -0,0 +1,127 @@
+import socket
+import asyncore
+import logging
+import unittest
+
+import test_common
+
+from flvlib import constants, tags, stream
+
+
+class ErrorCounterFilter(object):
+
+    errors = 0
+
+    def filter(self, record):
+        if record.levelno == logging.ERROR:
+            self.errors += 1
+            return 0
+        return 1
+
+
+class CollectingReader(stream.FLVStreamReader):
+
+    def __init__(self, sock, map):
+        stream.FLVStreamReader.__init__(self, sock, map)
+        self.tags = []
+        self.complete = None
+
+    def handle_tag(self, tag):
+        self.tags.append(tag)
+
+    def handle_end(self, complete):
+        self.complete = complete
+
+
+class TestStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.map = {}
+        a, b = socket.socketpair()
+        self.writer = stream.FLVStreamWriter(a, self.map)
+        self.reader = CollectingReader(b, self.map)
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+
+    def loop(self):
+        asyncore.loop(timeout=1, map=self.map)
+
+    def test_stream(self):
+        self.writer.write_header()
+        self.writer.write_script_tag('onMetaData', {'duration': 0.04})
+        self.writer.write_tag(constants.TAG_TYPE_VIDEO, '\x12v', 0)
+        self.writer.write_tags([(constants.TAG_TYPE_AUDIO, '\x2fa', 20),
+                                (constants.TAG_TYPE_VIDEO, '\x22v', 40)])
+        self.writer.close_when_done()
+        self.loop()
+
+        self.assertTrue(self.reader.complete)
+        self.assertEquals([type(t) for t in self.reader.tags],
+                          [tags.ScriptTag, tags.VideoTag, tags.AudioTag,
+                           tags.VideoTag])
+        self.assertEquals([t.timestamp for t in self.reader.tags],
+                          [0, 0, 20, 40])
+        self.assertEquals(self.reader.tags[0].variable, {'duration': 0.04})
+
+    def test_truncated(self):
+        self.writer.write_header()
+        self.writer.write(tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                              '\x12v', 0)[:-2])
+        self.writer.close_when_done()
+
+        f = test_common.WarningCounterFilter()
+        logging.getLogger('flvlib.stream').addFilter(f)
+        try:
+            self.loop()
+        finally:
+            logging.getLogger('flvlib.stream').removeFilter(f)
+
+        self.assertEquals(f.warnings, 1)
+        self.assertEquals(self.reader.tags, [])
+        self.assertEquals(self.reader.complete, False)
+
+    def test_malformed(self):
+        self.writer.write(tags.create_flv_header())
+        self.writer.write_tag(constants.TAG_TYPE_VIDEO, '\x12v', 0)
+        self.writer.write('\x01' + '\x00' * 14)
+        self.writer.close_when_done()
+
+        ends = []
+        self.reader.handle_end = ends.append
+        f = ErrorCounterFilter()
+        logging.getLogger('flvlib.stream').addFilter(f)
+        try:
+            self.loop()
+            # closing again does not end the stream twice
+            self.reader.handle_close()
+        finally:
+            logging.getLogger('flvlib.stream').removeFilter(f)
+
+        self.assertEquals(f.errors, 1)
+        self.assertEquals(ends, [False])
+        self.assertFalse(self.reader.connected)
+
+    def test_backpressure(self):
+        writer = self.writer
+        writer.high_water = 1000
+        writer.low_water = 100
+        drained = []
+        writer.handle_drain = lambda: drained.append(writer.queued)
+
+        writer.write_header()
+        self.assertFalse(writer.should_pause())
+        for i in range(50):
+            writer.write_tag(constants.TAG_TYPE_AUDIO, '\x2f' + 'a' * 99, i)
+        self.assertTrue(writer.should_pause())
+
+        self.reader.pause_reading()
+        self.assertFalse(self.reader.readable())
+        self.reader.resume_reading()
+
+        writer.close_when_done()
+        self.loop()
+        self.assertEquals(drained, [0])
+        self.assertFalse(writer.should_pause())
+        self.assertEquals(len(self.reader.tags), 50)
@@ -0,0 +1,69 @@
+import array
+import unittest
+from StringIO import StringIO
+
+from flvlib import constants, tags, table
+
+
+def tag(type, data, timestamp):
+    return tags.create_flv_tag(type, data, timestamp)
+
+
+class TestTagTable(unittest.TestCase):
+
+    def setUp(self):
+        self.data = (tags.create_flv_header() +
+                     tag(constants.TAG_TYPE_SCRIPT, '\x02\x00\x03foo\x05', 0) +
+                     tag(constants.TAG_TYPE_VIDEO, '\x17\x00cfg', 0) +
+                     tag(constants.TAG_TYPE_AUDIO, '\xaf\x00a', 0) +
+                     tag(constants.TAG_TYPE_VIDEO, '\x17\x01' + 'k' * 20, 40) +
+                     tag(constants.TAG_TYPE_AUDIO, '\x2f' + 'a' * 10, 500) +
+                     tag(constants.TAG_TYPE_VIDEO, '\x22' + 'i' * 10, 1200) +
+                     tag(constants.TAG_TYPE_VIDEO, '\x12', 2100))
+        self.table = tags.FLV(StringIO(self.data)).read_table()
+
+    def as_list(self, values):
+        return [v for v in values]
+
+    def test_columns(self):
+        t = self.table
+        self.assertEquals(len(t), 7)
+        self.assertEquals(list(t.offsets), [13, 35, 55, 73, 110, 136, 162])
+        self.assertEquals(list(t.sizes), [7, 5, 3, 22, 11, 11, 1])
+        self.assertEquals(list(t.timestamps), [0, 0, 0, 40, 500, 1200, 2100])
+        self.assertEquals(list(t.tag_types), [18, 9, 8, 9, 8, 9, 9])
+        self.assertEquals(list(t.frame_types), [-1, 1, -1, 1, -1, 2, 1])
+        self.assertEquals(list(t.codecs), [-1, 7, 10, 7, 2, 2, 2])
+        self.assertEquals(list(t.packet_types), [-1, 0, 0, 1, -1, -1, -1])
+
+    def test_matches_tags(self):
+        parsed = list(tags.FLV(StringIO(self.data)).iter_tags())
+        self.assertEquals(list(self.table.offsets), [t.offset for t in parsed])
+        self.assertEquals(list(self.table.timestamps),
+                          [t.timestamp for t in parsed])
+
+    def test_queries(self):
+        t = self.table
+        self.assertEquals(self.as_list(t.keyframe_offsets()), [35, 73, 162])
+        self.assertEquals(self.as_list(t.keyframe_timestamps()), [0, 40, 2100])
+        self.assertEquals(self.as_list(t.timestamps_of(
+                    constants.TAG_TYPE_AUDIO)), [0, 500])
+        self.assertEquals(self.as_list(t.select(
+                    'offsets', tag_type=constants.TAG_TYPE_VIDEO,
+                    frame_type=constants.FRAME_TYPE_KEYFRAME,
+                    packet_type=constants.H264_PACKET_TYPE_NALU)), [73])
+        self.assertEquals(self.as_list(t.select('sizes')),
+                          [7, 5, 3, 22, 11, 11, 1])
+        self.assertEquals(self.as_list(t.bytes_per_second()),
+                          [7 + 5 + 3 + 22 + 11 + 15 * 5, 11 + 15, 1 + 15])
+
+    def test_empty(self):
+        t = table.TagTable()
+        self.assertEquals(len(t), 0)
+        self.assertEquals(self.as_list(t.keyframe_offsets()), [])
+        self.assertEquals(self.as_list(t.bytes_per_second()), [])
+
+    def test_offset_typecode(self):
+        a = array.array(table.OFFSET_TYPECODE)
+        a.append(2 ** 40)
+        self.assertEquals(a[0], 2 ** 40)
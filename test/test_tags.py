@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import os
 import unittest
 
 import logging
+import tempfile
 import test_common
 from StringIO import StringIO
 
-from flvlib import constants, primitives, astypes, tags
+from flvlib import constants, primitives, astypes, tags, validation
 
 
 class LStringIO(StringIO):
@@ -34,20 +36,21 @@ class TestEnsure(unittest.TestCase):
 
     def test_ensure_strict(self):
         tags.STRICT_PARSING = True
-        self.assertRaises(tags.MalformedFLV, tags.ensure, 1, 2, "error")
+        self.assertRaises(tags.MalformedFLV, tags.default_policy.ensure,
+                          1, 2, "error")
 
     def test_ensure_nonstrict(self):
         tags.STRICT_PARSING = False
         f = test_common.WarningCounterFilter()
         logging.getLogger('flvlib.tags').addFilter(f)
-        tags.ensure(1, 2, "error")
+        tags.default_policy.ensure(1, 2, "error")
         logging.getLogger('flvlib.tags').removeFilter(f)
 
         self.assertEquals(f.warnings, 1)
 
     def test_ensure_noerror(self):
         tags.STRICT_PARSING = True
-        tags.ensure(1, 1, "no error")
+        tags.default_policy.ensure(1, 1, "no error")
 
 
 class TestUnderStrictParsing(unittest.TestCase):
@@ -302,6 +305,48 @@ class TestScriptTag(TestUnderStrictParsing):
         self.assertEquals(t.name, 'onMetaData')
         self.assertEquals(t.variable, {'duration': 1.0})
 
+    def test_lazy_parsing(self):
+        data = ('\x00\x00\x28\x00\x26\x5f\x00\x00\x00\x00' +
+                '\x02\x00\x0aonMetaData\x08\x00\x00\x00\x01' +
+                '\x00\x08duration\x00\x3f\xf0\x00\x00\x00\x00\x00\x00' +
+                '\x00\x00\x09\x00\x00\x00\x33')
+
+        # without a parent FLV everything gets decoded right away
+        t = tags.ScriptTag(None, StringIO(data))
+        t.parse()
+        self.assertEquals(t.variable.__class__, astypes.ECMAArray)
+
+        # and also if the FLV asks for it
+        t = tags.ScriptTag(tags.FLV(None, lazy_metadata=False),
+                           StringIO(data))
+        t.parse()
+        self.assertEquals(t.variable.__class__, astypes.ECMAArray)
+
+        # otherwise the values get decoded when accessed, whatever the
+        # policy
+        for policy in (validation.IgnorePolicy(), validation.StrictPolicy()):
+            t = tags.ScriptTag(tags.FLV(None, policy=policy), StringIO(data))
+            t.parse()
+            self.assertEquals(t.variable.__class__, astypes.LazyECMAArray)
+            self.assertFalse(t.variable.is_loaded('duration'))
+            self.assertEquals(t.variable, {'duration': 1.0})
+            self.assertTrue(t.variable.is_loaded('duration'))
+
+    def test_lazy_errors(self):
+        # the end marker is still required when strict
+        data = ('\x00\x00\x25\x00\x26\x5f\x00\x00\x00\x00' +
+                '\x02\x00\x0aonMetaData\x08\x00\x00\x00\x01' +
+                '\x00\x08duration\x00\x3f\xf0\x00\x00\x00\x00\x00\x00' +
+                '\x00\x00\x00\x30')
+        parent = tags.FLV(None, policy=validation.StrictPolicy())
+        t = tags.ScriptTag(parent, StringIO(data))
+        self.assertRaises(primitives.EndOfFile, t.parse)
+
+        parent = tags.FLV(None, policy=validation.IgnorePolicy())
+        t = tags.ScriptTag(parent, StringIO(data))
+        t.parse()
+        self.assertEquals(t.variable, {'duration': 1.0})
+
     def test_errors(self):
         # name is not a string (no 0x02 byte before the name)
         s = StringIO('\x00\x00\x07\x00\x26\x5f\x00\x00\x00\x00' +
@@ -317,6 +362,20 @@ class TestScriptTag(TestUnderStrictParsing):
         t = tags.ScriptTag(None, s)
         self.assertRaises(primitives.EndOfFile, t.parse)
 
+        # trailing data after the value, should fail under strict parsing
+        s = StringIO('\x00\x00\x08\x00\x26\x5f\x00\x00\x00\x00' +
+                     '\x02\x00\x03\x66\x6f\x6f\x05\x00\x00\x00\x00\x13')
+        t = tags.ScriptTag(None, s)
+        self.assertRaises(tags.MalformedFLV, t.parse)
+
+        # and be skipped otherwise
+        s.seek(0)
+        t = tags.ScriptTag(tags.FLV(None, policy=validation.IgnorePolicy()),
+                           s)
+        t.parse()
+        self.assertEquals(t.name, 'foo')
+        self.assertEquals(s.read(), '')
+
     def test_repr(self):
         s = LStringIO('\x00\x00\x07\x00\x26\x5f\x00\x00\x00\x00' +
                       '\x02\x00\x03\x66\x6f\x6f\x05\x00\x00\x00\x12', 10)
@@ -393,6 +452,12 @@ class TestFLV(TestUnderStrictParsing, BodyGeneratorMixin):
         self.assertTrue(isinstance(f.tags[3], tags.ScriptAMF3Tag))
         self.assertTrue(isinstance(f.tags[4], tags.ScriptTag))
 
+        # the stored tags are compact and detached from the file
+        for tag in f.tags:
+            self.assertFalse(hasattr(tag, '__dict__'))
+            self.assertTrue(tag.f is None)
+            self.assertTrue(tag.parent_flv is None)
+
     def test_errors(self):
         # file shorter than 3 bytes
         s = StringIO()
@@ -411,6 +476,426 @@ class TestFLV(TestUnderStrictParsing, BodyGeneratorMixin):
         self.assertRaises(tags.MalformedFLV, f.read_tags)
 
 
+class TestTagHeader(unittest.TestCase):
+
+    def test_unpack_tag_header(self):
+        header = tags.unpack_tag_header('\x09\x00\x00\x0a\x00\x26\x5f\x00'
+                                        '\x00\x00\x00\x17')
+        self.assertEquals(header, (9, 10, 9823, 0, 0x17))
+
+        # negative timestamp, nonzero StreamID
+        header = tags.unpack_tag_header('\x08\x00\x00\x0f\xcc\xff\x1b\xff'
+                                        '\x00\x00\x01\x2f')
+        self.assertEquals(header, (8, 15, -3342565, 1, 0x2f))
+
+        # an empty tag has no flags
+        header = tags.unpack_tag_header('\x12\x00\x00\x00\x00\x00\x00\x00'
+                                        '\x00\x00\x00\x00')
+        self.assertEquals(header, (18, 0, 0, 0, None))
+
+        # with an offset
+        header = tags.unpack_tag_header('garbage\x09\x00\x00\x0a\x00\x26'
+                                        '\x5f\x00\x00\x00\x00\x17', 7)
+        self.assertEquals(header, (9, 10, 9823, 0, 0x17))
+
+        self.assertRaises(primitives.EndOfFile, tags.unpack_tag_header,
+                          '\x09\x00\x00\x0a')
+
+
+class TestScanTags(TestUnderStrictParsing, BodyGeneratorMixin):
+
+    def test_scan_tags(self):
+        s = StringIO('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                     '\x08' + self.tag_body('\x4b') +
+                     '\x09' + self.tag_body('\x17\x00') +
+                     '\x12' + ('\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00' +
+                               '\x00\x00\x00\x0b'))
+        f = tags.FLV(s)
+        scanned = list(f.scan_tags())
+
+        self.assertEquals(scanned, [(8, 13, 10, 9823, 0x4b),
+                                    (9, 38, 10, 9823, 0x17),
+                                    (18, 63, 0, 0, None)])
+
+    def test_scan_matches_iter(self):
+        s = StringIO('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                     '\x08' + self.tag_body('\xaf\x01') +
+                     '\x09' + self.tag_body('\x22'))
+        scanned = list(tags.FLV(s).scan_tags())
+        parsed = list(tags.FLV(s).iter_tags())
+
+        self.assertEquals([(offset, size, timestamp) for
+                           _, offset, size, timestamp, _ in scanned],
+                          [(t.offset, t.size, t.timestamp) for t in parsed])
+        self.assertEquals(parsed[0].sound_format, constants.SOUND_FORMAT_AAC)
+        self.assertEquals(parsed[0].aac_packet_type,
+                          constants.AAC_PACKET_TYPE_RAW)
+        self.assertEquals(parsed[1].codec_id, constants.CODEC_ID_H263)
+
+    def test_errors(self):
+        # PreviousTagSize mismatch
+        s = StringIO('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                     '\x08' + self.tag_body('\x4b')[:-1] + '\x16')
+        self.assertRaises(tags.MalformedFLV, list, tags.FLV(s).scan_tags())
+
+        # truncated tag
+        s = StringIO('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                     '\x08' + self.tag_body('\x4b')[:12])
+        self.assertRaises(primitives.EndOfFile, list, tags.FLV(s).scan_tags())
+
+        # invalid tag type
+        s = StringIO('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                     '\x01' + self.tag_body('\x4b'))
+        self.assertRaises(tags.MalformedFLV, list, tags.FLV(s).scan_tags())
+
+
+class TestScanLevels(TestUnderStrictParsing, BodyGeneratorMixin):
+
+    def test_headers(self):
+        flv = tags.FLV(None, scan_level=tags.SCAN_HEADERS)
+
+        # an invalid sound format does not get noticed
+        s = StringIO(self.tag_body('\x9f'))
+        t = tags.AudioTag(flv, s)
+        t.parse()
+
+        self.assertEquals(s.read(), '')
+        self.assertEquals(t.size, BodyGeneratorMixin.DATASIZE)
+        self.assertEquals(t.timestamp, 9823)
+        self.assertTrue(t.sound_format is None)
+
+        s = StringIO('\x00\x00\x07\x00\x26\x5f\x00\x00\x00\x00' +
+                     '\x02\x00\x03\x66\x6f\x6f\x05\x00\x00\x00\x12')
+        t = tags.ScriptTag(flv, s)
+        t.parse()
+
+        self.assertEquals(s.read(), '')
+        self.assertTrue(t.name is None)
+
+    def test_flags(self):
+        flv = tags.FLV(None, scan_level=tags.SCAN_FLAGS)
+
+        s = StringIO(self.tag_body('\x17\x01'))
+        t = tags.VideoTag(flv, s)
+        t.parse()
+
+        self.assertEquals(s.read(), '')
+        self.assertEquals(t.frame_type, constants.FRAME_TYPE_KEYFRAME)
+        self.assertEquals(t.h264_packet_type, constants.H264_PACKET_TYPE_NALU)
+
+        # the name gets read, the value does not get decoded
+        s = StringIO('\x00\x00\x28\x00\x26\x5f\x00\x00\x00\x00' +
+                     '\x02\x00\x0aonMetaData\x08\x00\x00\x00\x01' +
+                     '\x00\x08duration\x00\x3f\xf0\x00\x00\x00\x00\x00\x00' +
+                     '\x00\x00\x09\x00\x00\x00\x33')
+        t = tags.ScriptTag(flv, s)
+        t.parse()
+
+        self.assertEquals(s.read(), '')
+        self.assertEquals(t.name, 'onMetaData')
+        self.assertTrue(t.variable is None)
+
+    def test_iter_tags(self):
+        s = StringIO('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                     '\x08' + self.tag_body('\xaf\x01') +
+                     '\x12' + ('\x00\x00\x07\x00\x26\x5f\x00\x00\x00\x00' +
+                               '\x02\x00\x03\x66\x6f\x6f\x05\x00\x00\x00\x12') +
+                     '\x09' + self.tag_body('\x22'))
+
+        parsed = list(tags.FLV(s, scan_level=tags.SCAN_HEADERS).iter_tags())
+        self.assertEquals([(t.offset, t.size) for t in parsed],
+                          [(13, 10), (38, 7), (60, 10)])
+        self.assertTrue(parsed[0].sound_format is None)
+        self.assertTrue(parsed[2].codec_id is None)
+
+        parsed = list(tags.FLV(s, scan_level=tags.SCAN_FLAGS).iter_tags())
+        self.assertEquals(parsed[0].sound_format, constants.SOUND_FORMAT_AAC)
+        self.assertEquals(parsed[1].name, 'foo')
+        self.assertEquals(parsed[2].codec_id, constants.CODEC_ID_H263)
+
+
+class TestSeek(TestUnderStrictParsing):
+
+    def make_flv(self, metadata=None, has_video=True):
+        data = [tags.create_flv_header(has_video=has_video)]
+        if metadata is not None:
+            data.append(tags.create_script_tag('onMetaData', metadata))
+        offset = len(''.join(data))
+        offsets = []
+        for i in range(10):
+            if has_video:
+                flags = (i % 4 == 0) and '\x12' or '\x22'
+                data.append(tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                                flags + 'v' * 9, i * 100))
+            data.append(tags.create_flv_tag(constants.TAG_TYPE_AUDIO,
+                                            '\x2f' + 'a' * 4, i * 100))
+        for tag in tags.FLV(StringIO(''.join(data))).scan_tags():
+            offsets.append(tag[1])
+        # the media tags start right after the header and the metadata
+        first_media = (metadata is not None) and 1 or 0
+        self.assertEquals(offsets[first_media], offset)
+        return ''.join(data), offsets
+
+    def keyframes(self, positions, times):
+        keyframes = astypes.FLVObject()
+        keyframes.filepositions = positions
+        keyframes.times = times
+        return {'keyframes': keyframes}
+
+    def test_scan(self):
+        data, offsets = self.make_flv()
+        flv = tags.FLV(StringIO(data))
+        self.assertTrue(flv.find_keyframe(250) is None)
+
+        # video keyframes are at 0, 400 and 800
+        for timestamp, expected in ((0, 0), (-5, 0), (399, 0), (400, 400),
+                                    (750, 400), (5000, 800)):
+            tag = flv.seek_to_time(timestamp)
+            self.assertTrue(isinstance(tag, tags.VideoTag))
+            self.assertEquals(tag.timestamp, expected)
+
+        self.assertTrue(flv.seek_to_time(300, scan=False) is None)
+
+        # audio-only files use audio tags
+        data, offsets = self.make_flv(has_video=False)
+        flv = tags.FLV(StringIO(data))
+        tag = flv.seek_to_time(350)
+        self.assertTrue(isinstance(tag, tags.AudioTag))
+        self.assertEquals(tag.timestamp, 300)
+
+    def test_metadata(self):
+        # get the offsets of the tags once the metadata is in place
+        metadata = self.keyframes([0.0, 0.0, 0.0], [0.0, 0.4, 0.8])
+        data, offsets = self.make_flv(metadata)
+        keyframe_offsets = [offsets[1], offsets[9], offsets[17]]
+        metadata = self.keyframes([float(o) for o in keyframe_offsets],
+                                  [0.0, 0.4, 0.8])
+        data, offsets = self.make_flv(metadata)
+
+        flv = tags.FLV(StringIO(data))
+        self.assertEquals(flv.get_keyframe_index(),
+                          ([0, 400, 800], keyframe_offsets))
+        self.assertEquals(flv.find_keyframe(650), (400, keyframe_offsets[1]))
+        self.assertEquals(flv.find_keyframe(-10), (0, keyframe_offsets[0]))
+
+        tag = flv.seek_to_time(650, scan=False)
+        self.assertEquals(tag.offset, keyframe_offsets[1])
+        self.assertEquals(tag.timestamp, 400)
+
+        # continue iterating after the keyframe
+        following = list(flv.iter_tags_from(tag.offset))
+        self.assertEquals(len(following), 12)
+        self.assertEquals(following[0].offset, tag.offset)
+
+    def test_h264_sequence_header(self):
+        # the sequence header has the keyframe flag, but is no seek point
+        data = (tags.create_flv_header() +
+                tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                    '\x17\x00\x00\x00\x00cfg', 0) +
+                tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                    '\x17\x01\x00\x00\x00k', 40) +
+                tags.create_flv_tag(constants.TAG_TYPE_VIDEO,
+                                    '\x27\x01\x00\x00\x00i', 80))
+        flv = tags.FLV(StringIO(data))
+        tag = flv.seek_to_time(20)
+        self.assertEquals(tag.timestamp, 40)
+        self.assertTrue(flv.is_seekpoint(tag))
+        self.assertFalse(flv.is_seekpoint(flv.read_tag_at(13)))
+
+    def test_metadata_policy(self):
+        # an onMetaData tag with trailing data, only accepted by lenient
+        # policies
+        data, offsets = self.make_flv()
+        def script_tag(position):
+            value = astypes.make_script_data_variable(
+                'onMetaData', self.keyframes([position], [0.0]))
+            return tags.create_flv_tag(constants.TAG_TYPE_SCRIPT,
+                                       '\x02' + value + 'xx')
+        position = 13 + len(script_tag(0.0))
+        data = data[:13] + script_tag(float(position)) + data[13:]
+
+        flv = tags.FLV(StringIO(data), policy=validation.IgnorePolicy())
+        self.assertEquals(flv.get_keyframe_index(), ([0], [position]))
+        flv = tags.FLV(StringIO(data), policy=validation.StrictPolicy())
+        self.assertTrue(flv.get_keyframe_index() is None)
+
+    def test_bad_metadata(self):
+        f = test_common.WarningCounterFilter()
+        logging.getLogger('flvlib.tags').addFilter(f)
+        try:
+            self.check_bad_metadata()
+        finally:
+            logging.getLogger('flvlib.tags').removeFilter(f)
+
+        self.assertEquals(f.warnings, 4)
+
+    def check_bad_metadata(self):
+        # the index points to audio tags, fall back on scanning
+        metadata = self.keyframes([0.0, 0.0], [0.0, 0.4])
+        data, offsets = self.make_flv(metadata)
+        metadata = self.keyframes([float(offsets[2]), float(offsets[10])],
+                                  [0.0, 0.4])
+        data, offsets = self.make_flv(metadata)
+
+        flv = tags.FLV(StringIO(data))
+        self.assertTrue(flv.seek_to_time(500, scan=False) is None)
+        tag = flv.seek_to_time(500)
+        self.assertTrue(isinstance(tag, tags.VideoTag))
+        self.assertEquals(tag.timestamp, 400)
+
+        # the index points outside the file
+        data, offsets = self.make_flv(self.keyframes([99999.0], [0.0]))
+        flv = tags.FLV(StringIO(data))
+        self.assertTrue(flv.seek_to_time(500, scan=False) is None)
+        self.assertEquals(flv.seek_to_time(500).timestamp, 400)
+
+
+class TestReversed(TestUnderStrictParsing, BodyGeneratorMixin):
+
+    def test_iter_tags_reversed(self):
+        s = StringIO(tags.create_flv_header() +
+                     tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x22v', 0) +
+                     tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 40) +
+                     tags.create_flv_tag(constants.TAG_TYPE_SCRIPT_AMF3, '', 80) +
+                     tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa', 120) +
+                     tags.create_script_tag('onMetaData', {'duration': 0}))
+        forward = list(tags.FLV(s).iter_tags())
+        backward = list(tags.FLV(s).iter_tags_reversed())
+
+        self.assertEquals(len(backward), 5)
+        self.assertEquals([(t.offset, t.size, t.timestamp) for t in forward],
+                          [(t.offset, t.size, t.timestamp)
+                           for t in reversed(backward)])
+        self.assertEquals(backward[0].name, 'onMetaData')
+
+        # skips the trailing script tag
+        self.assertEquals(tags.FLV(s).get_last_timestamp(), 120)
+
+    def test_empty(self):
+        s = StringIO(tags.create_flv_header())
+        self.assertEquals(list(tags.FLV(s).iter_tags_reversed()), [])
+        self.assertTrue(tags.FLV(s).get_last_timestamp() is None)
+
+    def test_errors(self):
+        header = 'FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00'
+
+        # PreviousTagSize pointing before the first tag
+        s = StringIO(header + '\x08' + self.tag_body('\x4b')[:-1] + '\x30')
+        self.assertRaises(tags.MalformedFLV, list,
+                          tags.FLV(s).iter_tags_reversed())
+
+        # PreviousTagSize smaller than a tag header
+        s = StringIO(header + '\x08' + self.tag_body('\x4b')[:-1] + '\x05')
+        self.assertRaises(tags.MalformedFLV, list,
+                          tags.FLV(s).iter_tags_reversed())
+
+        # PreviousTagSize not matching the tag it points to
+        s = StringIO(header + '\x08' + self.tag_body('\x4b') +
+                     '\x08' + self.tag_body('\x4b')[:-1] + '\x14')
+        tags.STRICT_PARSING = False
+        self.assertRaises(tags.MalformedFLV, list,
+                          tags.FLV(s).iter_tags_reversed())
+
+
+class TestPayload(TestUnderStrictParsing):
+
+    def setUp(self):
+        TestUnderStrictParsing.setUp(self)
+        self.tags = [tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x17\x00v'),
+                     tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fabc'),
+                     tags.create_script_tag('onCuePoint', {'a': 1.0})]
+        self.data = tags.create_flv_header() + ''.join(self.tags)
+
+    def test_payload(self):
+        flv = tags.FLV(StringIO(self.data))
+        parsed = []
+        for tag in flv.iter_tags():
+            # reading the payload does not disturb iterating
+            parsed.append((tag, tag.payload, tag.raw_bytes))
+        self.assertEquals(len(parsed), 3)
+
+        self.assertEquals(parsed[0][1], '\x17\x00v')
+        self.assertEquals(parsed[1][1], '\x2fabc')
+        self.assertEquals(parsed[2][1], self.tags[2][11:-4])
+        self.assertEquals([raw for tag, payload, raw in parsed], self.tags)
+
+    def test_cache(self):
+        flv = tags.FLV(StringIO(self.data))
+        tag = flv.iter_tags().next()
+        self.assertEquals(tag.get_payload(cache=True), '\x17\x00v')
+        tag.detach()
+        self.assertEquals(tag.payload, '\x17\x00v')
+        self.assertRaises(ValueError, tag.get_raw_bytes)
+
+        flv.read_tags()
+        tag = flv.tags[1]
+        self.assertRaises(ValueError, tag.get_payload)
+
+    def test_truncated(self):
+        flv = tags.FLV(StringIO(self.data))
+        tag = flv.iter_tags().next()
+        flv.f = StringIO(self.data[:tag.offset + 12])
+        self.assertRaises(primitives.EndOfFile, tag.get_payload)
+
+
+class TestMmapFLV(TestUnderStrictParsing, BodyGeneratorMixin):
+
+    def setUp(self):
+        TestUnderStrictParsing.setUp(self)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        TestUnderStrictParsing.tearDown(self)
+        os.remove(self.path)
+
+    def mmap_flv(self, data):
+        f = open(self.path, 'wb')
+        f.write(data)
+        f.close()
+        return tags.MmapFLV(open(self.path, 'rb'))
+
+    def test_iter_tags(self):
+        data = ('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                '\x08' + self.tag_body('\xaf\x01abc') +
+                '\x09' + self.tag_body('\x17\x00') +
+                '\x12' + ('\x00\x00\x07\x00\x26\x5f\x00\x00\x00\x00' +
+                          '\x02\x00\x03\x66\x6f\x6f\x05\x00\x00\x00\x12'))
+        flv = self.mmap_flv(data)
+        parsed = list(flv.iter_tags())
+
+        self.assertEquals(flv.has_audio, True)
+        self.assertEquals(flv.has_video, True)
+        self.assertEquals(len(parsed), 3)
+        self.assertEquals(parsed[0].aac_packet_type,
+                          constants.AAC_PACKET_TYPE_RAW)
+        self.assertEquals(parsed[1].frame_type, constants.FRAME_TYPE_KEYFRAME)
+        self.assertEquals(parsed[2].name, 'foo')
+
+        self.assertEquals(list(flv.scan_tags()),
+                          list(tags.FLV(StringIO(data)).scan_tags()))
+
+        self.assertEquals(str(flv.get_payload(parsed[0])),
+                          '\xaf\x01abc' + '\x00' * 5)
+        self.assertEquals(str(flv.get_payload(parsed[2])),
+                          '\x02\x00\x03foo\x05')
+        tag = parsed[1]
+        self.assertEquals(str(tag.payload), '\x17\x00' + '\x00' * 8)
+        self.assertEquals(str(tag.raw_bytes),
+                          data[tag.offset:tag.offset + 11 + tag.size + 4])
+        flv.close()
+
+    def test_errors(self):
+        self.assertRaises(tags.MalformedFLV, self.mmap_flv, '')
+
+        # truncated tag
+        flv = self.mmap_flv('FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00' +
+                            '\x08' + self.tag_body('\x4b')[:-2])
+        self.assertRaises(primitives.EndOfFile, list, flv.iter_tags())
+        self.assertRaises(primitives.EndOfFile, list, flv.scan_tags())
+        flv.close()
+
+
 class TestCreateTags(TestUnderStrictParsing):
 
     def test_create_flv_tag(self):
@@ -419,6 +904,44 @@ class TestCreateTags(TestUnderStrictParsing):
         self.assertEquals(s, ('\x08\x00\x00\x0e\x00\x04\xd2\x00\x00\x00\x00' +
                               'random-garbage\x00\x00\x00\x19'))
 
+    def test_create_flv_tags(self):
+        tag_list = [(0x08, 'random-garbage', 1234),
+                    (0x09, '', -1),
+                    (0x12, buffer('xxpayload', 2), 0x7f123456)]
+        expected = ''.join([tags.create_flv_tag(*t) for t in tag_list[:2]])
+        expected += tags.create_flv_tag(0x12, 'payload', 0x7f123456)
+
+        s = tags.create_flv_tags(tag_list)
+        self.assertTrue(isinstance(s, bytearray))
+        self.assertEquals(str(s), expected)
+        self.assertEquals(tags.create_flv_tags([]), bytearray())
+        self.assertEquals(str(tags.create_flv_tags(iter(tag_list))), expected)
+        self.assertEquals(str(tags.create_flv_tags((0x08, 'abc', i)
+                                                   for i in range(3))),
+                          ''.join([tags.create_flv_tag(0x08, 'abc', i)
+                                   for i in range(3)]))
+
+        chunks = tags.create_flv_tag_chunks(tag_list)
+        self.assertEquals(len(chunks), 9)
+        self.assertEquals(''.join(map(str, chunks)), expected)
+        self.assertEquals(tags.create_flv_tag(0x09, '', -1),
+                          '\x09\x00\x00\x00\xff\xff\xff\xff\x00\x00\x00'
+                          '\x00\x00\x00\x0b')
+
+    def test_timestamp_range(self):
+        for timestamp in (0x7fffffff, -0x80000000):
+            self.assertEquals(len(tags.create_flv_tag(0x08, 'a', timestamp)),
+                              16)
+        for timestamp in (2 ** 31, 2 ** 32 + 5, -2 ** 31 - 1):
+            self.assertRaises(ValueError, tags.create_flv_tag, 0x08, 'a',
+                              timestamp)
+            self.assertRaises(ValueError, tags.create_flv_tags,
+                              [(0x08, 'a', timestamp)])
+            self.assertRaises(ValueError, tags.create_flv_tag_chunks,
+                              [(0x08, 'a', timestamp)])
+            self.assertRaises(ValueError, tags.create_script_tag,
+                              'onMetaData', {}, timestamp)
+
     def test_create_script_tag(self):
         s = tags.create_script_tag('onMetaData', {'silly': True})
 
@@ -0,0 +1,119 @@
+import logging
+import unittest
+from StringIO import StringIO
+
+import test_common
+
+from flvlib import constants, tags, validation
+from flvlib.astypes import MalformedFLV
+
+
+class Unformattable(object):
+
+    def __str__(self):
+        raise AssertionError("The message got formatted")
+
+    __repr__ = __str__
+
+
+class TestPolicies(unittest.TestCase):
+
+    def setUp(self):
+        # Two tags with a wrong PreviousTagSize and one with a non zero
+        # StreamID
+        bad_size = tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v')
+        bad_size = bad_size[:-1] + '\x07'
+        bad_stream = tags.create_flv_tag(constants.TAG_TYPE_AUDIO, '\x2fa')
+        bad_stream = bad_stream[:10] + '\x01' + bad_stream[11:]
+        self.data = (tags.create_flv_header() + bad_size + bad_size +
+                     bad_stream)
+
+    def read(self, policy):
+        flv = tags.FLV(StringIO(self.data), policy=policy)
+        return list(flv.iter_tags())
+
+    def test_lazy_messages(self):
+        for policy in (validation.IgnorePolicy(), validation.CountPolicy(),
+                       validation.WarnPolicy(), validation.StrictPolicy()):
+            policy.ensure(1, 1, "%s", Unformattable())
+
+    def test_ignore(self):
+        self.assertEquals(len(self.read(validation.IgnorePolicy())), 3)
+
+    def test_count(self):
+        policy = validation.CountPolicy()
+        self.assertEquals(len(self.read(policy)), 3)
+        self.assertEquals(policy.failures, 3)
+        self.assertEquals(sorted(policy.counts.values()), [1, 2])
+        self.assertEquals(policy.counts["StreamID non zero: 0x%06X"], 1)
+
+    def test_warn(self):
+        policy = validation.WarnPolicy()
+        f = test_common.WarningCounterFilter()
+        logging.getLogger('flvlib.validation').addFilter(f)
+        try:
+            self.read(policy)
+            # once for each kind of problem
+            self.assertEquals(f.warnings, 2)
+            policy.report()
+            # and a summary for the one that occurred twice
+            self.assertEquals(f.warnings, 3)
+        finally:
+            logging.getLogger('flvlib.validation').removeFilter(f)
+        self.assertEquals(policy.failures, 3)
+
+    def test_warnings(self):
+        # Two tags with negative timestamps, which are only suspicious
+        negative = tags.create_flv_tag(constants.TAG_TYPE_VIDEO, '\x12v', -40)
+        self.data = tags.create_flv_header() + negative + negative
+        f = test_common.WarningCounterFilter()
+        loggers = [logging.getLogger('flvlib.validation'),
+                   logging.getLogger('flvlib.tags')]
+        for logger in loggers:
+            logger.addFilter(f)
+        try:
+            self.assertEquals(len(self.read(validation.IgnorePolicy())), 2)
+            self.assertEquals(f.warnings, 0)
+
+            policy = validation.CountPolicy()
+            self.read(policy)
+            self.assertEquals(f.warnings, 0)
+            self.assertEquals((policy.failures, policy.warnings), (0, 2))
+
+            policy = validation.WarnPolicy()
+            self.read(policy)
+            self.assertEquals(f.warnings, 1)
+            policy.report()
+            self.assertEquals(f.warnings, 2)
+
+            # not fatal, even when strict
+            self.assertEquals(len(self.read(validation.StrictPolicy())), 2)
+            self.assertEquals(f.warnings, 4)
+        finally:
+            for logger in loggers:
+                logger.removeFilter(f)
+
+        policy = validation.CountPolicy()
+        policy.warn("%s", Unformattable())
+        self.assertEquals(policy.warnings, 1)
+
+    def test_strict(self):
+        try:
+            self.read(validation.StrictPolicy())
+        except MalformedFLV, e:
+            self.assertEquals(e[0] % e[1:],
+                              "PreviousTagSize of 7 (0x00000007) not equal "
+                              "to actual tag size of 13 (0x0000000D)")
+        else:
+            self.fail("MalformedFLV not raised")
+
+    def test_independent(self):
+        # parsers with different policies don't affect each other, nor
+        # do they depend on the global setting
+        old_strict = tags.STRICT_PARSING
+        tags.STRICT_PARSING = True
+        try:
+            self.assertEquals(len(self.read(validation.IgnorePolicy())), 3)
+        finally:
+            tags.STRICT_PARSING = old_strict
+        self.assertRaises(MalformedFLV, self.read, validation.StrictPolicy())